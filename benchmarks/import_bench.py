@@ -0,0 +1,88 @@
+#! /usr/bin/env python
+''' Time the import of a synthetic catalog into SQLite or Postgres. The
+    results are printed and can be written as JSON to track regressions. '''
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from slurpy.benchmark import CatalogGenerator, ImportBenchmark
+from slurpy.profiler import QueryProfiler
+from slurpy.databases.sqlite import SqliteDatabase
+from slurpy.databases.postgres import PgDatabase
+
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(__file__), '..', 'tests',
+                                'files', 'test.lrcat')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Import benchmark')
+    parser.add_argument('--template', default=DEFAULT_TEMPLATE,
+                        help='Catalog whose schema is used')
+    parser.add_argument('--roots', type=int, default=2)
+    parser.add_argument('--folders', type=int, default=20)
+    parser.add_argument('--files', type=int, default=1000,
+                        help='Files, each with one image')
+    parser.add_argument('--develop', type=int, default=1,
+                        help='Develop settings per image')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--target', choices=['sqlite', 'postgres'],
+                        default='sqlite')
+    parser.add_argument('--dbname', default='slurpy')
+    parser.add_argument('--user', default='slurpy')
+    parser.add_argument('--password', default='slurpy')
+    parser.add_argument('--bulk', action='store_true')
+    parser.add_argument('--output', help='File to write JSON results to')
+    parser.add_argument('--profile', type=int, default=0, metavar='N',
+                        help='Print the N statements that took longest')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'bench.lrcat')
+        gen = CatalogGenerator(args.template, args.roots, args.folders,
+                               args.files, args.develop, args.seed)
+        if not gen.generate(fn):
+            print "Unable to generate a catalog from %s" % args.template
+            return 1
+        if args.target == 'sqlite':
+            db = SqliteDatabase()
+            ok = db.connect(dbname = os.path.join(tmpdir, 'target.db'))
+        else:
+            db = PgDatabase()
+            ok = db.connect(dbname = args.dbname, user = args.user,
+                                             password = args.password)
+        if not ok:
+            print "Unable to connect to the %s database" % args.target
+            return 1
+        if args.profile:
+            profiler = QueryProfiler()
+            db.set_tracer(profiler)
+        bench = ImportBenchmark(fn, db, args.bulk)
+        bench.run()
+        db.close()
+        results = bench.results(sizes = gen.sizes, rows = gen.rows)
+        if args.profile:
+            results['statements'] = [st.as_dict() for st in
+                                     profiler.top(args.profile)]
+        for p in results['phases']:
+            print "%-20s %8.2fs%s" % (p['phase'], p['seconds'],
+                                      '' if p['ok'] else '  FAILED')
+        if args.profile:
+            print
+            profiler.report(args.profile)
+        if args.output:
+            with open(args.output, 'w') as fh:
+                json.dump(results, fh, indent = 2)
+        return 0 if bench.ok else 1
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+#! /usr/bin/env python
+''' Compare a normal bulk import of a catalog into an empty database with
+    the initial load, which adds constraints once the data is loaded. '''
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from slurpy.catalog import Catalog
+from slurpy.databases.postgres import PgDatabase
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Initial load benchmark')
+    parser.add_argument('catalog', help='Catalog to import')
+    parser.add_argument('--dbname', default='slurpy')
+    parser.add_argument('--user', default='slurpy')
+    parser.add_argument('--password', default='slurpy')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    c = Catalog(args.catalog)
+    if not c.get_schema_from_catalog():
+        print "Unable to read the schema from %s" % args.catalog
+        return 1
+    db = PgDatabase()
+    if not db.connect(dbname = args.dbname, user = args.user,
+                                           password = args.password):
+        print "Unable to connect to the database"
+        return 1
+
+    start = time.time()
+    if not c.create_database(db, True) or not c.import_all(db, True):
+        print "Import failed"
+        return 1
+    normal = time.time() - start
+
+    start = time.time()
+    if not c.initial_load(db):
+        print "Initial load failed"
+        return 1
+    initial = time.time() - start
+
+    print "%-20s %8.2fs" % ('import_all', normal)
+    print "%-20s %8.2fs" % ('initial_load', initial)
+    print "%-20s %8.2fs (%.0f%%)" % ('saved', normal - initial,
+                                     100.0 * (normal - initial) / normal)
+    db.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
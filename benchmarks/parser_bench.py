@@ -0,0 +1,68 @@
+#! /usr/bin/env python
+''' Compare the speed of the SQL parsers on the statements in a catalog. '''
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from slurpy.schema import PARSERS, get_parser
+
+DEFAULT_CATALOG = os.path.join(os.path.dirname(__file__), '..', 'tests',
+                               'files', 'test.lrcat')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='SQL parser benchmark')
+    parser.add_argument('catalogs', nargs='*', default=[DEFAULT_CATALOG],
+                                    help='Catalogs to read statements from')
+    parser.add_argument('--repeat', type=int, default=5,
+                                    help='Times to parse each statement')
+    return parser.parse_args()
+
+def read_statements(filename):
+    ''' Return the table and index statements from a catalog. '''
+    conn = sqlite3.connect(filename)
+    rows = conn.execute("select type, sql from sqlite_master where sql "
+                        "is not null and type in ('table', 'index')").fetchall()
+    conn.close()
+    return rows
+
+def parse_all(module, stmts):
+    rv = []
+    for kind, sql in stmts:
+        if kind == 'table':
+            rv.append(module.parse_table_statement(sql))
+        else:
+            rv.append(module.parse_index_statement(sql))
+    return rv
+
+def main():
+    args = parse_args()
+    stmts = []
+    for fn in args.catalogs:
+        stmts.extend(read_statements(fn))
+    print "%d statements from %d catalogs" % (len(stmts), len(args.catalogs))
+    print "%-10s %10s %12s" % ('parser', 'import s', 'stmts/s')
+    results = {}
+    for name in sorted(PARSERS.keys()):
+        start = time.time()
+        module = get_parser(name)
+        loaded = time.time() - start
+        start = time.time()
+        for n in xrange(args.repeat):
+            results[name] = parse_all(module, stmts)
+        taken = time.time() - start
+        print "%-10s %10.3f %12d" % (name, loaded,
+                                     len(stmts) * args.repeat / taken)
+    names = sorted(results.keys())
+    diffs = [n for n in xrange(len(stmts))
+             if results[names[0]][n] != results[names[1]][n]]
+    print "%d statements parsed differently" % len(diffs)
+    for n in diffs:
+        print "    %s" % results[names[0]][n].get('identifier')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#! /usr/bin/env python
+''' Compare the serial bulk import of a synthetic catalog with the
+    pipelined one, into SQLite or Postgres. --latency adds a delay to every
+    statement sent to the target, to see the effect of a remote server
+    when only a local one is available. '''
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from slurpy.benchmark import CatalogGenerator
+from slurpy.catalog import Catalog
+from slurpy.profiler import Tracer
+from slurpy.databases.sqlite import SqliteDatabase
+from slurpy.databases.postgres import PgDatabase
+
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(__file__), '..', 'tests',
+                                'files', 'test.lrcat')
+
+class Latency(Tracer):
+    ''' Waits after every statement, as a round trip to a server would. '''
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def trace(self, statement, args, rows, seconds):
+        time.sleep(self.seconds)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Pipeline benchmark')
+    parser.add_argument('--template', default=DEFAULT_TEMPLATE,
+                        help='Catalog whose schema is used')
+    parser.add_argument('--files', type=int, default=10000,
+                        help='Files, each with one image')
+    parser.add_argument('--develop', type=int, default=1,
+                        help='Develop settings per image')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--target', choices=['sqlite', 'postgres'],
+                        default='sqlite')
+    parser.add_argument('--dbname', default='slurpy')
+    parser.add_argument('--user', default='slurpy')
+    parser.add_argument('--password', default='slurpy')
+    parser.add_argument('--latency', type=float, default=0, metavar='MS',
+                        help='Delay added to every statement')
+    parser.add_argument('--output', help='File to write JSON results to')
+    return parser.parse_args()
+
+def connect(args, tmpdir, name):
+    if args.target == 'sqlite':
+        db = SqliteDatabase()
+        ok = db.connect(dbname = os.path.join(tmpdir, name + '.db'))
+    else:
+        db = PgDatabase()
+        ok = db.connect(dbname = args.dbname, user = args.user,
+                                         password = args.password)
+    if not ok:
+        return None
+    if args.latency:
+        db.set_tracer(Latency(args.latency / 1000.0))
+    return db
+
+def run(c, db, pipeline):
+    ''' Import into an empty database, returning the ImportMetrics. '''
+    if not c.create_database(db, True):
+        return None
+    return c.run_import(db, bulk = True, pipeline = pipeline)
+
+def main():
+    args = parse_args()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'bench.lrcat')
+        gen = CatalogGenerator(args.template, files = args.files,
+                               develop = args.develop, seed = args.seed)
+        if not gen.generate(fn):
+            print "Unable to generate a catalog from %s" % args.template
+            return 1
+        c = Catalog(fn, readonly = True)
+        if not c.get_schema_from_catalog():
+            print "Unable to read the schema"
+            return 1
+        results = []
+        for name, pipeline in [('serial', False), ('pipeline', True)]:
+            db = connect(args, tmpdir, name)
+            if db is None:
+                print "Unable to connect to the %s database" % args.target
+                return 1
+            metrics = run(c, db, pipeline)
+            db.close()
+            if metrics is None or not metrics.ok:
+                print "%s import failed" % name
+                return 1
+            totals = metrics.totals()
+            results.append({'mode': name, 'seconds': metrics.elapsed,
+                            'totals': totals.as_dict()})
+            print "%-10s %8.2fs %8.0f rows/s  read %.2fs translate %.2fs " \
+                  "write %.2fs" % (name, metrics.elapsed, totals.rows_read /
+                                   max(metrics.elapsed, 0.001), totals.read,
+                                   totals.translate, totals.write)
+        c.close()
+        print "%-10s %8.2fx" % ('speedup', results[0]['seconds'] /
+                                max(results[1]['seconds'], 0.001))
+        if args.output:
+            with open(args.output, 'w') as fh:
+                json.dump({'files': args.files, 'target': args.target,
+                           'latency': args.latency, 'rows': gen.rows,
+                           'results': results}, fh, indent = 2)
+        return 0
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    sys.exit(main())
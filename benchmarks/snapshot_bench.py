@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+''' Time writing a synthetic catalog to a snapshot and restoring it, as a
+    baseline for the server import (see import_bench.py). '''
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from slurpy.benchmark import CatalogGenerator
+from slurpy.catalog import Catalog
+from slurpy.snapshot import SnapshotWriter, SnapshotReader
+
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(__file__), '..', 'tests',
+                                'files', 'test.lrcat')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Snapshot benchmark')
+    parser.add_argument('--template', default=DEFAULT_TEMPLATE,
+                        help='Catalog whose schema is used')
+    parser.add_argument('--files', type=int, default=10000,
+                        help='Files, each with one image')
+    parser.add_argument('--develop', type=int, default=1,
+                        help='Develop settings per image')
+    parser.add_argument('--chunk-rows', type=int, default=None)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'bench.lrcat')
+        gen = CatalogGenerator(args.template, files = args.files,
+                               develop = args.develop)
+        if not gen.generate(fn):
+            print "Unable to generate a catalog from %s" % args.template
+            return 1
+        c = Catalog(fn)
+        if not c.get_schema_from_catalog():
+            print "Unable to read the schema"
+            return 1
+        snap = os.path.join(tmpdir, 'snap')
+        start = time.time()
+        manifest = SnapshotWriter(c, args.chunk_rows).write(snap)
+        export = time.time() - start
+        c.close()
+        if manifest is None:
+            print "Export failed"
+            return 1
+        start = time.time()
+        if not SnapshotReader(snap).restore(os.path.join(tmpdir,
+                                                         'restored.lrcat')):
+            print "Restore failed"
+            return 1
+        restore = time.time() - start
+        rows = sum([t['rows'] for t in manifest['tables']])
+        size = sum([t['bytes'] for t in manifest['tables']])
+        print "%-20s %10d" % ('rows', rows)
+        print "%-20s %10d bytes" % ('catalog', os.path.getsize(fn))
+        print "%-20s %10d bytes" % ('snapshot', size)
+        for name, elapsed in [('export', export), ('restore', restore)]:
+            print "%-20s %10.2fs %8.0f rows/s" % (name, elapsed,
+                                                 rows / max(elapsed, 0.001))
+        return 0
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+''' Compare memory use and speed of the IdTranslator backends. '''
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from slurpy.translator import IdTranslator
+
+TABLES = ['Adobe_images', 'AgLibraryFile', 'Adobe_imageDevelopSettings']
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='IdTranslator benchmark')
+    parser.add_argument('--rows', type=int, default=1000000,
+                                            help='Mappings per table')
+    parser.add_argument('--sparse', action='store_const', const=True,
+                        default=False, help='Use non-contiguous ids')
+    return parser.parse_args()
+
+def translator_size(ids):
+    ''' Approximate the memory used by the translators. '''
+    total = 0
+    for t in ids._translators.values():
+        if hasattr(t, 'keys') and isinstance(t.keys, dict):
+            total += sys.getsizeof(t.keys)
+            for k, v in t.keys.iteritems():
+                total += sys.getsizeof(k) + sys.getsizeof(v)
+        else:
+            for a in [t.ids, t.vals]:
+                total += sys.getsizeof(a) + a.buffer_info()[1] * a.itemsize
+            total += sys.getsizeof(t.extra)
+    return total
+
+def run(compact, keys):
+    ids = IdTranslator(compact = compact)
+    start = time.time()
+    for tbl in TABLES:
+        for k in keys:
+            ids.set_value(tbl, k, k + 1000)
+    filled = time.time() - start
+    start = time.time()
+    for tbl in TABLES:
+        for k in keys:
+            ids.get_value(tbl, k)
+    looked = time.time() - start
+    return filled, looked, translator_size(ids)
+
+def main():
+    args = parse_args()
+    keys = range(1, args.rows + 1)
+    if args.sparse:
+        keys = sorted(random.sample(xrange(1, args.rows * 10), args.rows))
+    total = args.rows * len(TABLES)
+    print "%d mappings over %d tables (%s ids)" % (total, len(TABLES),
+                                 'sparse' if args.sparse else 'contiguous')
+    print "%-10s %12s %12s %12s" % ('backend', 'set/s', 'get/s', 'MB')
+    for name, compact in [('dict', False), ('compact', True)]:
+        filled, looked, size = run(compact, keys)
+        print "%-10s %12d %12d %12.1f" % (name, total / filled,
+                                  total / looked, size / (1024.0 * 1024.0))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+#! /usr/bin/env python
+
+from slurpy.ingest import command_line
+
+if __name__ == '__main__':
+    command_line()
@@ -0,0 +1,6 @@
+#! /usr/bin/env python
+
+from slurpy.snapshot import command_line
+
+if __name__ == '__main__':
+    command_line()
@@ -27,6 +27,8 @@ setup(
     entry_points="""
     [console_scripts]
     slurpy = slurpy.lrCatalog:main
+    slurpy-ingest = slurpy.ingest:command_line
+    slurpy-snapshot = slurpy.snapshot:command_line
     """,
     test_suite='tests'
 )
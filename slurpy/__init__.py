@@ -31,6 +31,14 @@ class SlurpSession(object):
             return False
         return True
 
+    def load_ids(self, db):
+        ''' Load translations saved by earlier imports of the catalog. '''
+        return self.ids.load(db, str(self.hostid), str(self.catalogid))
+
+    def save_ids(self, db):
+        ''' Save translations so later imports can reuse them. '''
+        return self.ids.save(db, str(self.hostid), str(self.catalogid))
+
     def set_value(self, table, a, b):
         self.ids.set_value(table, a, b)
 
@@ -44,6 +52,7 @@ class Slurpy(object):
     ''' The Slurpy class. '''
     def __init__(self):
         self._db = PgDatabase()
+        self._pool = None
         self.config = {}
         self.session = None
 
@@ -72,8 +81,21 @@ class Slurpy(object):
 
     def close(self):
         ''' Close the database connection. '''
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
         return self._db.close()
 
+    def pool(self, size = 4, **kwargs):
+        ''' Return the pool of database connections shared by workers,
+            creating it on first use from the supplied arguments or the
+            database config. '''
+        if self._pool is None:
+            from slurpy.databases.pool import PgPool
+            self._pool = PgPool(size, **(kwargs or
+                                          self.config.get('database', {})))
+        return self._pool
+
     def session_start(self):
         self.session = SlurpSession()
         
@@ -85,7 +107,7 @@ class Slurpy(object):
             if not self._db.execute(s):
                 self._db.rollback()
                 return False
-            self._db.commit()
+        self._db.commit()
         return True
     
     def check_schema(self, catalog = None, drop = False):
@@ -109,6 +131,7 @@ class Slurpy(object):
         
         # todo - handle delete case...
         self.session.setup_catalog(self._db, catalog)
+        self.session.load_ids(self._db)
 
         # Root folders are the basic places where pictures are stored. They
         # are unique across all catalogs, so we start by importing them
@@ -118,7 +141,8 @@ class Slurpy(object):
         
         for t in self.schema.tables[4:]:
             self.import_table(catalog, t)
-                        
+
+        self.session.save_ids(self._db)
         return False
                     
     def get_root_folders(self, catalog):
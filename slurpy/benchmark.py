@@ -0,0 +1,217 @@
+''' Synthetic catalogs and timings used to benchmark imports. '''
+
+import os
+import sys
+import time
+import uuid
+import random
+import platform
+
+from slurpy.catalog import Catalog
+from slurpy.databases.sqlite import SqliteDatabase
+
+class CatalogGenerator(object):
+    ''' Creates a catalog of a chosen size using the schema of a template
+        catalog. Root folders, folders, files, images and develop settings
+        are filled with made up but plausible rows; every other table is
+        left empty. Ids are unique across all tables, as in Lightroom, and
+        the same seed always produces the same catalog. '''
+
+    BATCH_ROWS = 10000
+
+    def __init__(self, template, roots = 2, folders = 20, files = 1000,
+                                                 develop = 1, seed = 0):
+        self.template = template
+        self.roots = max(roots, 1)
+        self.folders = max(folders, self.roots)
+        self.files = files
+        self.develop = develop
+        self._random = random.Random(seed)
+        self._next_id = 0
+        self.rows = {}
+
+    @property
+    def sizes(self):
+        return {'roots': self.roots, 'folders': self.folders,
+                'files': self.files, 'images': self.files,
+                'develop': self.files * self.develop}
+
+    def _id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def _uuid(self):
+        return str(uuid.UUID(int = self._random.getrandbits(128),
+                                                   version = 4)).upper()
+
+    def _root_rows(self):
+        for n in xrange(self.roots):
+            yield [self._id(), self._uuid(), '/bench/root%d/' % n,
+                   'root%d' % n, '../root%d/' % n]
+
+    def _folder_rows(self, roots):
+        for n in xrange(self.folders):
+            yield [self._id(), self._uuid(), 'folder%d/' % n,
+                   roots[n % len(roots)]]
+
+    def _file_rows(self, folders):
+        for n in xrange(self.files):
+            name = 'IMG_%06d' % n
+            yield [self._id(), self._uuid(), name, 'CR2',
+                   folders[n % len(folders)], name + '.CR2',
+                   name.lower() + '.cr2', 'cr2', name + '.CR2',
+                   '%032x' % self._random.getrandbits(128)]
+
+    def _image_rows(self, files):
+        for n in xrange(len(files)):
+            yield [self._id(), self._uuid(),
+                   '2010-01-%02dT%02d:%02d:%02d' % (n / 86400 % 28 + 1,
+                                   n / 3600 % 24, n / 60 % 60, n % 60),
+                   'RAW', 3456, 5184, 'AB', self._random.randint(0, 5),
+                   files[n], 1.5]
+
+    def _develop_rows(self, images):
+        for image in images:
+            for n in xrange(self.develop):
+                exposure = self._random.uniform(-2, 2)
+                yield [self._id(), image, 3456, 5184, 3456, 5184,
+                       '%032x' % self._random.getrandbits(128),
+                       's = { Exposure2012 = %.2f, }\n' % exposure,
+                       self._uuid(), 1]
+
+    # (table, columns, row generator, table whose ids it needs)
+    TABLES = [
+        ('AgLibraryRootFolder', ['id_local', 'id_global', 'absolutePath',
+                   'name', 'relativePathFromCatalog'], '_root_rows', None),
+        ('AgLibraryFolder', ['id_local', 'id_global', 'pathFromRoot',
+                   'rootFolder'], '_folder_rows', 'AgLibraryRootFolder'),
+        ('AgLibraryFile', ['id_local', 'id_global', 'baseName', 'extension',
+                   'folder', 'idx_filename', 'lc_idx_filename',
+                   'lc_idx_filenameExtension', 'originalFilename', 'md5'],
+                                           '_file_rows', 'AgLibraryFolder'),
+        ('Adobe_images', ['id_local', 'id_global', 'captureTime',
+                   'fileFormat', 'fileHeight', 'fileWidth', 'orientation',
+                   'rating', 'rootFile', 'aspectRatioCache'],
+                                            '_image_rows', 'AgLibraryFile'),
+        ('Adobe_imageDevelopSettings', ['id_local', 'image', 'fileHeight',
+                   'fileWidth', 'croppedHeight', 'croppedWidth', 'digest',
+                   'text', 'settingsID', 'hasDevelopAdjustments'],
+                                          '_develop_rows', 'Adobe_images'),
+    ]
+
+    def _fill(self, db, name, cols, rows):
+        ids = []
+        batch = []
+        for r in rows:
+            ids.append(r[0])
+            batch.append(r)
+            if len(batch) >= self.BATCH_ROWS:
+                if db.insert_rows(name, cols, batch, None) is None:
+                    return None
+                batch = []
+        if batch and db.insert_rows(name, cols, batch, None) is None:
+            return None
+        self.rows[name] = len(ids)
+        return ids
+
+    def generate(self, filename):
+        ''' Write the catalog to filename, which must not exist. Returns
+            True or False. '''
+        if os.path.exists(filename):
+            return False
+        template = Catalog(self.template)
+        db = SqliteDatabase()
+        if not db.connect(dbname = filename):
+            template.close()
+            return False
+        ok = self._generate(db, template)
+        db.close()
+        template.close()
+        if not ok:
+            os.remove(filename)
+        return ok
+
+    def _generate(self, db, template):
+        for pragma in ['synchronous=OFF', 'journal_mode=OFF']:
+            db.execute("PRAGMA %s" % pragma)
+        for sql in template.schema_statements('table'):
+            if not db.execute(sql):
+                return False
+        db.start_transaction()
+        ids = {}
+        for name, cols, method, parent in self.TABLES:
+            args = [ids[parent]] if parent else []
+            ids[name] = self._fill(db, name, cols,
+                                   getattr(self, method)(*args))
+            if ids[name] is None:
+                db.rollback()
+                return False
+        db.commit()
+        for kind in ['index', 'trigger']:
+            for sql in template.schema_statements(kind):
+                if not db.execute(sql):
+                    return False
+        if not db.execute("ATTACH DATABASE ? AS template",
+                                          [os.path.abspath(self.template)]):
+            return False
+        for name in ['Adobe_variablesTable', 'Adobe_variables']:
+            db.execute("insert into main.%s select * from template.%s" %
+                                                                (name, name))
+        db.execute("DETACH DATABASE template")
+        db.execute("update Adobe_variablesTable set value=? where name=?",
+                          [float(self._next_id), 'Adobe_entityIDCounter'])
+        for pragma in ['synchronous=FULL', 'journal_mode=DELETE']:
+            db.execute("PRAGMA %s" % pragma)
+        return True
+
+class ImportBenchmark(object):
+    ''' Times the phases of importing a catalog: reading the schema,
+        creating the database, the first import and a re-import of the
+        unchanged catalog. Translations are kept in store, by default db,
+        so the re-import finds rows by id as a real one would. '''
+
+    def __init__(self, filename, db, bulk = False, cache_dir = None,
+                                                          store = None):
+        self.filename = filename
+        self.db = db
+        self.store = db if store is None else store
+        self.bulk = bulk
+        self.cache_dir = cache_dir
+        self.phases = []
+        self.ok = True
+
+    def _time(self, name, func, *args):
+        start = time.time()
+        ok = bool(func(*args))
+        self.phases.append({'phase': name, 'seconds': time.time() - start,
+                            'ok': ok})
+        self.ok = self.ok and ok
+        return ok
+
+    def run(self):
+        ''' Run every phase, stopping at the first that fails. Returns
+            True if all succeeded. '''
+        c = Catalog()
+        for name, func, args in [
+                ('open', c.open, [self.filename]),
+                ('parse', c.get_schema_from_catalog, [self.cache_dir]),
+                ('create_database', c.create_database, [self.db, True,
+                                                   False, self.store]),
+                ('import_all', c.import_all, [self.db, self.bulk,
+                                              self.store]),
+                ('reimport', c.import_all, [self.db, self.bulk,
+                                            self.store])]:
+            if not self._time(name, func, *args):
+                break
+        c.close()
+        return self.ok
+
+    def results(self, **extra):
+        ''' Results as a dict, ready to be written as JSON. '''
+        rv = {'catalog': os.path.basename(self.filename),
+              'target': self.db.__class__.__name__,
+              'bulk': self.bulk, 'ok': self.ok, 'phases': self.phases,
+              'python': sys.version.split()[0],
+              'host': platform.node(), 'time': time.time()}
+        rv.update(extra)
+        return rv
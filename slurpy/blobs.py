@@ -0,0 +1,116 @@
+''' Large values stored once on the server and referenced by digest. '''
+
+import re
+import hashlib
+
+_DIGEST = re.compile('^[0-9a-f]{40}$')
+
+def blob_digest(value):
+    ''' Return the sha1 hex digest a value is stored under. '''
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    elif not isinstance(value, str):
+        value = str(value)
+    return hashlib.sha1(value).hexdigest()
+
+def is_digest(value):
+    return isinstance(value, basestring) and _DIGEST.match(value) is not None
+
+def blob_key(value):
+    ''' The digest of a value, or the value itself if it is already a
+        digest, so stored and unstored values can be compared. '''
+    if value is None or is_digest(value):
+        return value
+    return blob_digest(value)
+
+class BlobStore(object):
+    ''' Keeps each distinct value of the blob fields (such as develop
+        settings) once, in a table keyed by its digest. Rows hold the
+        digest in place of the value. Digests known to be stored are
+        remembered, so a value repeated across rows or catalogs is only
+        looked for once and only written once. Those written inside a
+        transaction are only relied on until it ends, as it may be rolled
+        back; if it was committed, they are found on the server when next
+        looked for. Values read back that are not digests, as written
+        before blobs were used, are returned unchanged. '''
+
+    STORE_TABLE = 'slurpy_blob'
+    STORE_COLUMNS = ['digest', 'size', 'data']
+    STORE_ROWS = 1000
+
+    def __init__(self):
+        self._known = set()
+        self._pending = set()
+        self._transaction = None
+        self.stored = 0
+        self.reused = 0
+
+    def create_store(self, db):
+        ''' Create the table used to store blobs, if needed. '''
+        return db.execute("CREATE TABLE IF NOT EXISTS %s (digest TEXT "
+                          "PRIMARY KEY, size INTEGER NOT NULL, data TEXT "
+                          "NOT NULL)" % self.STORE_TABLE)
+
+    def drop_store(self, db):
+        ''' Remove all stored blobs. '''
+        return db.execute("DROP TABLE IF EXISTS %s" % self.STORE_TABLE)
+
+    def _select(self, db, cols, digests):
+        rv = []
+        for n in xrange(0, len(digests), self.STORE_ROWS):
+            chunk = digests[n:n + self.STORE_ROWS]
+            rv.extend(db.query("select %s from %s where digest in (%s)" % (
+                               cols, self.STORE_TABLE,
+                               ','.join(['?' for d in chunk])), chunk))
+        return rv
+
+    def _pending_for(self, db):
+        ''' The digests written in the current transaction of db. '''
+        txn = (id(db), db.transactions) if db.in_transaction else None
+        if txn != self._transaction:
+            self._transaction = txn
+            self._pending = set()
+        return self._pending
+
+    def put_many(self, db, values):
+        ''' Store values, returning their digests in the same order, or
+            None on failure. None values are left as None. Other imports
+            writing blobs wait until this transaction is committed. '''
+        digests = [None if v is None else blob_digest(v) for v in values]
+        pending = self._pending_for(db)
+        new = {}
+        for v, d in zip(values, digests):
+            if d is None:
+                continue
+            if d in self._known or d in pending or new.has_key(d):
+                self.reused += 1
+                continue
+            new[d] = v
+        if not new:
+            return digests
+        if not db.lock_table(self.STORE_TABLE):
+            return None
+        present = set([r[0] for r in self._select(db, 'digest', new.keys())])
+        rows = [[d, len(v), v] for d, v in new.items() if not d in present]
+        for n in xrange(0, len(rows), self.STORE_ROWS):
+            if db.insert_rows(self.STORE_TABLE, self.STORE_COLUMNS,
+                              rows[n:n + self.STORE_ROWS], None) is None:
+                return None
+        self.reused += len(present)
+        self.stored += len(rows)
+        self._known.update(present)
+        if db.in_transaction:
+            pending.update([r[0] for r in rows])
+        else:
+            self._known.update([r[0] for r in rows])
+        return digests
+
+    def get_many(self, db, digests):
+        ''' Return a dict of the stored values for digests. '''
+        digests = list(set([d for d in digests if is_digest(d)]))
+        return dict(self._select(db, 'digest, data', digests))
+
+    def expand(self, db, values):
+        ''' Return values with the digests replaced by what they stand for. '''
+        found = self.get_many(db, values)
+        return [found.get(v, v) if v is not None else None for v in values]
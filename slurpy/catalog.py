@@ -1,7 +1,23 @@
 ''' The Catalog class represents a Lightroom Catalog. '''
 
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+from os.path import abspath
+from platform import node
+
+from slurpy.blobs import BlobStore
+from slurpy.codec import check_codec, CodecStore
+from slurpy.metrics import ImportMetrics
+from slurpy.pipeline import ImportPipeline
+from slurpy.checkpoint import Checkpoint
+from slurpy.verify import CatalogVerifier
 from slurpy.translator import IdTranslator
-from slurpy.database import table_from_string
+from slurpy.fingerprint import Fingerprints
+from slurpy.schema.table import DatabaseTable
 from slurpy.databases.sqlite import SqliteDatabase
 from slurpy.databases.postgres import PgDatabase
 
@@ -12,45 +28,124 @@ class Catalog(object):
     EXCLUDE_TABLES = ['Adobe_namedIdentityPlate','Adobe_variables',
                       'Adobe_variablesTable']
 
-    def __init__(self, filename = ''):
+    # Tables whose rows are shared by the catalogs of a host, so only one
+    # import at a time may write to them.
+    SHARED_TABLES = ['AgLibraryRootFolder']
+    # Tables whose unique keys link to the rows of SHARED_TABLES, so two
+    # catalogs sharing a root folder can hold the same rows in them. They
+    # are locked the same way, but need no host key.
+    LOCKED_TABLES = SHARED_TABLES + ['AgLibraryFolder', 'AgLibraryFile']
+
+    # Fields with large values that repeat across images and catalogs.
+    # Each distinct value is kept once on the server, in a BlobStore.
+    BLOB_FIELDS = {'Adobe_imageDevelopSettings': ['text'],
+                   'Adobe_imageDevelopBeforeSettings': ['text']}
+
+    # Verbose text fields worth compressing, see compress_fields.
+    COMPRESSIBLE_FIELDS = {'AgLibraryIPTC': ['caption', 'copyright'],
+                           'Adobe_imageProperties': ['propertiesString']}
+
+    def __init__(self, filename = '', readonly = False, snapshot = False):
         self.filename = ''
+        self.hostname = node()
         self.version = '' # version string for catalog
         self.entity_counter = 0.0
         self.tables = []
         self.ordered_table_list = None
         self._catalog = SqliteDatabase()
+        self._source = None
+        self._snapshot_dir = None
         if filename:
-            self.open(filename)
+            self.open(filename, readonly, snapshot)
 
     @property
     def is_connected(self): return self._catalog.connected
 
-    def open(self, filename):
+    def open(self, filename, readonly = False, snapshot = False):
         ''' Open a catalog. If the filename supplied does ont exist,
-            a new catalog will be created. '''
+            a new catalog will be created. With readonly the catalog is
+            only read, using a large cache and a memory map, which is all
+            an import needs. With snapshot it is first copied to a
+            temporary file, removed by close, and that copy is read, so
+            Lightroom can keep using the catalog while it is imported.
+            filename is still used to identify the catalog. '''
         from os.path import exists
         _setup_rqd = False if exists(filename) else False
-        if self._catalog.connect(dbname = filename):
+        self._source = {'dbname': filename}
+        if readonly or snapshot:
+            self._source['readonly'] = True
+        if snapshot:
+            copy = self._snapshot(filename)
+            if copy is None:
+                return False
+            # Nothing else writes to the copy, so SQLite needn't lock it.
+            self._source.update({'dbname': copy, 'immutable': True})
+        if self._catalog.connect(**self._source):
             self.filename = filename
             if not _setup_rqd:
                 self._get_catalog_version()
                 self._get_entity_counter()
             return True
+        self._remove_snapshot()
         return False
 
+    def _snapshot(self, filename):
+        ''' Copy a catalog to a temporary directory, returning the name of
+            the copy or None. '''
+        src = SqliteDatabase()
+        if not src.connect(dbname = filename, readonly = True):
+            return None
+        self._snapshot_dir = tempfile.mkdtemp(prefix = 'slurpy')
+        copy = os.path.join(self._snapshot_dir, os.path.basename(filename))
+        ok = src.snapshot(copy)
+        src.close()
+        if not ok:
+            self._remove_snapshot()
+            return None
+        return copy
+
+    def _remove_snapshot(self):
+        if self._snapshot_dir is not None:
+            shutil.rmtree(self._snapshot_dir, True)
+            self._snapshot_dir = None
+
+    def open_source(self):
+        ''' Return a new connection to the catalog, opened the same way
+            as this one, or None. '''
+        if self._source is None:
+            return None
+        db = SqliteDatabase()
+        if not db.connect(**self._source):
+            return None
+        return db
+
     def close(self):
         ''' Close a catalog. '''
         self._catalog.close()
+        self._remove_snapshot()
 
-    def get_schema_from_catalog(self):
-        ''' Read the database schema from a Catalog. '''
-        from slurpy.parser import parse_index_statement
+    def get_schema_from_catalog(self, cache_dir = None):
+        ''' Read the database schema from a Catalog. If cache_dir is given,
+            the parsed schema is saved there, keyed by the catalog version
+            and a hash of the schema SQL. Later calls for the same schema
+            load it from the cache without parsing anything. '''
         if not self.is_connected:
             return False
-        sql = "select name, sql from sqlite_master order by name"
-        rv = self._catalog.query(sql)
+        rv = self._schema_rows()
+        cache_fn = None
+        if cache_dir:
+            cache_fn = self._schema_cache_file(cache_dir, rv)
+            if self._load_schema_cache(cache_fn):
+                self._mark_blob_fields()
+                self._mark_shared_tables()
+                self._get_ordered_table_list()
+                return True
+        # The parsers are only imported when needed, as pyparsing is slow
+        # to load.
+        from slurpy.database import table_from_string
+        from slurpy.schema import get_parser
+        parse_index_statement = get_parser().parse_index_statement
         for r in rv:
-            if 'sqlite' in r[0]: continue
             _tbl = table_from_string(r[1])
             if _tbl:
                 self.tables.append(_tbl)
@@ -60,26 +155,173 @@ class Catalog(object):
                 _tbl = self.get_table(_idx['tablename'])
                 if _tbl:
                     _tbl.add_index(_idx)            
+        self._mark_blob_fields()
+        self._mark_shared_tables()
         self._get_ordered_table_list()
+        if cache_fn:
+            self._save_schema_cache(cache_fn)
+        return True
+
+    def _schema_rows(self):
+        sql = "select name, sql from sqlite_master order by name"
+        return [r for r in self._catalog.query(sql) if not 'sqlite' in r[0]]
+
+    def _schema_cache_file(self, cache_dir, rows = None):
+        ''' The file in cache_dir used for the schema of this catalog. '''
+        if rows is None:
+            rows = self._schema_rows()
+        return os.path.join(cache_dir, 'schema-%s-%s.json' % (self.version,
+                                                    self._schema_hash(rows)))
+
+    def _schema_hash(self, rows):
+        h = hashlib.sha1()
+        for name, sql in rows:
+            h.update(name.encode('utf-8') + '\x00' +
+                                     (sql or '').encode('utf-8') + '\x00')
+        return h.hexdigest()
+
+    def _load_schema_cache(self, filename):
+        if not os.path.exists(filename):
+            return False
+        try:
+            with open(filename) as fh:
+                data = json.load(fh)
+        except (IOError, ValueError):
+            return False
+        tables = []
+        for dd in data:
+            _tbl = DatabaseTable()
+            if not _tbl.from_schema_dict(dd):
+                return False
+            tables.append(_tbl)
+        self.tables = tables
         return True
 
+    def _save_schema_cache(self, filename):
+        ''' Write the cache to a temporary file and rename it, so a reader
+            never sees a partial file. '''
+        tmpfn = '%s.%d' % (filename, os.getpid())
+        try:
+            with open(tmpfn, 'w') as fh:
+                json.dump([t.as_schema_dict() for t in self.tables], fh)
+            os.rename(tmpfn, filename)
+        except (IOError, OSError):
+            return False
+        return True
+
+    def schema_statements(self, kind = 'table'):
+        ''' Return the SQL used by the catalog to create its tables, indexes
+            or triggers, in the order they were created. Tables SQLite
+            creates itself, such as sqlite_sequence, are left out as it
+            refuses to create them. '''
+        return [r[0] for r in self._catalog.query("select sql from "
+                  "sqlite_master where type=? and sql is not null and name "
+                  "not like 'sqlite_%' order by rowid", [kind])]
+
     def get_table(self, tblname):
         for t in self.tables:
             if t.name == tblname:
                 return t
         return None
 
-    def create_database(self, db, drop = False):
-        ''' Create the entire database in the provided database. '''
+    def _mark_blob_fields(self):
+        for name, flds in self.BLOB_FIELDS.items():
+            _tbl = self.get_table(name)
+            if _tbl is None:
+                continue
+            for f in flds:
+                if _tbl.has_field(f):
+                    _tbl.get_field(f).blob = True
+
+    def _mark_shared_tables(self):
+        ''' Rows of SHARED_TABLES are matched between catalogs of the same
+            host, such as root folders on their absolutePath. '''
+        for name in self.SHARED_TABLES:
+            _tbl = self.get_table(name)
+            if _tbl is not None:
+                _tbl.add_host_key(self.hostname)
+
+    def compress_fields(self, codec = 'zlib', fields = None):
+        ''' Store fields compressed with codec on the server. fields is a
+            dict of table name -> field names, by default
+            COMPRESSIBLE_FIELDS. Blob fields are left alone. This changes
+            the column types, so must be done before the database is
+            created. Returns the number of fields set. '''
+        check_codec(codec)
+        n = 0
+        for name, flds in (fields or self.COMPRESSIBLE_FIELDS).items():
+            _tbl = self.get_table(name)
+            if _tbl is None:
+                continue
+            for f in flds:
+                fld = _tbl.get_field(f)
+                if fld and not fld.blob:
+                    fld.codec = codec
+                    n += 1
+        return n
+
+    @property
+    def has_blobs(self):
+        return any([t.blob_fields for t in self.tables])
+
+    def create_database(self, db, drop = False, deferred = False,
+                                                          store = None):
+        ''' Create the entire database in the provided database. Dropping
+            the tables also removes the blobs stored in it, and the
+            translations, fingerprints and checkpoints in store (by default
+            db), as they refer to rows that no longer exist. If deferred is
+            True, unique and foreign key constraints are not created (see
+            add_constraints). The codec of each column is recorded in db
+            when its table is first created. Fails if tables that already
+            exist were created with other codecs (see check_codecs). '''
+        if drop:
+            for state in [IdTranslator(), Fingerprints(), Checkpoint()]:
+                state.drop_store(store or db)
+            BlobStore().drop_store(db)
+            CodecStore().drop_store(db)
+        if self.has_blobs and not BlobStore().create_store(db):
+            return False
+        codecs = CodecStore()
+        codecs.load(db)
         ok = []
         for o in self.ordered_table_list:
             _tbl = self.get_table(o)
-            if not db.create(_tbl, drop):
+            if not db.create(_tbl, drop, deferred):
                 # rollback...
                 for oo in ok:
                     db.drop(self.get_table(oo))
                 return False
             ok.append(o)
+        if not codecs.save_tables(db, [self.get_table(o) for o in ok
+                                                if not codecs.has_table(o)]):
+            return False
+        return self.check_codecs(db, codecs)
+
+    def check_codecs(self, db, codecs = None):
+        ''' Returns True if the fields set to be compressed, and their
+            codecs, match the columns of the tables on db. Importing with
+            other settings would write values the columns aren't meant to
+            hold, or that couldn't be read back. '''
+        if codecs is None:
+            codecs = CodecStore()
+            codecs.load(db)
+        ok = True
+        for o in self.ordered_table_list:
+            flds = codecs.mismatches(self.get_table(o))
+            if flds:
+                print "%s: %s were created with a different codec" % (o,
+                                                             ', '.join(flds))
+                ok = False
+        return ok
+
+    def add_constraints(self, db):
+        ''' Add the constraints left out by create_database when deferred.
+            All unique constraints are needed before the foreign keys that
+            refer to them. '''
+        for foreign in [False, True]:
+            for o in self.ordered_table_list:
+                if not db.add_constraints(self.get_table(o), foreign):
+                    return False
         return True
 
     def drop_database(self, db):
@@ -89,18 +331,218 @@ class Catalog(object):
                 return False
         return True
 
-    def import_all(self, db):
-        ''' Import data into the supplied database. '''
+    @property
+    def translator_key(self):
+        ''' The (host, catalog) pair used to store translations. '''
+        return self.hostname, abspath(self.filename)
+
+    def import_all(self, db, bulk = False, store = None,
+                           differential = False, checkpoint = False,
+                                                        pipeline = False):
+        ''' Import data into the supplied database. If bulk is True, new
+            rows are sent to the database in batches. If store is supplied,
+            id translations from earlier imports of this catalog are loaded
+            from it and saved back once the import has finished. The store
+            may be the database being imported into or a separate one.
+            A differential import also keeps a fingerprint of every row in
+            the store and only moves rows that have changed. The import is
+            committed as set by the commit policy of db, by default as a
+            single transaction. Writes to LOCKED_TABLES are locked against
+            other imports until they are committed.
+
+            Unless the commit policy is a single transaction, what is
+            kept in the store is saved every time the policy commits. If
+            checkpoint is True, that includes the progress made through
+            each table, and an earlier import that did not finish is
+            resumed from its last commit. For the checkpoint to
+            match the rows committed, the store should be db.
+
+            With pipeline, tables are moved by an ImportPipeline, which
+            reads and translates rows while earlier ones are written, in
+            batches as bulk does. '''
+        return self.run_import(db, bulk, store, differential, checkpoint,
+                                                               pipeline).ok
+
+    def run_import(self, db, bulk = False, store = None,
+                           differential = False, checkpoint = False,
+                                                        pipeline = False):
+        ''' As import_all, but returns an ImportMetrics object with the
+            counts and timings of each table. Its ok attribute is True if
+            the import succeeded. Nothing is imported if the codecs don't
+            match the tables on db (see check_codecs). '''
+        if differential and store is None:
+            raise ValueError('A store is required for differential imports')
+        if checkpoint and store is None:
+            raise ValueError('A store is required for checkpointed imports')
+        metrics = ImportMetrics()
+        if not self.check_codecs(db):
+            return metrics.finish(False)
+        ids = IdTranslator()
+        prints = None
+        cp = None
+        blobs = BlobStore() if self.has_blobs else None
+        if blobs is not None and not blobs.create_store(db):
+            return metrics.finish(False)
+        if store is not None:
+            ids.load(store, *self.translator_key)
+        if differential:
+            prints = Fingerprints()
+            prints.load(store, *self.translator_key)
+        if checkpoint:
+            cp = Checkpoint()
+            cp.load(store, *self.translator_key)
+        pipe = ImportPipeline(self.open_source) if pipeline else None
+        save = lambda: self._save_state(store, ids, prints, cp)
+        # Rows committed before the end of the import need their
+        # translations saved with them.
+        if store is not None and db.commit_policy != db.COMMIT_IMPORT:
+            db.add_commit_hook(save)
+        try:
+            db.start_transaction()
+            for o in self.ordered_table_list:
+                if cp is not None and cp.is_done(o):
+                    continue
+                _tbl = self.get_table(o)
+                # A resumed table isn't read in full, so its fingerprints
+                # can't be pruned.
+                resumed = cp is not None and cp.last_id(o)
+                if o in self.LOCKED_TABLES and not db.lock_table(o):
+                    db.rollback()
+                    return metrics.finish(False)
+                if pipe is not None:
+                    ok = pipe.move_data(_tbl, ids, db, prints = prints,
+                                        metrics = metrics.table(o),
+                                        checkpoint = cp, blobs = blobs)
+                else:
+                    ok = _tbl.move_data(ids, self._catalog, db, bulk,
+                                        prints = prints,
+                                        metrics = metrics.table(o),
+                                        checkpoint = cp, blobs = blobs)
+                if not ok:
+                    db.rollback()
+                    return metrics.finish(False)
+                if prints is not None and not resumed:
+                    prints.finish_table(o)
+                if cp is not None:
+                    cp.set_done(o)
+                if not db.table_finished():
+                    return metrics.finish(False)
+            if cp is not None and not cp.clear(store, *self.translator_key):
+                db.rollback()
+                return metrics.finish(False)
+            if not save():
+                db.rollback()
+                return metrics.finish(False)
+            db.commit()
+            return metrics.finish(True)
+        finally:
+            db.remove_commit_hook(save)
+
+    def _save_state(self, store, ids, prints, cp):
+        ''' Save the translations, fingerprints and checkpoint of an import
+            that are in use. '''
+        if store is None:
+            return True
+        key = self.translator_key
+        if not ids.save(store, *key):
+            return False
+        if prints is not None and not prints.save(store, *key):
+            return False
+        return cp is None or cp.save(store, *key)
+
+    def initial_load(self, db, store = None, batch_size = 1000,
+                                                         verbose = True):
+        ''' The first import of a catalog into an empty database. The tables
+            are created without constraints and filled without checking
+            for existing rows, then the unique constraints and foreign keys
+            are added, so Postgres checks and indexes everything once
+            rather than a row at a time. Any existing tables are dropped.
+            If store is supplied the id translations are saved to it. '''
+        timings = []
+        start = time.time()
+        if not self.create_database(db, True, True, store):
+            return False
+        timings.append(('create', time.time() - start))
         ids = IdTranslator()
+        blobs = BlobStore() if self.has_blobs else None
+        _start = time.time()
         db.start_transaction()
         for o in self.ordered_table_list:
-             _tbl = self.get_table(o)
-             if not _tbl.move_data(ids, self._catalog, db):
-                 db.rollback()
-                 return False
+            _tbl = self.get_table(o)
+            if _tbl.load_data(ids, self._catalog, db, batch_size,
+                                                   blobs = blobs) == -1:
+                db.rollback()
+                return False
+            db.table_finished()
+        db.commit()
+        timings.append(('load', time.time() - _start))
+        _start = time.time()
+        db.start_transaction()
+        if not self.add_constraints(db):
+            db.rollback()
+            return False
         db.commit()
+        timings.append(('constraints', time.time() - _start))
+        if store is not None and not ids.save(store, *self.translator_key):
+            return False
+        if verbose:
+            for phase, elapsed in timings:
+                print "%-20s %8.2fs" % (phase, elapsed)
+            print "%-20s %8.2fs" % ('total', time.time() - start)
         return True
-             
+
+    def import_parallel(self, dbs, bulk = False, store = None):
+        ''' Import data using one worker per database in dbs, which is
+            either a list of connected databases or a DatabasePool. Tables
+            are moved at the same time once the tables they depend on have
+            been imported. Each table is committed separately. Blobs are
+            written to the store made by create_database. If a table fails
+            the translations of those committed are still saved. Nothing is
+            imported if the codecs don't match the tables (see
+            check_codecs). '''
+        from slurpy.scheduler import TableScheduler
+        from slurpy.databases.pool import DatabasePool
+        if isinstance(dbs, DatabasePool):
+            # A connection of its own, as those in the pool may have to be
+            # used by the thread that opened them.
+            db = dbs.db_class()
+            if not db.connect(**dbs.kwargs):
+                return False
+            try:
+                ok = self.check_codecs(db)
+            finally:
+                db.close()
+        else:
+            ok = self.check_codecs(dbs[0])
+        if not ok:
+            return False
+        ids = IdTranslator()
+        if store is not None:
+            ids.load(store, *self.translator_key)
+        sched = TableScheduler(self, ids, len(dbs), bulk)
+        ok = sched.run(dbs)
+        if store is not None:
+            done = [n for n, _ok in sched.results.items() if _ok]
+            host, name = self.translator_key
+            if not ids.save(store, host, name, done):
+                return False
+        return ok
+
+    def restore(self, db, filename, store = None, key = None):
+        ''' Rebuild a catalog in filename from the data in db, using this
+            catalog as the template for the schema. If store is supplied,
+            only rows with translations saved for key (by default this
+            catalog's translator_key) are restored, with the ids they had
+            in the original catalog. Otherwise every row is restored with
+            the id it has in db. '''
+        from slurpy.restore import CatalogRestore
+        ids = None
+        if store is not None:
+            ids = IdTranslator()
+            ids.load(store, *(key or self.translator_key))
+            ids = ids.reverse()
+        return CatalogRestore(self, db, ids).run(filename)
+
     def _get_catalog_version(self):
         rv = self._catalog.query("select value from Adobe_variablesTable where name=?",
                                                        ['Adobe_DBVersion'])
@@ -145,16 +587,23 @@ class Catalog(object):
 
         self.ordered_table_list = ordered
 
-    def compare_tables(self, todb):
-        ''' Debug/test function. '''
-        for t in self.ordered_table_list:
-            tbl = self.get_table(t)
-            if tbl:
-                a = tbl.stats(self._catalog)
-                b = tbl.stats(todb)
-                if a['rows'] != b['rows']:
-                    return False
-        return True
+    def verify(self, todb, store = None, tables = None):
+        ''' Compare the rows of the catalog with those in todb, returning
+            the CatalogVerifier holding a TableDiff for each table. If store
+            is supplied, todb is a server this catalog was imported into
+            and the translations saved in the store map rows onto it.
+            Otherwise todb must use the catalog's own ids. '''
+        ids = None
+        if store is not None:
+            ids = IdTranslator()
+            ids.load(store, *self.translator_key)
+        verifier = CatalogVerifier(self, todb, ids)
+        verifier.run(tables)
+        return verifier
+
+    def compare_tables(self, todb, store = None):
+        ''' Returns True if todb holds the same rows as the catalog. '''
+        return self.verify(todb, store).ok
 
 from platform import node, system
 class Catalog2(object):
@@ -206,6 +655,11 @@ class Catalog2(object):
         ''' Get all rows from a table. '''
         return self._db.query("select * from %s" % name)
 
+    def iter_table_rows(self, name):
+        ''' Iterate over all rows from a table, without reading them all
+            into memory. '''
+        return self._db.iter_query("select * from %s" % name)
+
     def get_table_row_count(self, name):
         ''' Return the number of rows in a table within the catalog. '''
         rv = self._db.query("select count(*) as rows from %s" % name)
@@ -0,0 +1,90 @@
+''' Progress of an unfinished import, so that it can be resumed. '''
+
+class Checkpoint(object):
+    ''' Records, for each table of a catalog, whether it has been imported
+        and the last id_local moved. Rows are read in id_local order while
+        checkpointing, so an import that is restarted need only read the
+        rows after that. Entries are saved alongside the id translations,
+        in the same transaction as the rows they describe, and cleared once
+        the import has finished. '''
+
+    STORE_TABLE = 'slurpy_checkpoint'
+    STORE_COLUMNS = ['host', 'catalog', 'tblname', 'last_id', 'done']
+
+    def __init__(self):
+        self._tables = {}
+        self._dirty = set()
+
+    def __len__(self):
+        return len(self._tables)
+
+    def is_done(self, name):
+        return self._tables.get(name.lower(), (None, False))[1]
+
+    def last_id(self, name):
+        ''' The last id_local moved for the table, or None. '''
+        return self._tables.get(name.lower(), (None, False))[0]
+
+    def set_progress(self, name, last_id):
+        name = name.lower()
+        self._tables[name] = (last_id, False)
+        self._dirty.add(name)
+
+    def set_done(self, name):
+        name = name.lower()
+        self._tables[name] = (self.last_id(name), True)
+        self._dirty.add(name)
+
+    def create_store(self, db):
+        ''' Create the table used to store checkpoints, if needed. '''
+        return db.execute("CREATE TABLE IF NOT EXISTS %s (host TEXT NOT NULL, "
+                          "catalog TEXT NOT NULL, tblname TEXT NOT NULL, "
+                          "last_id BIGINT, done INTEGER NOT NULL)" %
+                                                          self.STORE_TABLE)
+
+    def drop_store(self, db):
+        ''' Remove all stored checkpoints. '''
+        return db.execute("DROP TABLE IF EXISTS %s" % self.STORE_TABLE)
+
+    def load(self, db, host, catalog):
+        ''' Load the checkpoint saved for the host and catalog. Returns the
+            number of tables it covers, 0 if there is nothing to resume. '''
+        if not self.create_store(db):
+            return 0
+        rows = db.query("select tblname, last_id, done from %s where "
+                        "host=? and catalog=?" % self.STORE_TABLE,
+                                                      [host, catalog])
+        self._tables = dict([(name, (last_id, bool(done)))
+                                         for name, last_id, done in rows])
+        self._dirty = set()
+        return len(self._tables)
+
+    def save(self, db, host, catalog):
+        ''' Write the tables changed since the last load or save. Returns
+            True or False. '''
+        if not self._dirty:
+            return True
+        if not self.create_store(db):
+            return False
+        names = list(self._dirty)
+        if not db.execute("delete from %s where host=? and catalog=? and "
+                          "tblname in (%s)" % (self.STORE_TABLE,
+                          ','.join(['?' for n in names])),
+                                                 [host, catalog] + names):
+            return False
+        rows = [[host, catalog, n, self._tables[n][0],
+                                    int(self._tables[n][1])] for n in names]
+        if db.insert_rows(self.STORE_TABLE, self.STORE_COLUMNS, rows,
+                                                           None) is None:
+            return False
+        self._dirty = set()
+        return True
+
+    def clear(self, db, host, catalog):
+        ''' Forget the checkpoint, as the import has finished. '''
+        self._tables = {}
+        self._dirty = set()
+        if not self.create_store(db):
+            return False
+        return db.execute("delete from %s where host=? and catalog=?" %
+                                  self.STORE_TABLE, [host, catalog])
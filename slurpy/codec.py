@@ -0,0 +1,166 @@
+''' Compression of large text columns. '''
+
+import zlib
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if not isinstance(value, str):
+        return str(value)
+    return value
+
+CODECS = {'zlib': (lambda v: zlib.compress(v, 6), zlib.decompress)}
+if lzma is not None:
+    CODECS['lzma'] = (lzma.compress, lzma.decompress)
+
+# Columns with fewer values than this are compressed without the pool.
+POOL_MIN = 64
+
+_pool = None
+_workers = None
+
+def set_workers(workers):
+    ''' Set the number of threads used by compress_many. 0 compresses in
+        the calling thread. Both codecs release the GIL while they work,
+        so threads run in parallel. '''
+    global _pool, _workers
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+    _workers = workers
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPool(_workers or cpu_count())
+    return _pool
+
+def check_codec(name):
+    if not CODECS.has_key(name):
+        raise ValueError('Unknown or unavailable codec %s' % name)
+
+def compress(name, value):
+    ''' Compress a value, returning a buffer ready to be written to a binary
+        column. Text is encoded as UTF-8 first. '''
+    if value is None or isinstance(value, buffer):
+        return value
+    return buffer(CODECS[name][0](_encode(value)))
+
+def decompress(name, data):
+    ''' Return the text held by a compressed value. Values that were not
+        read from a binary column are returned unchanged. '''
+    if not isinstance(data, buffer):
+        return data
+    return CODECS[name][1](str(data)).decode('utf-8')
+
+def _map(func, values):
+    if _workers == 0 or len(values) < POOL_MIN:
+        return [func(v) for v in values]
+    chunk = max(len(values) / (4 * (_workers or cpu_count())), 1)
+    return _get_pool().map(func, values, chunk)
+
+def compress_many(name, values):
+    ''' Compress a list of values, using the thread pool for long lists. '''
+    return _map(lambda v: compress(name, v), values)
+
+def decompress_many(name, values):
+    return _map(lambda v: decompress(name, v), values)
+
+class CodecStore(object):
+    ''' Records the codec each column of the tables on a server was
+        created with, if any, so their values can be read back and later
+        imports checked without the settings used to write them. Tables
+        created before the record was kept have no entry, and their fields
+        are taken to be as the catalog describes them. '''
+
+    STORE_TABLE = 'slurpy_codec'
+    STORE_COLUMNS = ['tblname', 'colname', 'codec']
+
+    def __init__(self):
+        self._tables = {}
+
+    def create_store(self, db):
+        ''' Create the table used to record codecs, if needed. '''
+        return db.execute("CREATE TABLE IF NOT EXISTS %s (tblname TEXT NOT "
+                          "NULL, colname TEXT NOT NULL, codec TEXT NOT NULL)"
+                                                         % self.STORE_TABLE)
+
+    def drop_store(self, db):
+        ''' Remove the record of every table. '''
+        return db.execute("DROP TABLE IF EXISTS %s" % self.STORE_TABLE)
+
+    def load(self, db):
+        ''' Load the codecs recorded on db. Returns the number of tables
+            they cover. '''
+        if not self.create_store(db):
+            return 0
+        self._tables = {}
+        for tblname, colname, codec in db.query("select tblname, colname, "
+                                           "codec from %s" % self.STORE_TABLE):
+            self._tables.setdefault(tblname, {})[colname] = codec or None
+        return len(self._tables)
+
+    def has_table(self, name):
+        return self._tables.has_key(name.lower())
+
+    def _server_codec(self, fld, types):
+        ''' The codec of the column for fld, going by its type on the
+            server where that is known. A table that already existed may
+            have been created with other settings than fld has. '''
+        dtype = types.get(fld.name.lower())
+        if dtype is None:
+            return fld.codec
+        if dtype != 'bytea':
+            return None
+        # zlib is the default of Catalog.compress_fields.
+        return fld.codec or 'zlib'
+
+    def save_tables(self, db, tbls):
+        ''' Record the codecs of the fields of each table in tbls, once
+            all have been created on db, so the server's schema is only
+            read once. Returns True or False. '''
+        tables = {}
+        rows = []
+        for tbl in tbls:
+            name = tbl.name.lower()
+            types = {}
+            if hasattr(db, 'get_table_columns'):
+                types = dict([(c['name'], c['data_type']) for c in
+                                  db.get_table_columns(tbl.name)['columns']])
+            cols = tables[name] = dict([(f.name.lower(),
+                          self._server_codec(f, types)) for f in tbl.fields])
+            rows.extend([[name, c, codec or ''] for c, codec in
+                                                        sorted(cols.items())])
+        if not tables:
+            return True
+        names = sorted(tables.keys())
+        if not db.execute("delete from %s where tblname in (%s)" % (
+                self.STORE_TABLE, ','.join(['?' for n in names])), names):
+            return False
+        if db.insert_rows(self.STORE_TABLE, self.STORE_COLUMNS, rows,
+                                                               None) is None:
+            return False
+        self._tables.update(tables)
+        return True
+
+    def codec(self, tbl, fld):
+        ''' The codec the values of fld in tbl are stored with. '''
+        cols = self._tables.get(tbl.name.lower())
+        if cols is None:
+            return fld.codec
+        return cols.get(fld.name.lower())
+
+    def mismatches(self, tbl):
+        ''' The names of the fields of tbl set to use a different codec
+            than their columns were created with. '''
+        return [f.name for f in tbl.fields if f.codec != self.codec(tbl, f)]
@@ -1,7 +1,9 @@
 ''' Base class for Slurpy database interfaces. '''
 import re
+import time
 
-from slurpy.schema.parser import parse_column_statement, parse_table_statement
+from slurpy.schema.field import DatabaseField
+from slurpy.schema.table import DatabaseTable
 
 # The types of field we need to know about. These are interpretted by each
 # database class.
@@ -31,9 +33,10 @@ def _field_from_dict(rv):
 def table_from_string(sqlstr):
     ''' Parse an SQL statement into a DatabaseTable. Returns None if fails. '''
     from slurpy.lightroom import lightroom_reference
+    from slurpy.schema import get_parser
     if len(sqlstr) == 0 or not sqlstr.upper().strip().startswith("CREATE TABLE"):
         return None
-    rv = parse_table_statement(sqlstr)
+    rv = get_parser().parse_table_statement(sqlstr)
     if rv == {}:
         return None
     tbl = DatabaseTable(rv.get('identifier'))
@@ -51,19 +54,96 @@ def table_from_string(sqlstr):
 def field_from_string(sqlstr):
     ''' Parse an SQL statement for a DatabaseField. Returns None if parse
         fails. '''
+    from slurpy.schema import get_parser
     if len(sqlstr) == 0:
         return None
 
-    rv = parse_column_statement(sqlstr)
+    rv = get_parser().parse_column_statement(sqlstr)
     if rv == {}:
         return None
     return _field_from_dict(rv)
              
 class DatabaseBase(object):
     ''' This is a base database and is meant to be subclassed. '''
-    def __init__(self):
+
+    # Number of rows fetched at a time by iter_query.
+    ITER_ROWS = 1000
+
+    # When writes made inside a transaction are committed: every
+    # commit_rows rows, after each table, or once the whole import is done.
+    COMMIT_ROWS = 'rows'
+    COMMIT_TABLE = 'table'
+    COMMIT_IMPORT = 'import'
+    COMMIT_POLICIES = [COMMIT_ROWS, COMMIT_TABLE, COMMIT_IMPORT]
+
+    def __init__(self, **kwargs):
         self.connected = False
         self.in_transaction = False
+        self.commit_policy = self.COMMIT_IMPORT
+        self.commit_rows = 1000
+        self._uncommitted = 0
+        # Number of statements sent to the database.
+        self.statements = 0
+        # Number of transactions started, so a writer can tell when the
+        # one its writes were made in has ended.
+        self.transactions = 0
+        self.tracer = None
+        self._commit_hooks = []
+        if kwargs.has_key('commit_policy'):
+            self.set_commit_policy(kwargs['commit_policy'],
+                                   kwargs.get('commit_rows'))
+        if kwargs.has_key('tracer'):
+            self.set_tracer(kwargs['tracer'])
+
+    def set_tracer(self, tracer):
+        ''' Report every statement sent to tracer, which has a method
+            trace(statement, args, rows, seconds) as QueryProfiler does.
+            None stops tracing. '''
+        self.tracer = tracer
+
+    def _sent(self, statement, args, rows, start):
+        ''' Count a statement that was sent at time start and returned or
+            wrote rows rows, and pass it on to the tracer. '''
+        self.statements += 1
+        if self.tracer is not None:
+            self.tracer.trace(statement, args, rows, time.time() - start)
+
+    def _sent_many(self, statement, rows, written, start):
+        ''' As _sent, for a statement sent with a batch of rows, each a
+            list of arguments. The tracer is given all of their values. '''
+        args = None
+        if self.tracer is not None:
+            args = [v for r in rows for v in r]
+        self._sent(statement, args, written, start)
+
+    def _traced_rows(self, statement, args, rows):
+        ''' Iterate over rows, tracing the statement once all are read,
+            or when iteration stops early. '''
+        n = 0
+        elapsed = 0
+        it = iter(rows)
+        try:
+            while True:
+                start = time.time()
+                try:
+                    r = it.next()
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.time() - start
+                n += 1
+                yield r
+        finally:
+            self.tracer.trace(statement, args, n, elapsed)
+
+    def set_commit_policy(self, policy, rows = None):
+        ''' Set the commit policy, one of COMMIT_POLICIES. For COMMIT_ROWS,
+            rows sets how many rows are written between commits. '''
+        if not policy in self.COMMIT_POLICIES:
+            raise ValueError('Unknown commit policy %s' % policy)
+        self.commit_policy = policy
+        if rows:
+            self.commit_rows = int(rows)
 
     def start_transaction(self):
         if self.connected:
@@ -71,7 +151,53 @@ class DatabaseBase(object):
                 self.commit()
             self.execute("BEGIN")
             self.in_transaction = True
+            self.transactions += 1
+            self._uncommitted = 0
+
+    def add_commit_hook(self, func):
+        ''' Call func before each commit made by the commit policy, in the
+            transaction being committed. If func returns False the
+            transaction is rolled back instead. '''
+        self._commit_hooks.append(func)
+
+    def remove_commit_hook(self, func):
+        if func in self._commit_hooks:
+            self._commit_hooks.remove(func)
+
+    def _policy_commit(self):
+        for func in self._commit_hooks:
+            if not func():
+                self.rollback()
+                return False
+        self.start_transaction()
+        return True
+
+    def row_written(self, count = 1):
+        ''' Called by writers after rows have been written. With the rows
+            policy, the transaction is committed and a new one started once
+            commit_rows rows have been written. Returns False if a commit
+            hook failed and the transaction was rolled back. '''
+        if not self.in_transaction or self.commit_policy != self.COMMIT_ROWS:
+            return True
+        self._uncommitted += count
+        if self._uncommitted >= self.commit_rows:
+            return self._policy_commit()
+        return True
+
+    def table_finished(self):
+        ''' Called by writers when a table is complete. Unless the whole
+            import is one transaction, the rows are committed now. Returns
+            False if a commit hook failed. '''
+        if self.in_transaction and self.commit_policy != self.COMMIT_IMPORT:
+            return self._policy_commit()
+        return True
             
+    def lock_table(self, name):
+        ''' Take a lock, held until the end of the transaction, that
+            serialises writers to a table shared between imports. Databases
+            with a single writer need do nothing. '''
+        return True
+
     def commit(self):
         ''' Finish the transaction, commit any changes. '''
         raise NotImplementedError
@@ -81,12 +207,20 @@ class DatabaseBase(object):
         raise NotImplementedError
 
     def connect(self, **args):
-        ''' Connect to database using supplied keyword arguments. '''
+        ''' Connect to database using supplied keyword arguments. The
+            commit policy can also be given, as commit_policy and
+            commit_rows, and a tracer as tracer. '''
         if self.connected:
             if not self.close():
                 return False
         if not hasattr(self, '_connect'):
             raise NotImplementedError
+        args = dict(args)
+        if args.has_key('commit_policy'):
+            self.set_commit_policy(args.pop('commit_policy'),
+                                   args.pop('commit_rows', None))
+        if args.has_key('tracer'):
+            self.set_tracer(args.pop('tracer'))
         return self._connect(**args)
 
     def close(self):
@@ -103,7 +237,27 @@ class DatabaseBase(object):
             return []
         if '?' in statement and len(args) == 0:
             raise ValueError('Statement requires arguments, but none supplied')
-        return self._query(statement, args)
+        start = time.time()
+        rv = self._query(statement, args)
+        self._sent(statement, args, len(rv), start)
+        return rv
+
+    def iter_query(self, statement, args = [], size = None):
+        ''' Execute a select query on the database, returning an iterator
+            over the rows. Rows are fetched from the database size at a
+            time rather than all at once. '''
+        if not self.connected or len(statement) == 0:
+            return iter([])
+        if '?' in statement and len(args) == 0:
+            raise ValueError('Statement requires arguments, but none supplied')
+        self.statements += 1
+        if not hasattr(self, '_iter_query'):
+            rows = self._query(statement, args)
+        else:
+            rows = self._iter_query(statement, args, size or self.ITER_ROWS)
+        if self.tracer is None:
+            return iter(rows)
+        return self._traced_rows(statement, args, rows)
 
     def execute(self, statement, args=[]):
         ''' Execute a select query on the database, returning True or False. '''
@@ -111,18 +265,35 @@ class DatabaseBase(object):
             return False
         if not hasattr(self, '_execute'):
             raise NotImplementedError
-        return self._execute(statement, args)
+        start = time.time()
+        rv = self._execute(statement, args)
+        self._sent(statement, args, 0, start)
+        return rv
 
-    def create(self, tbl, drop = False):
-        ''' Create a table, optionally dropping if it exists. '''
+    def create(self, tbl, drop = False, deferred = False):
+        ''' Create a table, optionally dropping if it exists. If deferred
+            is True the unique and foreign key constraints are not created
+            until add_constraints is called. '''
         if not self.connected or tbl is None:
             return False
         if not hasattr(self, '_create'):
             raise NotImplementedError
         if drop and not self.drop(tbl):
             return False
+        if deferred:
+            return self._create(tbl, deferred = True)
         return self._create(tbl)
 
+    def add_constraints(self, tbl, foreign = False):
+        ''' Add the unique constraints, or the foreign keys if foreign is
+            True, to a table created with deferred set. Unique constraints
+            should be added to all tables before any foreign keys. '''
+        if not self.connected or tbl is None:
+            return False
+        if not hasattr(self, '_add_constraints'):
+            raise NotImplementedError
+        return self._add_constraints(tbl, foreign)
+
     def drop(self, tbl):
         ''' Drop a database table. '''
         if not self.connected or tbl is None:
@@ -153,7 +324,36 @@ class DatabaseBase(object):
             values supplied. Return the id of the newly inserted row. '''
         raise NotImplementedError
 
+    def insert_rows(self, tblname, cols, rows, theid = 'id_local'):
+        ''' Insert a batch of rows into the table specified. Returns a list
+            of the ids of the new rows, in the same order as the rows
+            supplied, or None on failure. Subclasses should override this
+            with something better than a row at a time. '''
+        ids = []
+        for r in rows:
+            _id = self.insert_row(tblname, cols, r)
+            if _id is None:
+                return None
+            ids.append(_id)
+        return ids
+
     def update_row(self, tblname, cols, vals, id):
-        ''' Update a row contents. Returns True or False. '''
+        ''' Update the contents of the row with id_local id. Returns the
+            number of rows updated, which is 0 if there is no such row, or
+            None on failure. '''
         raise NotImplementedError
 
+    def update_rows(self, tblname, cols, rows, ids):
+        ''' Update a batch of rows, rows[n] holding the values of cols for
+            the row with id_local ids[n]. Returns the list of ids that were
+            found and updated, or None on failure. Subclasses should
+            override this with something better than a row at a time. '''
+        done = []
+        for r, _id in zip(rows, ids):
+            n = self.update_row(tblname, cols, list(r), _id)
+            if n is None:
+                return None
+            if n:
+                done.append(_id)
+        return done
+
@@ -0,0 +1,75 @@
+''' Pools of database connections, shared between workers. '''
+
+import threading
+from Queue import Queue, Empty
+from contextlib import contextmanager
+
+from slurpy.databases.postgres import PgDatabase
+
+class DatabasePool(object):
+    ''' A fixed size pool of connections of class db_class, all opened with
+        the same keyword arguments. Connections are only opened when first
+        needed and are handed to one worker at a time. '''
+
+    def __init__(self, db_class, size = 4, **kwargs):
+        self.db_class = db_class
+        self.size = size
+        self.kwargs = kwargs
+        self._all = []
+        self._free = Queue()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def get(self, timeout = None):
+        ''' Return a connection, opening a new one if the pool isn't full,
+            otherwise waiting for one to be returned. Returns None if the
+            connection fails or none is free before timeout seconds. '''
+        try:
+            return self._free.get_nowait()
+        except Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.size:
+                db = self.db_class()
+                if not db.connect(**self.kwargs):
+                    return None
+                self._all.append(db)
+                return db
+        try:
+            return self._free.get(True, timeout)
+        except Empty:
+            return None
+
+    def put(self, db):
+        ''' Return a connection to the pool. Anything left uncommitted is
+            discarded. '''
+        if db.in_transaction:
+            db.rollback()
+        self._free.put(db)
+
+    @contextmanager
+    def connection(self, timeout = None):
+        ''' Use a connection from the pool for the duration of a with
+            block. '''
+        db = self.get(timeout)
+        try:
+            yield db
+        finally:
+            if db is not None:
+                self.put(db)
+
+    def close(self):
+        ''' Close every connection opened by the pool. '''
+        with self._lock:
+            for db in self._all:
+                db.close()
+            self._all = []
+            self._free = Queue()
+        return True
+
+class PgPool(DatabasePool):
+    ''' Pool of PgDatabase connections. '''
+    def __init__(self, size = 4, **kwargs):
+        DatabasePool.__init__(self, PgDatabase, size, **kwargs)
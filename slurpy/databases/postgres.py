@@ -1,13 +1,83 @@
 ''' Postgresql Database Class. '''
 
+import json
+import time
 import psycopg2
+from cStringIO import StringIO
 
 from slurpy.database import *
 
+def _copy_value(val):
+    ''' Return a value formatted for the COPY text format. '''
+    if val is None:
+        return '\\N'
+    if isinstance(val, buffer):
+        # bytea in hex format, with the backslash escaped for COPY.
+        return '\\\\x' + str(val).encode('hex')
+    if isinstance(val, unicode):
+        val = val.encode('utf-8')
+    elif not isinstance(val, str):
+        val = str(val)
+    return val.replace('\\', '\\\\').replace('\t', '\\t'). \
+               replace('\n', '\\n').replace('\r', '\\r')
+
+def _flag(val):
+    ''' Interpret a setting that may have come from a config file. '''
+    if isinstance(val, basestring):
+        return not val.strip().lower() in ['0', 'false', 'no', 'off']
+    return bool(val)
+
+def _numbered_params(stmt):
+    ''' Return the statement with each ? or %s placeholder replaced by
+        $1, $2, ... as needed by PREPARE, and the number of parameters. '''
+    parts = stmt.replace('?', '%s').split('%s')
+    sql = parts[0]
+    for n in xrange(1, len(parts)):
+        sql += '$%d%s' % (n, parts[n])
+    return sql, len(parts) - 1
+
 class PgDatabase(DatabaseBase):
     ''' Postgresql Database class for Slurpy. '''
+
+    # Number of rows sent to the server in each COPY by insert_rows.
+    BULK_ROWS = 5000
+    NEXTVAL_SQL = "select nextval(pg_get_serial_sequence(%s, %s)) " \
+                  "from generate_series(1, %s)"
+
+    # Columns, foreign keys and unique constraints of every table in the
+    # public schema. Columns sort first, in ordinal order.
+    SCHEMA_SQL = '''
+        select 'c'::text, c.relname::text, a.attname::text, a.attnum,
+               format_type(a.atttypid, NULL), pg_get_expr(d.adbin, d.adrelid),
+               NULL::text, NULL::text
+        from pg_attribute a join pg_class c on c.oid = a.attrelid
+        join pg_namespace n on n.oid = c.relnamespace
+        left join pg_attrdef d on d.adrelid = a.attrelid and d.adnum = a.attnum
+        where n.nspname = 'public' and c.relkind = 'r' and a.attnum > 0
+              and not a.attisdropped
+        union all
+        select con.contype::text, c.relname::text, a.attname::text, a.attnum,
+               NULL::text, NULL::text, fc.relname::text, fa.attname::text
+        from pg_constraint con join pg_class c on c.oid = con.conrelid
+        join pg_namespace n on n.oid = c.relnamespace
+        join pg_attribute a on a.attrelid = con.conrelid
+                           and a.attnum = any(con.conkey)
+        left join pg_class fc on fc.oid = con.confrelid
+        left join pg_attribute fa on fa.attrelid = con.confrelid
+                                 and fa.attnum = con.confkey[1]
+        where n.nspname = 'public' and con.contype in ('f', 'u')
+        order by 2, 1, 4'''
+
+    # Most statements prepared on a connection. Beyond this, new statements
+    # are sent unprepared.
+    PREPARED_MAX = 500
+
     def __init__(self, **kwargs):
         DatabaseBase.__init__(self, **kwargs)
+        self._iter_count = 0
+        self._schema = None
+        self.prepare = _flag(kwargs.get('prepare', True))
+        self._prepared = {}
 
     def _connect(self, **kwargs):
         ''' Connect to a postgresql database '''
@@ -20,6 +90,8 @@ class PgDatabase(DatabaseBase):
         for k in ['host', 'port']:
             if kwargs.has_key(k):
                 connStr += '%s=%s ' % (k, kwargs[k])    
+        if kwargs.has_key('prepare'):
+            self.prepare = _flag(kwargs['prepare'])
 
         try:
             self._db = psycopg2.connect(connStr)
@@ -27,12 +99,16 @@ class PgDatabase(DatabaseBase):
             return False
             
         self.connected = True
+        self.invalidate_schema_cache()
+        self._prepared = {}
         return True
 
     def _close(self):
         ''' Close an Sqlite connection. '''
         self._db.close()
         self.connected = False
+        self.invalidate_schema_cache()
+        self._prepared = {}
         return True
 
     def commit(self):
@@ -44,10 +120,53 @@ class PgDatabase(DatabaseBase):
         self._db.rollback()
         self.in_transaction = False
 
+    def lock_table(self, name):
+        ''' Uses an advisory lock, so readers are not blocked. '''
+        return bool(self._query("select 1 from pg_advisory_xact_lock("
+                                "hashtext(?))", [name.lower()]))
+
     def _actual_execute(self, stmt, args):
         _cur = self._db.cursor()
-        _cur.execute(self._convert_query_stmt(stmt), args)
+        name = self._prepared_name(_cur, stmt, args)
+        if name:
+            _cur.execute("EXECUTE %s (%s)" % (name,
+                                        ','.join(['%s' for a in args])), args)
+        else:
+            _cur.execute(self._convert_query_stmt(stmt), args)
         return _cur
+
+    def _prepared_name(self, _cur, stmt, args):
+        ''' Return the name of the prepared statement for stmt, preparing
+            it on first use. Only statements with arguments are prepared, as
+            those are the ones run many times. None is returned if the
+            statement can't be prepared. The PREPARE is run inside a
+            savepoint, so a failure doesn't abort an open transaction. '''
+        if not self.prepare or not args:
+            return None
+        if self._prepared.has_key(stmt):
+            return self._prepared[stmt]
+        if len(self._prepared) >= self.PREPARED_MAX:
+            return None
+        sql, nargs = _numbered_params(stmt)
+        name = None
+        if nargs == len(args):
+            name = 'slurpy_stmt_%d' % len(self._prepared)
+            _cur.execute("SAVEPOINT slurpy_prepare")
+            try:
+                _cur.execute("PREPARE %s AS %s" % (name, sql))
+                _cur.execute("RELEASE SAVEPOINT slurpy_prepare")
+            except psycopg2.Error:
+                _cur.execute("ROLLBACK TO SAVEPOINT slurpy_prepare")
+                name = None
+        self._prepared[stmt] = name
+        return name
+
+    def deallocate(self):
+        ''' Discard all prepared statements, for instance after the tables
+            they use have changed. '''
+        if self.connected and self._prepared:
+            self._execute("DEALLOCATE ALL")
+        self._prepared = {}
         
     def _query(self, stmt, args = []):
         try:
@@ -59,6 +178,34 @@ class PgDatabase(DatabaseBase):
             self._db.rollback()
             return []
 
+    def _iter_query(self, stmt, args, size):
+        ''' Generator used by iter_query. Rows are read through a named,
+            server side cursor so only size rows are held at once. The
+            cursor is created WITH HOLD so that it survives a commit. A
+            failed query raises its error. Inside a transaction it is left
+            to the caller to roll back, as doing so here would discard the
+            writes made before it. '''
+        self._iter_count += 1
+        _cur = self._db.cursor(name = 'slurpy_iter_%d' % self._iter_count,
+                                                          withhold = True)
+        _cur.itersize = size
+        try:
+            try:
+                _cur.execute(self._convert_query_stmt(stmt), args)
+            except psycopg2.Error:
+                if not self.in_transaction:
+                    self._db.rollback()
+                raise
+            while True:
+                rows = _cur.fetchmany(size)
+                if not rows:
+                    break
+                for r in rows:
+                    yield r
+        finally:
+            if not _cur.closed:
+                _cur.close()
+
     def _execute(self, stmt, args = []):
         try:
             _cur = self._actual_execute(stmt, args)
@@ -73,22 +220,50 @@ class PgDatabase(DatabaseBase):
                 self._db.rollback()
             return False
 
-    def _create(self, tbl, is_catalog = False):
-        ''' Create a table using the supplied DatabaseTable object. '''
+    def _create(self, tbl, is_catalog = False, deferred = False):
+        ''' Create a table using the supplied DatabaseTable object. If
+            deferred is True, unique and foreign key constraints are left
+            for _add_constraints. '''
         sql = "CREATE TABLE IF NOT EXISTS %s (" % tbl.name
         flds = []
         for f in tbl.fields:
             if is_catalog and f.slurpy:
                 continue
-            flds.append(self._field_statement(f))
-        for n, idx in tbl.indexes.items():
-            columns = ', '.join(idx['names'])
-            flds.append("UNIQUE(%s)" % columns)
+            flds.append(self._field_statement(f, deferred))
+        if not deferred:
+            for n, idx in tbl.indexes.items():
+                columns = ', '.join(idx['names'])
+                flds.append("UNIQUE(%s)" % columns)
         sql += ',\n'.join(flds) + ')'
+        self.invalidate_schema_cache()
+        self.deallocate()
         return self._execute(sql)
+
+    def _add_constraints(self, tbl, foreign):
+        ''' Add the constraints left out when the table was created. Postgres
+            gives them the same names as it would have done then. '''
+        stmts = []
+        if foreign:
+            for f in tbl.fields:
+                if f.has_fk:
+                    stmts.append("FOREIGN KEY (%s) %s" % (f.name,
+                                                 self._fk_statement(f)))
+        else:
+            for f in tbl.fields:
+                if f.unique:
+                    stmts.append("UNIQUE (%s)" % f.name)
+            for n, idx in tbl.indexes.items():
+                stmts.append("UNIQUE (%s)" % ', '.join(idx['names']))
+        for stmt in stmts:
+            if not self._execute("ALTER TABLE %s ADD %s" % (tbl.name, stmt)):
+                return False
+        self.invalidate_schema_cache()
+        return True
         
     def _drop(self, tblname):
         ''' Drop a database table. '''
+        self.invalidate_schema_cache()
+        self.deallocate()
         return self._execute("drop table if exists %s cascade" % tblname)
 
     def _convert_query_stmt(self, stmt):
@@ -111,6 +286,8 @@ class PgDatabase(DatabaseBase):
         return [name for (name, ) in self._query(sql)]
  
     def _dropall(self):
+        self.invalidate_schema_cache()
+        self.deallocate()
         for t in self._get_table_list():
             self._execute("DROP TABLE %s CASCADE" % t)
         for s in self._get_seq_list():
@@ -121,60 +298,183 @@ class PgDatabase(DatabaseBase):
         sql = "INSERT INTO %s (%s) VALUES (%s) RETURNING %s" % (tblname,
                             ','.join(cols), ','.join(['%s' for f in vals]),
                                                                      theid)
+        start = time.time()
         rv = self._query(sql, vals)
-        self._db.commit()
+        self._sent(sql, vals, len(rv), start)
+        if not self.in_transaction:
+            self._db.commit()
         return rv[0][0]
 
+    def insert_rows(self, tblname, cols, rows, theid = 'id_local'):
+        ''' Insert rows using COPY FROM STDIN, BULK_ROWS at a time. The ids
+            are allocated from the column sequence before the data is sent,
+            so the list returned is guaranteed to be in the same order as
+            the rows supplied. If theid is None, no ids are allocated and
+            an empty list is returned. '''
+        ids = []
+        try:
+            _cur = self._db.cursor()
+            for n in xrange(0, len(rows), self.BULK_ROWS):
+                chunk = rows[n:n + self.BULK_ROWS]
+                _cols = list(cols)
+                if theid:
+                    start = time.time()
+                    _cur.execute(self.NEXTVAL_SQL,
+                                 [tblname, theid, len(chunk)])
+                    _ids = [r[0] for r in _cur.fetchall()]
+                    self._sent(self.NEXTVAL_SQL, [tblname, theid,
+                                               len(chunk)], len(_ids), start)
+                    chunk = [[i] + list(r) for i, r in zip(_ids, chunk)]
+                    _cols.insert(0, theid)
+                    ids.extend(_ids)
+                data = StringIO()
+                for r in chunk:
+                    data.write('\t'.join([_copy_value(v) for v in r]) + '\n')
+                data.seek(0)
+                sql = "COPY %s (%s) FROM STDIN" % (tblname, ','.join(_cols))
+                start = time.time()
+                _cur.copy_expert(sql, data)
+                self._sent_many(sql, chunk, len(chunk), start)
+            _cur.close()
+        except psycopg2.Error:
+            if not self.in_transaction:
+                self._db.rollback()
+            return None
+        if not self.in_transaction:
+            self._db.commit()
+        return ids
+
     def update_row(self, tblname, cols, vals, _id):
-        sql = "UPDATE %s SET %s WHERE id_local=%%s RETURNING id_local" % (tblname,
+        sql = "UPDATE %s SET %s WHERE id_local=%%s" % (tblname,
                                     ','.join(['%s=%%s' % c for c in cols]))
-        vals.append(_id)
-        return self._query(sql, vals)[0][0]
+        args = list(vals) + [_id]
+        start = time.time()
+        try:
+            _cur = self._actual_execute(sql, args)
+            rv = _cur.rowcount
+            _cur.close()
+        except psycopg2.Error:
+            if not self.in_transaction:
+                self._db.rollback()
+            return None
+        finally:
+            self._sent(sql, args, 1, start)
+        if not self.in_transaction:
+            self._db.commit()
+        return rv
+
+    def update_rows(self, tblname, cols, rows, ids):
+        ''' Update rows BULK_ROWS at a time, each chunk with a single
+            UPDATE ... FROM (VALUES ...). The values are cast to the types
+            of the columns, as found by get_table_columns. '''
+        types = dict([(c['name'], c['data_type']) for c in
+                                   self.get_table_columns(tblname)['columns']])
+        if not all([types.has_key(c.lower()) for c in cols + ['id_local']]):
+            return DatabaseBase.update_rows(self, tblname, cols, rows, ids)
+        row_sql = '(%s)' % ','.join(['%%s::%s' % types[c.lower()]
+                                     for c in ['id_local'] + cols])
+        sql = "UPDATE %s t SET %s FROM (VALUES %%s) AS v(slurpy_id, %s) " \
+              "WHERE t.id_local=v.slurpy_id RETURNING t.id_local" % (tblname,
+                   ','.join(['%s=v.%s' % (c, c) for c in cols]), ','.join(cols))
+        done = []
+        try:
+            _cur = self._db.cursor()
+            for n in xrange(0, len(rows), self.BULK_ROWS):
+                chunk = [[_id] + list(r) for r, _id in
+                         zip(rows[n:n + self.BULK_ROWS], ids[n:n + self.BULK_ROWS])]
+                start = time.time()
+                _cur.execute(sql % ','.join([_cur.mogrify(row_sql, r)
+                                             for r in chunk]))
+                found = [r[0] for r in _cur.fetchall()]
+                self._sent_many(sql, chunk, len(found), start)
+                done.extend(found)
+            _cur.close()
+        except psycopg2.Error:
+            if not self.in_transaction:
+                self._db.rollback()
+            return None
+        if not self.in_transaction:
+            self._db.commit()
+        return done
+
+    def invalidate_schema_cache(self):
+        ''' Forget the schema information read by get_table_columns. '''
+        self._schema = None
+
+    def _load_schema_cache(self):
+        ''' Read the schema of every table with a single query. The cache
+            is a dict of table name -> {'columns': [[name, type, default]],
+            'fkeys': [[column, table, column]], 'unique': [column]}. '''
+        schema = {}
+        for kind, tbl, col, num, dtype, dflt, ftbl, fcol in \
+                                               self._query(self.SCHEMA_SQL):
+            info = schema.setdefault(tbl, {'columns': [], 'fkeys': [],
+                                           'unique': []})
+            if kind == 'c':
+                info['columns'].append([col, dtype, dflt])
+            elif kind == 'f':
+                info['fkeys'].append([col, ftbl, fcol])
+            else:
+                info['unique'].append(col)
+        self._schema = schema
+
+    def save_schema_cache(self, filename, version):
+        ''' Save the schema cache to a file, for the catalog version
+            supplied. '''
+        if self._schema is None:
+            self._load_schema_cache()
+        with open(filename, 'w') as fh:
+            json.dump({'version': version, 'tables': self._schema}, fh)
+        return True
+
+    def load_schema_cache(self, filename, version):
+        ''' Load a schema cache saved by save_schema_cache. Returns False
+            if the file can't be read or is for a different version. '''
+        try:
+            with open(filename) as fh:
+                data = json.load(fh)
+        except (IOError, ValueError):
+            return False
+        if data.get('version') != version:
+            return False
+        self._schema = data['tables']
+        return True
 
     def get_table_columns(self, tblname):
+        ''' Return information about the columns of a table. Information
+            for all tables is read in one query the first time this is
+            called, then kept until the schema is changed. '''
+        if self._schema is None:
+            self._load_schema_cache()
+        tblname = tblname.lower()
+        schema = self._schema.get(tblname, {'columns': [], 'fkeys': [],
+                                            'unique': []})
         info = {'columns': [], 'column_names': {}, 'column_list': [], 
                 'relations': [], 'unique': [], 'self_relations': []}
-        sql = '''select column_name,data_type, column_default from
-                 INFORMATION_SCHEMA.COLUMNS where table_name = '%s' order
-                 by ordinal_position''' % tblname.lower()
-        cols = self._query(sql)
-        for c in cols:
+        for c in schema['columns']:
             info['column_list'].append(c[0])
             info['column_names'][c[0]] = len(info['columns'])
             info['columns'].append({'name': c[0], 'data_type': c[1],
                                     'default': c[2],
                                     'n': len(info['columns'])})
-        sql = '''SELECT kcu.column_name, ccu.table_name AS foreign_table_name,
-                 ccu.column_name AS foreign_column_name FROM 
-                 information_schema.table_constraints AS tc 
-                 JOIN information_schema.key_column_usage AS kcu ON 
-                 tc.constraint_name = kcu.constraint_name JOIN 
-                 information_schema.constraint_column_usage AS ccu ON 
-                 ccu.constraint_name = tc.constraint_name WHERE 
-                 constraint_type = 'FOREIGN KEY' and tc.table_name=%s'''
-        rels = self._query(sql, [tblname.lower()])
-        for r in rels:
+        for r in schema['fkeys']:
             rdata = {'column': r[0], 'foreign_table': r[1],
                      'foreign_column': r[2], 'n': info['column_names'][r[0]]}
-            if r[1] == tblname.lower():
+            if r[1] == tblname:
                 info['self_relations'].append(rdata)
             else:
                 info['relations'].append(rdata)
-                
-        sql = '''SELECT kcu.column_name FROM information_schema.table_constraints
-                 AS tc JOIN information_schema.key_column_usage AS kcu ON 
-                 tc.constraint_name = kcu.constraint_name WHERE 
-                 constraint_type = 'UNIQUE' and tc.table_name=%s'''
-        
-        ucols = self._query(sql, [tblname.lower()])
+        ucols = schema['unique']
         for u in ucols:
-            if u[0] == 'id_global' and len(ucols) > 1:
+            if u == 'id_global' and len(ucols) > 1:
                 continue
-            info['unique'].append({'column': u[0], 'n': info['column_names'][u[0]]})
+            info['unique'].append({'column': u, 'n': info['column_names'][u]})
         return info
 
     def _dbtype(self, fld):
         ''' Return the string of datatype to use for field. '''
+        if fld.codec:
+            return 'BYTEA'
         if fld.dbtype == DB_UNKNOWN:
             if fld.name == 'id_global':
                 return 'UUID'
@@ -191,17 +491,22 @@ class PgDatabase(DatabaseBase):
             return 'TEXT'
         return 'TEXT'
 
-    def _field_statement(self, fld):
-        ''' Returns the SQL statement to create a column within a table. '''
+    def _fk_statement(self, fld):
+        xtras = ['REFERENCES', fld.fk_table, "(%s)" % fld.fk_field]
+        if fld.fk_extra:
+            xtras.append(fld.fk_extra)
+        return ' '.join(xtras)
+
+    def _field_statement(self, fld, deferred = False):
+        ''' Returns the SQL statement to create a column within a table.
+            If deferred is True, UNIQUE and REFERENCES are left out. '''
         sql = "%s %s " % (fld.name, self._dbtype(fld))
         xtras = []
-        if fld.unique: xtras.append('UNIQUE')
+        if fld.unique and not deferred: xtras.append('UNIQUE')
         if fld.pkey: xtras.append('PRIMARY KEY')
         if not fld.null: xtras.append('NOT NULL')
-        if fld.has_fk:
-            xtras.extend(['REFERENCES', fld.fk_table, "(%s)" % fld.fk_field])
-            if fld.fk_extra:
-                xtras.append(fld.fk_extra)
+        if fld.has_fk and not deferred:
+            xtras.append(self._fk_statement(fld))
                 
         sql += ' '.join(xtras)
         return sql.strip()
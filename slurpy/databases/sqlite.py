@@ -1,36 +1,262 @@
 ''' Sqlite3 Database Class. '''
 
+import os
+import time
+import shutil
+import urllib
 import sqlite3
 
-from slurpy.database import DatabaseBase
+from slurpy.database import DatabaseBase, DB_UNKNOWN, DB_INTEGER, \
+                                              DB_SERIAL, DB_BIGINT
 
 class SqliteDatabase(DatabaseBase):
+    # Settings used when reading a catalog with readonly set: the size of
+    # the memory map in bytes and of the page cache in KiB.
+    READ_MMAP_SIZE = 256 * 1024 * 1024
+    READ_CACHE_KB = 64 * 1024
+
     def __init__(self, **kwargs):
         DatabaseBase.__init__(self, **kwargs)
         self.isolation_level = kwargs.get('isolation_level', None)
+        self.readonly = False
 
     ''' Sqlite3 Database class for Slurpy. '''
     def _connect(self, **kwargs):
+        ''' Besides dbname, readonly opens the database for reading only,
+            with a memory map of mmap_size bytes and a cache of cache_kb
+            KiB. immutable also tells SQLite the file can't change, so no
+            locks are taken; only use it for files nothing else writes. '''
         if not kwargs.has_key('dbname'):
             raise ValueError('No dbname supplied')
+        self.readonly = bool(kwargs.get('readonly', False))
         try:
-            self._db = sqlite3.connect(kwargs['dbname'], 
+            if self.readonly:
+                self._db = self._open_readonly(kwargs['dbname'],
+                                           kwargs.get('immutable', False))
+            else:
+                self._db = sqlite3.connect(kwargs['dbname'], 
                                     isolation_level = self.isolation_level)
             self._cursor = self._db.cursor()
+            if self.readonly:
+                for pragma in ['query_only=ON', 'mmap_size=%d' %
+                           kwargs.get('mmap_size', self.READ_MMAP_SIZE),
+                           'cache_size=-%d' % kwargs.get('cache_kb',
+                                                       self.READ_CACHE_KB)]:
+                    self._cursor.execute("PRAGMA %s" % pragma)
         except:
             return False
         self.connected = True
         return True
 
+    def _open_readonly(self, filename, immutable):
+        ''' Open using a file: URI with mode=ro. Versions of the sqlite3
+            module without URI support open the file normally, relying on
+            query_only. '''
+        if not os.path.exists(filename):
+            raise IOError('%s does not exist' % filename)
+        uri = 'file:%s?mode=ro%s' % (urllib.quote(os.path.abspath(filename)),
+                                     '&immutable=1' if immutable else '')
+        try:
+            return sqlite3.connect(uri, uri = True,
+                                   isolation_level = self.isolation_level)
+        except TypeError:
+            return sqlite3.connect(filename,
+                                   isolation_level = self.isolation_level)
+
     def _close(self):
         ''' Close an Sqlite connection. '''
         self._db.close()
         self.connected = False
         return True
 
+    def snapshot(self, filename):
+        ''' Write a consistent copy of the connected database to filename,
+            which must not exist. The online backup API is used if the
+            sqlite3 module has it, then VACUUM INTO, which needs SQLite
+            3.27, and otherwise the file is copied while a read lock is
+            held. Returns True or False. '''
+        if not self.connected or os.path.exists(filename):
+            return False
+        try:
+            if hasattr(self._db, 'backup'):
+                dest = sqlite3.connect(filename)
+                try:
+                    self._db.backup(dest)
+                finally:
+                    dest.close()
+            elif sqlite3.sqlite_version_info >= (3, 27, 0):
+                # query_only refuses VACUUM INTO, though it only writes
+                # the copy.
+                if self.readonly:
+                    self._cursor.execute("PRAGMA query_only=OFF")
+                try:
+                    self._cursor.execute("VACUUM INTO ?", [filename])
+                finally:
+                    if self.readonly:
+                        self._cursor.execute("PRAGMA query_only=ON")
+            else:
+                self._copy_locked(filename)
+        except (sqlite3.Error, IOError, OSError):
+            if os.path.exists(filename):
+                os.remove(filename)
+            return False
+        return True
+
+    def _copy_locked(self, filename):
+        main = [r[2] for r in self._query("PRAGMA database_list", [])
+                                                          if r[1] == 'main']
+        if not main or not main[0]:
+            raise IOError('Only databases in a file can be copied')
+        started = not self.in_transaction
+        if started:
+            self._cursor.execute("BEGIN")
+        try:
+            # Reading keeps a shared lock until the transaction ends, so
+            # the file can't be written while it is copied.
+            self._cursor.execute("select count(*) from sqlite_master")
+            self._cursor.fetchall()
+            shutil.copyfile(main[0], filename)
+        finally:
+            if started:
+                self._db.rollback()
+
+    def commit(self):
+        ''' Finish the transaction, commit any changes. '''
+        self._db.commit()
+        self.in_transaction = False
+
+    def rollback(self):
+        ''' Finish the transaction, discard all changes. '''
+        self._db.rollback()
+        self.in_transaction = False
+
     def _query(self, stmt, args):
         self._cursor.execute(stmt, args)
         return self._cursor.fetchall()
 
-#    def _insert(self, stmt, args):
-        
+    def _iter_query(self, stmt, args, size):
+        ''' Generator used by iter_query. A separate cursor is used so that
+            other queries can be run while iterating. '''
+        _cur = self._db.cursor()
+        try:
+            _cur.execute(stmt, args)
+            while True:
+                rows = _cur.fetchmany(size)
+                if not rows:
+                    break
+                for r in rows:
+                    yield r
+        finally:
+            _cur.close()
+
+    def _create(self, tbl, deferred = False):
+        ''' Create a table using the supplied DatabaseTable object. If
+            deferred is True, unique constraints are left for
+            _add_constraints. '''
+        flds = [self._field_statement(f, deferred) for f in tbl.fields]
+        if not deferred:
+            for n, idx in tbl.indexes.items():
+                flds.append("UNIQUE(%s)" % ', '.join(idx['names']))
+        return self._execute("CREATE TABLE IF NOT EXISTS %s (%s)" % (
+                                             tbl.name, ',\n'.join(flds)))
+
+    def _add_constraints(self, tbl, foreign):
+        ''' Unique constraints are added as unique indexes. Sqlite can't add
+            foreign keys to an existing table, and doesn't enforce them by
+            default, so they are skipped. '''
+        if foreign:
+            return True
+        uniq = [[f.name] for f in tbl.fields if f.unique]
+        uniq.extend([idx['names'] for n, idx in sorted(tbl.indexes.items())])
+        for cols in uniq:
+            sql = "CREATE UNIQUE INDEX IF NOT EXISTS %s_%s_key ON %s (%s)" % (
+                      tbl.name, '_'.join(cols), tbl.name, ', '.join(cols))
+            if not self._execute(sql):
+                return False
+        return True
+
+    def _field_statement(self, fld, deferred = False):
+        ''' Returns the SQL statement to create a column within a table.
+            Untyped columns are left untyped, as Lightroom does. '''
+        xtras = [fld.name]
+        if fld.codec:
+            xtras.append('BLOB')
+        elif fld.dbtype in [DB_INTEGER, DB_SERIAL, DB_BIGINT]:
+            xtras.append('INTEGER')
+        elif fld.dbtype != DB_UNKNOWN:
+            xtras.append('TEXT')
+        if fld.pkey: xtras.append('PRIMARY KEY')
+        if fld.unique and not deferred: xtras.append('UNIQUE')
+        # Parsed fields hold the NULL clause as a list of words.
+        if fld.null is False or \
+                   (isinstance(fld.null, list) and 'NOT' in fld.null):
+            xtras.append('NOT NULL')
+        if fld.has_fk and not deferred:
+            xtras.extend(['REFERENCES', fld.fk_table, "(%s)" % fld.fk_field])
+        return ' '.join(xtras)
+
+    def _execute(self, stmt, args = []):
+        try:
+            self._cursor.execute(stmt, args)
+        except sqlite3.Error:
+            return False
+        return True
+
+    def insert_row(self, tblname, cols, vals, theid = 'id_local'):
+        sql = "INSERT INTO %s (%s) VALUES (%s)" % (tblname, ','.join(cols),
+                                              ','.join(['?' for v in vals]))
+        start = time.time()
+        try:
+            self._cursor.execute(sql, vals)
+        except sqlite3.Error:
+            return None
+        finally:
+            self._sent(sql, vals, 1, start)
+        return self._cursor.lastrowid
+
+    def update_row(self, tblname, cols, vals, _id):
+        sql = "UPDATE %s SET %s WHERE id_local=?" % (tblname,
+                                       ','.join(['%s=?' % c for c in cols]))
+        args = list(vals) + [_id]
+        start = time.time()
+        try:
+            self._cursor.execute(sql, args)
+        except sqlite3.Error:
+            return None
+        finally:
+            self._sent(sql, args, 1, start)
+        return self._cursor.rowcount
+
+    def update_rows(self, tblname, cols, rows, ids):
+        ''' Update a batch of rows with executemany. If not every row was
+            found, they are updated again a row at a time to find which. '''
+        sql = "UPDATE %s SET %s WHERE id_local=?" % (tblname,
+                                       ','.join(['%s=?' % c for c in cols]))
+        args = [list(r) + [_id] for r, _id in zip(rows, ids)]
+        start = time.time()
+        try:
+            self._cursor.executemany(sql, args)
+        except sqlite3.Error:
+            return None
+        finally:
+            self._sent_many(sql, args, len(rows), start)
+        if self._cursor.rowcount == len(rows):
+            return list(ids)
+        return DatabaseBase.update_rows(self, tblname, cols, rows, ids)
+
+    def insert_rows(self, tblname, cols, rows, theid = 'id_local'):
+        ''' Insert a batch of rows. If ids are required they are collected
+            a row at a time, otherwise executemany is used. '''
+        if theid:
+            return DatabaseBase.insert_rows(self, tblname, cols, rows, theid)
+        sql = "INSERT INTO %s (%s) VALUES (%s)" % (tblname, ','.join(cols),
+                                              ','.join(['?' for c in cols]))
+        start = time.time()
+        try:
+            self._cursor.executemany(sql, rows)
+        except sqlite3.Error:
+            return None
+        finally:
+            self._sent_many(sql, rows, len(rows), start)
+        return []
+
@@ -0,0 +1,145 @@
+''' Row fingerprints, used to find rows that have changed since the last
+    import of a catalog. '''
+
+import hashlib
+
+def row_digest(row):
+    ''' Return a hex digest of the values in a row. '''
+    h = hashlib.md5()
+    for v in row:
+        if v is None:
+            h.update('\x00N')
+            continue
+        if isinstance(v, unicode):
+            v = v.encode('utf-8')
+        elif not isinstance(v, str):
+            v = str(v)
+        h.update('\x00V' + v)
+    return h.hexdigest()
+
+class Fingerprints(object):
+    ''' Stores a digest for every row moved from a catalog. Rows are keyed
+        by table name and id_local, or for tables without an id_local by
+        the digest itself (see next_key). Only entries changed since the
+        last load are written back by save.
+
+        During an import, new digests are staged and only recorded once
+        written is called, after the rows have been written. The keys of
+        rows seen are remembered, so once finish_table is called for a
+        table that was read in full, save removes the entries of rows that
+        are no longer in the catalog. '''
+
+    STORE_TABLE = 'slurpy_fingerprint'
+    STORE_COLUMNS = ['host', 'catalog', 'tblname', 'id_catalog', 'digest']
+    STORE_ROWS = 5000
+
+    def __init__(self):
+        self._digests = {}
+        self._dirty = {}
+        self._pending = []
+        self._seen = {}
+        self._counts = {}
+        self._finished = set()
+
+    def get_value(self, name, key):
+        ''' Return the digest recorded for a row, or None. '''
+        return self._digests.get(name.lower(), {}).get(str(key))
+
+    def set_value(self, name, key, digest):
+        name = name.lower()
+        self._digests.setdefault(name, {})[str(key)] = digest
+        self._dirty.setdefault(name, set()).add(str(key))
+
+    def next_key(self, name, digest):
+        ''' Key for a row of a table without id_local. Identical rows are
+            told apart by the number of them seen before in this import. '''
+        counts = self._counts.setdefault(name.lower(), {})
+        n = counts.get(digest, 0)
+        counts[digest] = n + 1
+        return digest if n == 0 else '%s:%d' % (digest, n)
+
+    def seen(self, name, key):
+        ''' Note that the row with key is still in the catalog. '''
+        self._seen.setdefault(name.lower(), set()).add(str(key))
+
+    def stage(self, name, key, digest):
+        ''' Hold a new digest until written is called. '''
+        self._pending.append((name, key, digest))
+
+    def written(self):
+        ''' Record the staged digests, as their rows have been written. '''
+        for name, key, digest in self._pending:
+            self.set_value(name, key, digest)
+        self._pending = []
+
+    def finish_table(self, name):
+        ''' Every row of a table has been seen, so entries for keys that
+            weren't are removed by save. '''
+        self._finished.add(name.lower())
+
+    def create_store(self, db):
+        ''' Create the table used to store fingerprints, if needed. '''
+        return db.execute("CREATE TABLE IF NOT EXISTS %s (host TEXT NOT NULL, "
+                          "catalog TEXT NOT NULL, tblname TEXT NOT NULL, "
+                          "id_catalog TEXT NOT NULL, digest TEXT NOT NULL)" %
+                                                          self.STORE_TABLE)
+
+    def drop_store(self, db):
+        ''' Remove all stored fingerprints. '''
+        return db.execute("DROP TABLE IF EXISTS %s" % self.STORE_TABLE)
+
+    def load(self, db, host, catalog):
+        ''' Load the fingerprints saved for the host and catalog. Returns
+            the number loaded. '''
+        if not self.create_store(db):
+            return 0
+        rows = db.iter_query("select tblname, id_catalog, digest from %s "
+                             "where host=? and catalog=?" % self.STORE_TABLE,
+                                                           [host, catalog])
+        n = 0
+        for name, key, digest in rows:
+            self._digests.setdefault(name, {})[key] = digest
+            n += 1
+        self._dirty = {}
+        return n
+
+    def save(self, db, host, catalog):
+        ''' Write fingerprints changed since the last load or save. Returns
+            True or False. '''
+        if not self.create_store(db):
+            return False
+        for name, keys in self._dirty.items():
+            keys = list(keys)
+            for n in xrange(0, len(keys), self.STORE_ROWS):
+                chunk = keys[n:n + self.STORE_ROWS]
+                sql = "delete from %s where host=? and catalog=? and " \
+                      "tblname=? and id_catalog in (%s)" % (self.STORE_TABLE,
+                                             ','.join(['?' for k in chunk]))
+                if not db.execute(sql, [host, catalog, name] + chunk):
+                    return False
+                rows = [[host, catalog, name, k, self._digests[name][k]]
+                                                              for k in chunk]
+                if db.insert_rows(self.STORE_TABLE, self.STORE_COLUMNS,
+                                                       rows, None) is None:
+                    return False
+        self._dirty = {}
+        for name in list(self._finished):
+            if not self._prune(db, host, catalog, name):
+                return False
+            self._finished.discard(name)
+        return True
+
+    def _prune(self, db, host, catalog, name):
+        ''' Remove the entries for rows of a table that were not seen. '''
+        digests = self._digests.get(name, {})
+        stale = list(set(digests.keys()) - self._seen.get(name, set()))
+        for n in xrange(0, len(stale), self.STORE_ROWS):
+            chunk = stale[n:n + self.STORE_ROWS]
+            sql = "delete from %s where host=? and catalog=? and " \
+                  "tblname=? and id_catalog in (%s)" % (self.STORE_TABLE,
+                                         ','.join(['?' for k in chunk]))
+            if not db.execute(sql, [host, catalog, name] + chunk):
+                return False
+        for k in stale:
+            del digests[k]
+        return True
@@ -0,0 +1,186 @@
+''' Import many catalogs into one server at the same time. '''
+
+import os
+import sys
+import time
+import argparse
+import traceback
+from multiprocessing import Pool
+
+from slurpy.codec import CODECS
+from slurpy.catalog import Catalog
+from slurpy.databases.postgres import PgDatabase
+
+def find_catalogs(paths):
+    ''' Return the sorted list of catalogs given by paths, which may be
+        catalog files or directories to search for them. '''
+    found = set()
+    for p in paths:
+        if os.path.isdir(p):
+            for root, dirs, files in os.walk(p):
+                for fn in files:
+                    if fn.lower().endswith('.lrcat'):
+                        found.add(os.path.abspath(os.path.join(root, fn)))
+        elif os.path.isfile(p):
+            found.add(os.path.abspath(p))
+    return sorted(found)
+
+def catalog_rows(catalog):
+    ''' Number of rows in the tables of a catalog that are imported. '''
+    n = 0
+    for name in catalog.ordered_table_list:
+        rv = catalog._catalog.query("select count(*) from %s" % name)
+        if rv:
+            n += rv[0][0]
+    return n
+
+def _import_one(args):
+    ''' Run in a worker process. Imports one catalog using its own
+        connection and returns (filename, ok, rows, seconds). '''
+    filename, db_kwargs, options = args
+    start = time.time()
+    ok = False
+    rows = 0
+    try:
+        c = Catalog(filename, readonly = True,
+                    snapshot = options.get('snapshot', False))
+        if c.get_schema_from_catalog(options.get('cache_dir')):
+            if options.get('compress'):
+                c.compress_fields(options['compress'])
+            rows = catalog_rows(c)
+            db = PgDatabase()
+            if db.connect(**db_kwargs):
+                ok = c.import_all(db, options.get('bulk', False), store = db,
+                                  differential = options.get('differential',
+                                                                   False),
+                                  checkpoint = options.get('checkpoint',
+                                                                   False),
+                                  pipeline = options.get('pipeline', False))
+                db.close()
+        c.close()
+    except Exception:
+        traceback.print_exc()
+    return filename, ok, rows, time.time() - start
+
+class CatalogIngest(object):
+    ''' Imports a list of catalogs using a pool of processes, each catalog
+        with its own connection. Catalogs are kept apart on the server by
+        their translations, which are keyed by host and filename. Writes to
+        tables shared between catalogs (Catalog.SHARED_TABLES), and to those
+        keyed on their rows (Catalog.LOCKED_TABLES), are serialised by the
+        database, so rows such as root folders are matched, on their
+        absolutePath and host, rather than duplicated, as are the folders
+        and files of a shared root folder. To keep that lock short, each
+        table is committed separately unless another commit policy is
+        given. With checkpoint, a catalog whose import failed resumes
+        from its last commit when ingested again. If compress names a
+        codec, Catalog.COMPRESSIBLE_FIELDS are stored compressed with it.
+        Catalogs are opened read only, and with snapshot each is copied
+        before it is read so catalogs in use are not held locked. With
+        pipeline, each catalog is read while it is written, see
+        ImportPipeline. '''
+
+    def __init__(self, filenames, db_kwargs, jobs = 4, bulk = False,
+                 differential = False, cache_dir = None, checkpoint = False,
+                 compress = None, snapshot = False, pipeline = False):
+        self.filenames = filenames
+        self.db_kwargs = dict(db_kwargs)
+        self.db_kwargs.setdefault('commit_policy', PgDatabase.COMMIT_TABLE)
+        self.jobs = jobs
+        self.options = {'bulk': bulk, 'differential': differential,
+                        'cache_dir': cache_dir, 'checkpoint': checkpoint,
+                        'compress': compress, 'snapshot': snapshot,
+                        'pipeline': pipeline}
+        self.results = []
+
+    def create_database(self):
+        ''' Create any missing tables, using the first catalog's schema,
+            before the workers start. '''
+        c = Catalog(self.filenames[0], readonly = True)
+        db = PgDatabase()
+        try:
+            if not c.get_schema_from_catalog(self.options['cache_dir']):
+                return False
+            if self.options['compress']:
+                c.compress_fields(self.options['compress'])
+            if not db.connect(**self.db_kwargs):
+                return False
+            return c.create_database(db)
+        finally:
+            db.close()
+            c.close()
+
+    def run(self, verbose = True):
+        ''' Import all the catalogs. Returns True if all were imported. '''
+        if not self.filenames:
+            return True
+        if not self.create_database():
+            return False
+        start = time.time()
+        pool = Pool(min(self.jobs, len(self.filenames)))
+        args = [(fn, self.db_kwargs, self.options) for fn in self.filenames]
+        try:
+            for res in pool.imap_unordered(_import_one, args):
+                self.results.append(res)
+                if verbose:
+                    filename, ok, rows, elapsed = res
+                    print "%-50s %8d rows %8.2fs%s" % (filename[-50:], rows,
+                                           elapsed, '' if ok else '  FAILED')
+        finally:
+            pool.close()
+            pool.join()
+        elapsed = time.time() - start
+        rows = sum([r[2] for r in self.results if r[1]])
+        if verbose:
+            print "%d catalogs, %d rows in %.2fs (%.0f rows/s) using %d " \
+                  "processes" % (len(self.results), rows, elapsed,
+                                 rows / max(elapsed, 0.001), self.jobs)
+        return all([r[1] for r in self.results])
+
+def command_line():
+    parser = argparse.ArgumentParser(description = 'Import many Lightroom '
+                                     'catalogs into a Slurpy database')
+    parser.add_argument('paths', nargs = '+',
+                        help = 'Catalogs, or directories containing them')
+    parser.add_argument('--config', default = '',
+                        help = 'Config file with the database settings, '
+                               'by default slurpy.conf in ~/.slurpy or the '
+                               'current directory')
+    parser.add_argument('--jobs', type = int, default = 4,
+                        help = 'Number of catalogs imported at once')
+    parser.add_argument('--bulk', action = 'store_true',
+                        help = 'Insert new rows in batches')
+    parser.add_argument('--differential', action = 'store_true',
+                        help = 'Only move rows changed since the last import')
+    parser.add_argument('--schema-cache', dest = 'cache_dir',
+                        help = 'Directory used to cache catalog schemas')
+    parser.add_argument('--compress', choices = sorted(CODECS.keys()),
+                        help = 'Store verbose text columns compressed')
+    parser.add_argument('--checkpoint', action = 'store_true',
+                        help = 'Save progress at each commit and resume '
+                               'imports that did not finish')
+    parser.add_argument('--snapshot', action = 'store_true',
+                        help = 'Copy each catalog before reading it, for '
+                               'catalogs open in Lightroom')
+    parser.add_argument('--pipeline', action = 'store_true',
+                        help = 'Read each catalog while writing it')
+    args = parser.parse_args()
+
+    from slurpy import Slurpy
+    from slurpy.core import find_config
+    config_filename = find_config(args.config)
+    if config_filename == '':
+        print "Unable to find a config file..."
+        sys.exit(1)
+    s = Slurpy()
+    if not s.read_config_file(config_filename) or \
+                                      not s.config.has_key('database'):
+        print "Unable to read database settings from %s" % config_filename
+        sys.exit(1)
+    filenames = find_catalogs(args.paths)
+    print "%d catalogs found" % len(filenames)
+    ingest = CatalogIngest(filenames, s.config['database'], args.jobs,
+                           args.bulk, args.differential, args.cache_dir,
+                           args.checkpoint, args.compress, args.snapshot,
+                           args.pipeline)
+    sys.exit(0 if ingest.run() else 1)
@@ -0,0 +1,105 @@
+''' Counters and timings collected while importing a catalog. '''
+
+import csv
+import json
+import time
+
+class TableMetrics(object):
+    ''' What happened to one table during an import. Rows are counted as
+        read from the catalog, skipped as unchanged, updated because the
+        id was already known, deduplicated when matched to an existing row
+        by a unique key, or inserted. Times are in seconds. '''
+
+    COUNTERS = ['rows_read', 'skipped', 'inserted', 'updated',
+                'deduplicated', 'queries']
+    TIMES = ['read', 'translate', 'check_unique', 'write', 'total']
+    FIELDS = ['table'] + COUNTERS + TIMES
+
+    def __init__(self, name):
+        self.table = name
+        for k in self.COUNTERS + self.TIMES:
+            setattr(self, k, 0)
+
+    def __repr__(self):
+        return u'%s: %d rows in %.2fs' % (self.table, self.rows_read,
+                                                             self.total)
+
+    def timed(self, name, func, *args):
+        ''' Call func, adding the time it takes to the time called name. '''
+        start = time.time()
+        rv = func(*args)
+        setattr(self, name, getattr(self, name) + time.time() - start)
+        return rv
+
+    def timed_rows(self, rows):
+        ''' Iterate over rows, counting them and the time spent reading. '''
+        it = iter(rows)
+        while True:
+            start = time.time()
+            try:
+                r = it.next()
+            except StopIteration:
+                self.read += time.time() - start
+                return
+            self.read += time.time() - start
+            self.rows_read += 1
+            yield r
+
+    def as_dict(self):
+        return dict([(k, getattr(self, k)) for k in self.FIELDS])
+
+class ImportMetrics(object):
+    ''' Metrics for a whole import, with one TableMetrics per table in the
+        order they were imported. '''
+
+    def __init__(self):
+        self.tables = []
+        self.ok = False
+        self.started = time.time()
+        self.elapsed = 0
+
+    def table(self, name):
+        ''' Start collecting metrics for a table. '''
+        tm = TableMetrics(name)
+        self.tables.append(tm)
+        return tm
+
+    def finish(self, ok):
+        self.ok = ok
+        self.elapsed = time.time() - self.started
+        return self
+
+    def totals(self):
+        ''' A TableMetrics holding the sum over all tables. '''
+        tm = TableMetrics('total')
+        for t in self.tables:
+            for k in TableMetrics.COUNTERS + TableMetrics.TIMES:
+                setattr(tm, k, getattr(tm, k) + getattr(t, k))
+        return tm
+
+    def as_dict(self):
+        return {'ok': self.ok, 'elapsed': self.elapsed,
+                'tables': [t.as_dict() for t in self.tables],
+                'totals': self.totals().as_dict()}
+
+    def write_json(self, filename):
+        with open(filename, 'w') as fh:
+            json.dump(self.as_dict(), fh, indent = 2)
+
+    def write_csv(self, filename):
+        ''' One row per table, followed by the totals. '''
+        with open(filename, 'wb') as fh:
+            writer = csv.writer(fh)
+            writer.writerow(TableMetrics.FIELDS)
+            for t in self.tables + [self.totals()]:
+                writer.writerow([getattr(t, k) for k in TableMetrics.FIELDS])
+
+    def report(self, top = 10):
+        ''' Print the tables that took longest. '''
+        print "%-32s %8s %8s %8s %8s %8s %8s" % ('table', 'rows', 'insert',
+                                 'update', 'dedup', 'queries', 'seconds')
+        tables = sorted(self.tables, key = lambda t: t.total, reverse = True)
+        for t in tables[:top] + [self.totals()]:
+            print "%-32s %8d %8d %8d %8d %8d %8.2f" % (t.table[:32],
+                        t.rows_read, t.inserted, t.updated, t.deduplicated,
+                                                      t.queries, t.total)
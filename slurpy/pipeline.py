@@ -0,0 +1,173 @@
+''' Import of a table with reading, translation and writing overlapped. '''
+
+import time
+import threading
+import traceback
+from Queue import Queue, Full, Empty
+
+from slurpy.metrics import TableMetrics
+from slurpy.fingerprint import row_digest
+
+class ImportPipeline(object):
+    ''' Moves tables the same way as DatabaseTable.move_data with bulk set,
+        but in three stages joined by queues, so the catalog is read and
+        rows translated while the server is busy writing. A reader thread
+        reads batches of rows using its own connection, from the source
+        function, a thread translates their links, and the calling thread
+        writes them. Each queue holds at most depth batches, so a stage
+        that gets ahead waits for the next rather than holding the table
+        in memory. The time each stage spent waiting is kept in waits.
+
+        Fingerprints are checked and recorded by the writer, so they only
+        change in the thread that commits. Tables that link to themselves
+        are moved a row at a time, without the pipeline, as a row may need
+        the id of one still being written. '''
+
+    BATCH_SIZE = 1000
+    DEPTH = 4
+    # How long a stage waits on a queue before checking for a stop.
+    POLL = 0.1
+
+    def __init__(self, source, batch_size = None, depth = None):
+        ''' source is a function returning a new connection to the
+            catalog, such as Catalog.open_source. '''
+        self.source = source
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.depth = depth or self.DEPTH
+        self.waits = {'read': 0, 'translate': 0, 'write': 0}
+        self._stop = threading.Event()
+        self._failed = False
+
+    def _put(self, q, item, stage):
+        ''' Put item on q, waiting while it is full. Returns False if the
+            pipeline was stopped first. '''
+        start = time.time()
+        try:
+            while not self._stop.is_set():
+                try:
+                    q.put(item, True, self.POLL)
+                    return True
+                except Full:
+                    pass
+            return False
+        finally:
+            self.waits[stage] += time.time() - start
+
+    def _get(self, q, stage):
+        ''' Get the next item from q, or None if the pipeline was stopped. '''
+        start = time.time()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return q.get(True, self.POLL)
+                except Empty:
+                    pass
+            return None
+        finally:
+            self.waits[stage] += time.time() - start
+
+    def _fail(self):
+        traceback.print_exc()
+        self._failed = True
+
+    def _read(self, tbl, checkpoint, out, m):
+        db = None
+        try:
+            db = self.source()
+            if db is None:
+                raise IOError('Unable to open the catalog')
+            batch = []
+            for r in m.timed_rows(tbl._checkpoint_rows(db, checkpoint)):
+                batch.append(r)
+                if len(batch) >= self.batch_size:
+                    if not self._put(out, batch, 'read'):
+                        return
+                    batch = []
+            if batch and not self._put(out, batch, 'read'):
+                return
+        except Exception:
+            self._fail()
+        finally:
+            if db is not None:
+                db.close()
+            # Marks the end of the rows, or a failure if _failed is set.
+            self._put(out, None, 'read')
+
+    def _translate(self, tbl, ids, prints, inq, out, m):
+        try:
+            while True:
+                batch = self._get(inq, 'translate')
+                if batch is None:
+                    break
+                if prints is not None:
+                    digests = [row_digest(r) for r in batch]
+                else:
+                    digests = [None] * len(batch)
+                rows = m.timed('translate', lambda: [tbl.update_row_links(r,
+                                                        ids) for r in batch])
+                if not self._put(out, zip(digests, rows), 'translate'):
+                    return
+        except Exception:
+            self._fail()
+        self._put(out, None, 'translate')
+
+    def _written(self, tbl, ids, prints, q, m):
+        ''' Generator over the batches to write, taken from q. Yields None
+            if an earlier stage failed. '''
+        while True:
+            batch = self._get(q, 'write')
+            if batch is None:
+                if self._failed:
+                    yield None
+                return
+            rows = []
+            for digest, r in batch:
+                if prints is not None and tbl.unchanged(ids, prints, r,
+                                                                   digest):
+                    m.skipped += 1
+                    continue
+                rows.append(r)
+            if rows:
+                yield rows
+
+    def move_data(self, tbl, ids, todb, prints = None, metrics = None,
+                                         checkpoint = None, blobs = None):
+        ''' Move the rows of a table, with the same arguments as
+            DatabaseTable.move_data. Returns True or False. '''
+        m = metrics or TableMetrics(tbl.name)
+        if tbl.self_referencing:
+            fromdb = self.source()
+            if fromdb is None:
+                return False
+            try:
+                return tbl.move_data(ids, fromdb, todb, prints = prints,
+                                     metrics = m, checkpoint = checkpoint,
+                                     blobs = blobs)
+            finally:
+                fromdb.close()
+        start = time.time()
+        queries = todb.statements
+        self._stop.clear()
+        self._failed = False
+        read = Queue(self.depth)
+        translated = Queue(self.depth)
+        threads = [threading.Thread(target = self._read,
+                                    args = (tbl, checkpoint, read, m)),
+                   threading.Thread(target = self._translate,
+                                    args = (tbl, ids, prints, read,
+                                            translated, m))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        try:
+            ok = tbl.move_batches(ids, todb, self._written(tbl, ids, prints,
+                                    translated, m), m, checkpoint, blobs,
+                                                                  prints)
+        finally:
+            # Lets the other stages finish if the writer stopped early.
+            self._stop.set()
+            for t in threads:
+                t.join()
+        m.total += time.time() - start
+        m.queries += todb.statements - queries
+        return ok and not self._failed
@@ -0,0 +1,108 @@
+''' Tracers that record the statements sent to a database. '''
+
+import re
+import threading
+from collections import deque
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%s|\$\d+|\?")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+def normalize_sql(statement):
+    ''' Reduce a statement to a template, with every literal and parameter
+        replaced by ? and lists of them by (...), so that statements that
+        differ only in their values are counted together. '''
+    sql = _STRING.sub('?', statement)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PARAM.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+class Tracer(object):
+    ''' The interface used by DatabaseBase.set_tracer. trace is called
+        once for every statement sent, with the rows it returned or wrote
+        and the time it took in seconds. '''
+
+    def trace(self, statement, args, rows, seconds):
+        pass
+
+class StatementStats(object):
+    ''' Totals for all the calls of one normalized statement. '''
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.args = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.slowest = 0.0
+
+    def __repr__(self):
+        return u'%d x %s' % (self.calls, self.sql)
+
+    @property
+    def mean(self):
+        return self.seconds / self.calls if self.calls else 0.0
+
+    def add(self, args, rows, seconds):
+        self.calls += 1
+        self.args += args
+        self.rows += rows
+        self.seconds += seconds
+        self.slowest = max(self.slowest, seconds)
+
+    def as_dict(self):
+        return {'sql': self.sql, 'calls': self.calls, 'args': self.args,
+                'rows': self.rows, 'seconds': self.seconds,
+                'mean': self.mean, 'slowest': self.slowest}
+
+class QueryProfiler(Tracer):
+    ''' Aggregates statements by their normalized SQL. If keep is given,
+        the last keep calls are also kept, as (statement, number of args,
+        rows, seconds). One profiler may be shared by several connections,
+        for example those of a DatabasePool. '''
+
+    def __init__(self, keep = 0):
+        self.stats = {}
+        self.calls = deque(maxlen = keep) if keep else None
+        self._lock = threading.Lock()
+
+    def trace(self, statement, args, rows, seconds):
+        nargs = len(args) if args else 0
+        sql = normalize_sql(statement)
+        with self._lock:
+            st = self.stats.get(sql)
+            if st is None:
+                st = self.stats[sql] = StatementStats(sql)
+            st.add(nargs, rows, seconds)
+            if self.calls is not None:
+                self.calls.append((statement, nargs, rows, seconds))
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+            if self.calls is not None:
+                self.calls.clear()
+
+    @property
+    def seconds(self):
+        return sum([st.seconds for st in self.stats.values()])
+
+    def top(self, n = 10, key = 'seconds'):
+        ''' The n statements with the largest key, which may be any
+            attribute of StatementStats such as seconds, calls or mean. '''
+        return sorted(self.stats.values(), key = lambda st: getattr(st, key),
+                                                       reverse = True)[:n]
+
+    def report(self, n = 10, key = 'seconds', width = 60):
+        ''' Print the n slowest statements. '''
+        total = self.seconds
+        print "%8s %8s %10s %9s %6s  %s" % ('calls', 'rows', 'seconds',
+                                        'mean ms', '%', 'statement')
+        for st in self.top(n, key):
+            print "%8d %8d %10.3f %9.3f %6.1f  %s" % (st.calls, st.rows,
+                      st.seconds, st.mean * 1000,
+                      100.0 * st.seconds / total if total else 0.0,
+                      st.sql[:width])
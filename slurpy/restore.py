@@ -0,0 +1,185 @@
+''' Rebuild a Lightroom catalog from the tables on a server. '''
+
+import os
+import time
+
+from slurpy.blobs import BlobStore
+from slurpy.codec import decompress_many, CodecStore
+from slurpy.databases.sqlite import SqliteDatabase
+
+class CatalogRestore(object):
+    ''' Writes the rows held on a server into a new catalog file. Tables
+        are created using the statements from a template catalog and each
+        is loaded with executemany in a single transaction. Indexes and
+        triggers are only created once all the data is present. Journalling
+        and syncing are switched off during the load, so a restore that
+        fails leaves nothing worth keeping and the file is removed. '''
+
+    BATCH_ROWS = 10000
+
+    def __init__(self, catalog, server, ids = None, batch_size = None):
+        ''' catalog is an open Catalog with its schema read, used as the
+            template. ids maps server ids back to catalog ids for each
+            table (see IdTranslator.reverse). If ids is None all rows are
+            restored with their server ids. '''
+        self.catalog = catalog
+        self.server = server
+        self.ids = ids
+        self.batch_size = batch_size or self.BATCH_ROWS
+        self.max_id = 0
+        self.timings = {}
+        self.blobs = BlobStore()
+        self.codecs = CodecStore()
+
+    def restore_row(self, tbl, flds, row):
+        ''' Return the row as it should be written to the catalog, or None
+            if it doesn't belong to the catalog being restored. '''
+        row = list(row)
+        for n in xrange(len(flds)):
+            fld = flds[n]
+            if row[n] is None:
+                continue
+            if fld.name == 'id_global':
+                # Postgres returns UUIDs in lower case, Lightroom uses upper.
+                row[n] = str(row[n]).upper()
+            elif self.ids is not None and fld.dependancy:
+                _id = self.ids.get_value(fld.dependancy, row[n])
+                if _id == -1:
+                    if not tbl.idlocal:
+                        return None
+                    _id = None
+                row[n] = _id
+        if tbl.idlocal:
+            if self.ids is not None:
+                _id = self.ids.get_value(tbl.name, row[0])
+                if _id == -1:
+                    return None
+                row[0] = _id
+            self.max_id = max(self.max_id, row[0])
+        return row
+
+    def expand_blobs(self, flds, rows):
+        ''' Replace the digests held by blob fields with their values. '''
+        for n in xrange(len(flds)):
+            if not flds[n].blob:
+                continue
+            vals = self.blobs.expand(self.server, [r[n] for r in rows])
+            for r, v in zip(rows, vals):
+                r[n] = v
+
+    def decompress(self, tbl, flds, rows):
+        ''' Decompress the values of fields stored with a codec, using
+            the codecs recorded on the server. '''
+        for n in xrange(len(flds)):
+            codec = self.codecs.codec(tbl, flds[n])
+            if not codec:
+                continue
+            vals = decompress_many(codec, [r[n] for r in rows])
+            for r, v in zip(rows, vals):
+                r[n] = v
+
+    def _insert(self, db, tbl, flds, rows):
+        self.expand_blobs(flds, rows)
+        self.decompress(tbl, flds, rows)
+        return db.insert_rows(tbl.name, [f.name for f in flds], rows,
+                                                        None) is not None
+
+    def restore_table(self, db, tbl):
+        ''' Copy the rows for a table. Returns the number restored, or -1
+            on failure. '''
+        flds = tbl.catalog_fields
+        db.start_transaction()
+        n = 0
+        batch = []
+        for r in tbl.iter_rows(self.server, True):
+            r = self.restore_row(tbl, flds, r)
+            if r is None:
+                continue
+            batch.append(r)
+            if len(batch) >= self.batch_size:
+                if not self._insert(db, tbl, flds, batch):
+                    db.rollback()
+                    return -1
+                n += len(batch)
+                batch = []
+        if batch:
+            if not self._insert(db, tbl, flds, batch):
+                db.rollback()
+                return -1
+            n += len(batch)
+        db.commit()
+        return n
+
+    def copy_excluded(self, db):
+        ''' Tables that aren't imported, such as the catalog variables, are
+            copied from the template. The entity counter is moved past the
+            highest id restored. '''
+        if not db.execute("ATTACH DATABASE ? AS template",
+                               [os.path.abspath(self.catalog.filename)]):
+            return False
+        present = [r[0] for r in db.query("select name from sqlite_master "
+                                                    "where type='table'")]
+        ok = True
+        for name in self.catalog.EXCLUDE_TABLES:
+            if not name in present:
+                continue
+            if not db.execute("insert into main.%s select * from template.%s" %
+                                                                 (name, name)):
+                ok = False
+                break
+        db.execute("DETACH DATABASE template")
+        if not ok:
+            return False
+        counter = max(self.catalog.entity_counter, float(self.max_id))
+        return db.execute("update Adobe_variablesTable set value=? where "
+                           "name=?", [counter, 'Adobe_entityIDCounter'])
+
+    def _run(self, db, verbose):
+        for pragma in ['synchronous=OFF', 'journal_mode=OFF']:
+            db.execute("PRAGMA %s" % pragma)
+        self.codecs.load(self.server)
+        if verbose and self.ids is not None:
+            for name, keys in sorted(self.ids.collisions.items()):
+                print "%s: %d rows were imported from more than one row, " \
+                      "only the first of each is restored" % (name, len(keys))
+        for sql in self.catalog.schema_statements('table'):
+            if not db.execute(sql):
+                return False
+        start = time.time()
+        for name in self.catalog.ordered_table_list:
+            _start = time.time()
+            n = self.restore_table(db, self.catalog.get_table(name))
+            self.timings[name] = time.time() - _start
+            if verbose:
+                print "%-40s %8d rows %8.2fs%s" % (name, max(n, 0),
+                               self.timings[name], '' if n != -1 else '  FAILED')
+            if n == -1:
+                return False
+        for kind in ['index', 'trigger']:
+            for sql in self.catalog.schema_statements(kind):
+                if not db.execute(sql):
+                    return False
+        if not self.copy_excluded(db):
+            return False
+        for pragma in ['synchronous=FULL', 'journal_mode=DELETE']:
+            db.execute("PRAGMA %s" % pragma)
+        if verbose:
+            print "%d tables restored in %.2fs" % (len(self.timings),
+                                                      time.time() - start)
+        return True
+
+    def run(self, filename, verbose = True):
+        ''' Restore into a new catalog file. An existing file is never
+            overwritten. Returns True or False. '''
+        if os.path.exists(filename):
+            return False
+        db = SqliteDatabase()
+        if not db.connect(dbname = filename):
+            return False
+        try:
+            ok = self._run(db, verbose)
+        finally:
+            db.close()
+        if not ok:
+            os.remove(filename)
+        return ok
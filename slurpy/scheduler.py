@@ -0,0 +1,136 @@
+''' Parallel import of catalog tables, driven by the dependancies between
+    them. '''
+
+import time
+import threading
+import traceback
+from Queue import Queue
+
+from slurpy.blobs import BlobStore
+from slurpy.databases.pool import DatabasePool
+
+class TableScheduler(object):
+    ''' Imports the tables of a catalog using a pool of worker threads,
+        each with its own connections. A table is started as soon as all
+        the tables it links to have been imported, so independent tables
+        are moved at the same time. Each table is committed when it has
+        been moved, and results holds whether it was. Writes to the
+        catalog's LOCKED_TABLES are locked against other imports. '''
+
+    def __init__(self, catalog, ids, workers = 4, bulk = False):
+        self.catalog = catalog
+        self.ids = ids
+        self.workers = workers
+        self.bulk = bulk
+        self.timings = {}
+        self.results = {}
+        self.deps = self.build_graph()
+
+    def build_graph(self):
+        ''' Return a dict of table name -> set of the names of the tables
+            it depends on. Links from a table to itself are ignored. '''
+        names = {}
+        for name in self.catalog.ordered_table_list:
+            names[name.lower()] = name
+        deps = {}
+        for name in self.catalog.ordered_table_list:
+            d = set()
+            for dep in self.catalog.get_table(name).dependancy_list():
+                _dep = names.get(dep['table'].lower())
+                if _dep and _dep != name:
+                    d.add(_dep)
+            deps[name] = d
+        return deps
+
+    def _worker(self, db, ready, results, pool = None):
+        if pool is not None:
+            db = pool.get()
+        src = self.catalog.open_source()
+        blobs = BlobStore() if self.catalog.has_blobs else None
+        connected = db is not None and src is not None
+        while True:
+            name = ready.get()
+            if name is None:
+                break
+            start = time.time()
+            ok = False
+            if connected:
+                db.start_transaction()
+                try:
+                    if name in self.catalog.LOCKED_TABLES and \
+                                                 not db.lock_table(name):
+                        raise IOError('Unable to lock %s' % name)
+                    ok = self.catalog.get_table(name).move_data(self.ids,
+                                      src, db, self.bulk, blobs = blobs)
+                except Exception:
+                    traceback.print_exc()
+                if ok:
+                    db.commit()
+                else:
+                    db.rollback()
+            results.put((name, ok, time.time() - start))
+        if src is not None:
+            src.close()
+        if pool is not None and db is not None:
+            pool.put(db)
+
+    def run(self, dbs, verbose = True):
+        ''' Import all tables using the supplied list of connected
+            databases, one per worker, or a DatabasePool that each worker
+            takes a connection from. Returns True if every table was
+            imported. '''
+        ready = Queue()
+        results = Queue()
+        pool = None
+        if isinstance(dbs, DatabasePool):
+            pool = dbs
+            dbs = [None] * len(pool)
+        # Translators are shared between the workers, so create them all
+        # now rather than from several threads at once.
+        for name in self.deps:
+            self.ids.get_translator(name)
+        threads = []
+        for db in dbs[:self.workers]:
+            t = threading.Thread(target = self._worker,
+                                 args = (db, ready, results, pool))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+
+        pending = dict([(k, set(v)) for k, v in self.deps.items()])
+        running = 0
+        ok = True
+        start = time.time()
+        while ok and (pending or running):
+            started = [n for n in self.catalog.ordered_table_list
+                                        if n in pending and not pending[n]]
+            if not started and not running:
+                # A cycle, so take the next table in the serial order.
+                started = [n for n in self.catalog.ordered_table_list
+                                                        if n in pending][:1]
+            for name in started:
+                del pending[name]
+                ready.put(name)
+                running += 1
+            name, ok, elapsed = results.get()
+            running -= 1
+            self.timings[name] = elapsed
+            self.results[name] = ok
+            if verbose:
+                print "%-40s %8.2fs%s" % (name, elapsed,
+                                               '' if ok else '  FAILED')
+            for d in pending.values():
+                d.discard(name)
+        while running:
+            name, _ok, elapsed = results.get()
+            running -= 1
+            self.timings[name] = elapsed
+            self.results[name] = _ok
+        for t in threads:
+            ready.put(None)
+        for t in threads:
+            t.join()
+        if verbose:
+            print "%d tables in %.2fs using %d workers" % (len(self.timings),
+                                     time.time() - start, len(threads))
+        return ok
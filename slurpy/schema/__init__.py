@@ -0,0 +1,25 @@
+''' Schema handling for Slurpy. '''
+
+import os
+import sys
+
+# Modules that can be used to parse SQL statements. Both provide
+# parse_column_statement, parse_table_statement and parse_index_statement.
+PARSERS = {'pyparsing': 'slurpy.schema.parser',
+           'tokenizer': 'slurpy.schema.tokenizer'}
+
+_parser = os.environ.get('SLURPY_PARSER', 'pyparsing')
+
+def set_parser(name):
+    ''' Select the parser used for SQL statements. '''
+    global _parser
+    if not PARSERS.has_key(name):
+        raise ValueError('Unknown parser %s' % name)
+    _parser = name
+
+def get_parser(name = None):
+    ''' Return the module used to parse SQL statements. The module is only
+        imported when first asked for. '''
+    module = PARSERS[name or _parser]
+    __import__(module)
+    return sys.modules[module]
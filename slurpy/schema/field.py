@@ -1,7 +1,7 @@
 ''' Base class for Slurpy database interfaces. '''
 import re
 
-from slurpy.schema.parser import parse_column_statement, parse_table_statement
+from slurpy.codec import compress
 
 # The types of field we need to know about. These are interpretted by each
 # database class.
@@ -35,7 +35,13 @@ class DatabaseField(object):
         self.fk_table = None
         self.fk_field = None
         self.fk_extra = None
+        self.dependancy = None
         self.slurpy = False
+        # Values are kept in the BlobStore and the field holds the digest.
+        self.blob = kwargs.get('blob', False)
+        # Name of the codec values are compressed with on the server (see
+        # slurpy.codec), or None.
+        self.codec = kwargs.get('codec', None)
         
     def __repr__(self):
         return u"%s" % self.name
@@ -59,13 +65,29 @@ class DatabaseField(object):
     def as_dict(self):
         basic = {'name': self.name, 'dbtype': self.dbtype, 'size': self.size,
                 'unique': self.unique, 'null': self.null, 
-                'default': self.default, 'pkey': self.pkey }
+                'default': self.default, 'pkey': self.pkey,
+                'slurpy': self.slurpy, 'dependancy': self.dependancy,
+                'blob': self.blob, 'codec': self.codec }
         if self.has_fk:
             basic['foreignkey'] = { 'table': self.fk_table, 
                                     'field': self.fk_field,
                                     'constraints': self.fk_extra }
         return basic
                  
+    def from_schema_dict(self, dd):
+        ''' Set the field up from a dict produced by as_dict. '''
+        self.name = dd['name']
+        for k in ['dbtype', 'size', 'unique', 'null', 'default', 'pkey',
+                  'slurpy', 'dependancy', 'blob', 'codec']:
+            if dd.has_key(k):
+                setattr(self, k, dd[k])
+        fk = dd.get('foreignkey')
+        if fk:
+            self.fk_table = fk['table']
+            self.fk_field = fk['field']
+            self.fk_extra = fk['constraints']
+        return True
+
     @property
     def has_fk(self): return bool(self.fk_table)
     
@@ -83,6 +105,8 @@ class DatabaseField(object):
         ''' Given a raw input, try and return the correct type for this field. '''
         if raw is None:
             return raw
+        if self.codec:
+            return compress(self.codec, raw)
         if self.dbtype in [DB_INTEGER, DB_BIGINT]:
             return int(raw)
         return str(raw) 
@@ -1,8 +1,12 @@
 ''' Class to represent a table within the Schema. '''
 
 import re
+import time
 
-from slurpy.schema.field import DatabaseField
+from slurpy.codec import compress_many
+from slurpy.schema.field import DatabaseField, DB_TEXT
+from slurpy.fingerprint import row_digest
+from slurpy.metrics import TableMetrics
 
 class DatabaseTable(object):
     def __init__(self, name = ''):
@@ -30,10 +34,29 @@ class DatabaseTable(object):
         ''' Only fields that are in the Lightroom Catalog. '''
         return filter(lambda x: not x.slurpy, self.fields)
 
+    @property
+    def blob_fields(self):
+        ''' Positions of the fields whose values go in the BlobStore. '''
+        return [n for n in xrange(len(self.fields)) if self.fields[n].blob]
+
+    @property
+    def codec_fields(self):
+        ''' Positions of the fields that are stored compressed. '''
+        return [n for n in xrange(len(self.fields)) if self.fields[n].codec]
+
     @property
     def has_unique(self):
         if self.idglobal != -1 or self.indexes or self.idlocal:
             return True
+        return any([f.unique for f in self.fields])
+
+    @property
+    def self_referencing(self):
+        ''' True if any field in the table links to another row of the
+            same table. '''
+        for f in self.fields:
+            if f.dependancy == self.name:
+                return True
         return False
 
     def from_dict(self, dd):
@@ -62,6 +85,9 @@ class DatabaseTable(object):
         self.columns[fld.name] = len(self.fields)
         self.fields.append(fld)
 
+    def add_index(self, idx):
+        self.add_indexes([idx])
+
     def add_indexes(self, idxs):
 #              [{'identifier': u'owningModule', 'unique': 'UNIQUE', 'tablename': u'AgSpecialSourceContent', 'name': u'index_AgSpecialSourceContent_sourceModule', 'columns': [u'source', u'owningModule']}]
         for i in idxs:
@@ -69,6 +95,27 @@ class DatabaseTable(object):
             ii['columns'] = [self.columns[n] for n in i['columns']]
             self.indexes[i['name']] = ii
 
+    def add_host_key(self, host):
+        ''' Keep the rows of a table shared between catalogs apart for
+            each host. A slurpy_host column holding host is added, and
+            columns that are unique on their own, such as a path, become
+            unique for each host instead. '''
+        if not self.has_field('slurpy_host'):
+            keys = []
+            for f in self.fields:
+                if f.unique and not f.pkey and f.name != 'id_global':
+                    f.unique = False
+                    keys.append(f.name)
+            fld = DatabaseField('slurpy_host', DB_TEXT)
+            fld.slurpy = True
+            self.add_field(fld)
+            for n in keys:
+                self.add_index({'name': '%s_%s_host' % (self.name, n),
+                                'columns': [n, 'slurpy_host']})
+        # Catalogs don't have the column, so rows read from them are given
+        # this value (see catalog_rows).
+        self.get_field('slurpy_host').default = host
+
     def has_field(self, identifier):
         for f in self.fields:
             if f.name == identifier:
@@ -82,10 +129,25 @@ class DatabaseTable(object):
         return False
 
     def as_schema_dict(self):
-        rdata = {'name': self.name, 'fields': [], 'indexes': self.indexes}
+        rdata = {'name': self.name, 'fields': [], 'indexes': self.indexes,
+                 'temp': self.temp, 'exists': self.exists,
+                 'slurpy': self.slurpy}
         for f in self.fields:
             rdata['fields'].append(f.as_dict())
         return rdata
+
+    def from_schema_dict(self, dd):
+        ''' Set the table up from a dict produced by as_schema_dict. '''
+        self.name = dd['name']
+        for k in ['temp', 'exists', 'slurpy']:
+            setattr(self, k, dd.get(k, False))
+        for fd in dd['fields']:
+            _fld = DatabaseField()
+            if not _fld.from_schema_dict(fd):
+                return False
+            self.add_field(_fld)
+        self.indexes = dd.get('indexes', {})
+        return True
         
     def fk_list(self):
         ''' Return a list of dependancies for this table. '''
@@ -95,6 +157,15 @@ class DatabaseTable(object):
                 dlist.append({'table': f.fk_table, 'field': f.name})
         return dlist
 
+    def dependancy_list(self):
+        ''' Return a list of the tables this table links to, either by a
+            foreign key or an id translation. '''
+        dlist = self.fk_list()
+        for f in self.fields:
+            if f.dependancy and not f.has_fk:
+                dlist.append({'table': f.dependancy, 'field': f.name})
+        return dlist
+
     # todo - add check for slurpy fields...
     def get_all_rows(self, db, is_catalog = False):
         ''' Simple query to get all rows from this table in the supplied
@@ -103,6 +174,29 @@ class DatabaseTable(object):
         return db.query("select %s from %s" % (
                               ','.join([f.name for f in flds]), self.name))
 
+    def iter_rows(self, db, is_catalog = False, after = None):
+        ''' As get_all_rows, but returns an iterator that fetches the rows
+            in chunks, so memory use doesn't depend on the table size. If
+            after is given, only rows with a larger id_local are returned,
+            in id_local order. '''
+        flds = self.catalog_fields if is_catalog else self.all_fields
+        sql = "select %s from %s" % (','.join([f.name for f in flds]),
+                                                                 self.name)
+        if after is None or not self.idlocal:
+            return db.iter_query(sql)
+        return db.iter_query(sql + " where id_local > ? order by id_local",
+                                                                  [after])
+
+    def catalog_rows(self, db, after = None):
+        ''' As iter_rows, for a catalog. Catalogs don't have the slurpy
+            fields, which come last, so their default values are added to
+            each row. '''
+        rows = self.iter_rows(db, True, after)
+        extra = [f.default for f in self.fields if f.slurpy]
+        if not extra:
+            return rows
+        return (list(r) + extra for r in rows)
+
     def select_first(self, db, cols, args):
         ''' Select query on supplied database to get the first field,
             using the cols and args supplied as where clauses. '''
@@ -116,16 +210,33 @@ class DatabaseTable(object):
         args = self.get_row_values(cols, row)     
         return db.insert_row(self.name, cols, args)
     
+    def insert_many(self, db, rows):
+        ''' Insert a batch of rows, returning the list of new ids in the
+            same order as rows, or None on failure. '''
+        fld_list = self.fields[1:] if self.idlocal else self.fields
+        cols =  ["%s" % f.name for f in fld_list]
+        args = [self.get_row_values(cols, r) for r in rows]
+        return db.insert_rows(self.name, cols, args,
+                                        'id_local' if self.idlocal else None)
+
     def update(self, db, row, local):
-        if self.idlocal:
-            cols =  ["%s" % f.name for f in self.fields[1:]]
-            sql = "update %s set %s where id_local=?" % (self.name,
-                                      ','.join(["%s=?" % f for f in cols]))
-        # otherwise???
-        args = self.get_row_values(cols, row)
-        args.append(local)
-        ck = db.execute(sql, args)
-        return bool(ck)
+        ''' Update the row with id_local local. Returns the number of rows
+            updated, or None on failure. Rows of tables without id_local
+            can't be told apart, so are left as they are. '''
+        if not self.idlocal:
+            return 1
+        cols =  ["%s" % f.name for f in self.fields[1:]]
+        return db.update_row(self.name, cols, self.get_row_values(cols, row),
+                                                                     local)
+
+    def update_many(self, db, rows, localids):
+        ''' Update a batch of rows, returning the list of localids that
+            were updated, or None on failure. '''
+        if not self.idlocal:
+            return list(localids)
+        cols =  ["%s" % f.name for f in self.fields[1:]]
+        return db.update_rows(self.name, cols, [self.get_row_values(cols, r)
+                                                for r in rows], localids)
 
     def get_row_values(self, cols, row):
         vals = []
@@ -146,13 +257,8 @@ class DatabaseTable(object):
         ''' If we have some way of checking if the row is already listed in
             the database, check using it now. Return -1 if no match, or the
             id_local of the matching row (0 if no id_local field). '''
-        for k,cols in self.indexes.items():
-            ck = self._check_unique(db, cols['names'], 
-                                   self.get_row_values(cols['names'], row))
-            if ck != -1:
-                return ck
-        if self.idglobal != -1:
-            ck = self._check_unique(db, ['id_global'], [row[self.idglobal]])
+        for cols in self._unique_keys():
+            ck = self._check_unique(db, cols, self.get_row_values(cols, row))
             if ck != -1:
                 return ck
         if self.idlocal:
@@ -171,27 +277,431 @@ class DatabaseTable(object):
                 rv.append(row[n])
         return rv
         
-    def move_data(self, ids, fromdb, todb):
-        ''' Copy data between databases. '''
-        _in = self.get_all_rows(fromdb)
-
-        for r in _in:
-            r = self.update_row_links(r, ids)
-            if self.has_unique:
-                ck = self.check_unique(r, todb, ids.get_value(self.name, r[0]))
-                if ck != -1:
-                    # update our lookup table...
-                    ids.set_value(self.name, r[0], ck) 
-                    self.update(todb, r, ck)
+    def store_blobs(self, db, blobs, rows):
+        ''' Put the values of the blob fields of rows in blobs, replacing
+            them with their digests. Returns True or False. '''
+        for n in self.blob_fields:
+            digests = blobs.put_many(db, [r[n] for r in rows])
+            if digests is None:
+                return False
+            for r, d in zip(rows, digests):
+                r[n] = d
+        return True
+
+    def _blobs(self, db, blobs, rows, m):
+        if blobs is None or not self.blob_fields:
+            return True
+        return m.timed('write', self.store_blobs, db, blobs, rows)
+
+    def compress_rows(self, rows):
+        ''' Compress the values of codec fields in a batch of rows, using
+            the codec thread pool. Single rows are compressed as their
+            values are written. '''
+        for n in self.codec_fields:
+            vals = compress_many(self.fields[n].codec, [r[n] for r in rows])
+            for r, v in zip(rows, vals):
+                r[n] = v
+
+    def unchanged(self, ids, prints, row, digest = None):
+        ''' Returns True if the row was moved by an earlier import and has
+            not changed since. Otherwise the new fingerprint is staged in
+            prints, to be recorded once the row has been written, and False
+            is returned. digest is the row's fingerprint, if it has already
+            been worked out. '''
+        if digest is None:
+            digest = row_digest(row)
+        key = row[0] if self.idlocal else prints.next_key(self.name, digest)
+        prints.seen(self.name, key)
+        if prints.get_value(self.name, key) == digest:
+            if not self.idlocal or self.known_id(ids, row) != -1:
+                return True
+        prints.stage(self.name, key, digest)
+        return False
+
+    def move_data(self, ids, fromdb, todb, bulk = False, batch_size = 1000,
+                          prints = None, metrics = None, checkpoint = None,
+                                                             blobs = None):
+        ''' Copy data between databases. If bulk is True, rows that need
+            inserting are written batch_size at a time and the whole table
+            is moved in a single transaction. If a Fingerprints object is
+            supplied as prints, only rows that have changed since it was
+            recorded are moved. If a TableMetrics object is supplied, the
+            counts and timings for the table are added to it. If a
+            Checkpoint is supplied, rows are moved in id_local order,
+            starting after the last one it records, and it is kept up to
+            date as rows are written. If a BlobStore is supplied, the
+            values of blob fields are written to it and the rows hold
+            their digests. '''
+        m = metrics or TableMetrics(self.name)
+        start = time.time()
+        queries = todb.statements
+        if bulk and not self.self_referencing:
+            ok = self._move_data_bulk(ids, fromdb, todb, batch_size, prints, m,
+                                                          checkpoint, blobs)
+        else:
+            ok = self._move_data(ids, fromdb, todb, prints, m, checkpoint,
+                                                                     blobs)
+        m.total += time.time() - start
+        m.queries += todb.statements - queries
+        return ok
+
+    def _checkpoint_rows(self, fromdb, checkpoint):
+        if checkpoint is None:
+            return self.catalog_rows(fromdb)
+        return self.catalog_rows(fromdb, checkpoint.last_id(self.name) or 0)
+
+    def _move_data(self, ids, fromdb, todb, prints, m, checkpoint = None,
+                                                             blobs = None):
+        for r in m.timed_rows(self._checkpoint_rows(fromdb, checkpoint)):
+            if prints is not None and self.unchanged(ids, prints, r):
+                m.skipped += 1
+                continue
+            r = m.timed('translate', self.update_row_links, r, ids)
+            if not self._blobs(todb, blobs, [r], m):
+                return False
+            if not self._move_row(ids, todb, r, m):
+                return False
+            if prints is not None:
+                prints.written()
+            if checkpoint is not None and self.idlocal:
+                checkpoint.set_progress(self.name, r[0])
+            if not todb.row_written():
+                return False
+        return True
+
+    def _move_row(self, ids, todb, r, m):
+        ''' Write one row, returning True or False. '''
+        known = self.known_id(ids, r)
+        if known != -1:
+            # Mapped by a previous import, so no need to look for it,
+            # unless the row has gone from the server since.
+            n = m.timed('write', self.update, todb, r, known)
+            if n is None:
+                return False
+            if n:
+                m.updated += 1
+                return True
+        if self.has_unique:
+            ck = m.timed('check_unique', self.check_unique, r, todb,
+                                          ids.get_value(self.name, r[0]))
+            if ck != -1:
+                # update our lookup table...
+                ids.set_value(self.name, r[0], ck) 
+                if m.timed('write', self.update, todb, r, ck) is None:
+                    return False
+                m.deduplicated += 1
+                return True
+        # This point is only reached if the record does not appear to
+        # exist, so we need to insert it.
+        newid = m.timed('write', self.insert, todb, r)
+        if newid is None:
+            return False
+        m.inserted += 1
+        if self.idlocal:
+            ids.set_value(self.name, r[0], newid)
+        return True
+
+    def known_id(self, ids, row):
+        ''' Return the id the row was given by a previous import, or -1 if
+            it isn't known. Only tables with id_local can be mapped. '''
+        if not self.idlocal:
+            return -1
+        _id = ids.get_value(self.name, row[0])
+        if _id is None or _id <= 0:
+            return -1
+        return _id
+
+    @property
+    def stage_name(self):
+        return 'slurpy_stage_%s' % self.name
+
+    def _stage_columns(self):
+        ''' Return a list of (source, staging) column names needed to check
+            uniqueness of rows using a staging table. '''
+        cols = []
+        for key in self._unique_keys():
+            for n in key:
+                if not (n, n) in cols:
+                    cols.append((n, n))
+        if self.idlocal:
+            cols.append(('id_local', 'slurpy_local'))
+        return cols
+
+    def create_stage(self, db):
+        ''' Create the temporary staging table used by check_unique_batch.
+            Column types are copied from the table itself. '''
+        db.execute("drop table if exists %s" % self.stage_name)
+        sql = "create temp table %s as select 0 as slurpy_row, %s from %s " \
+              "limit 0" % (self.stage_name, ','.join(["%s as %s" % c
+                                  for c in self._stage_columns()]), self.name)
+        return db.execute(sql)
+
+    def drop_stage(self, db):
+        return db.execute("drop table if exists %s" % self.stage_name)
+
+    def _stage_joins(self):
+        ''' Return the list of join conditions, in the same order of
+            preference that check_unique uses. '''
+        joins = []
+        for key in self._unique_keys():
+            joins.append(' and '.join(["s.%s=t.%s" % (n, n) for n in key]))
+        if self.idlocal:
+            joins.append("s.slurpy_local=t.id_local")
+        return joins
+
+    def check_unique_batch(self, rows, db, localids):
+        ''' Set based version of check_unique. The rows are copied into the
+            staging table and matched using one join per unique key, so the
+            number of queries doesn't depend on the number of rows. Returns
+            a list containing -1 or the matching id for each row. The
+            staging table must have been created with create_stage. '''
+        cols = self._stage_columns()
+        vals = []
+        for n in xrange(len(rows)):
+            row = rows[n]
+            v = [n]
+            for src, dst in cols:
+                if src == 'id_local':
+                    v.append(localids[n])
+                else:
+                    v.append(self.get_row_values([src], row)[0])
+            vals.append(v)
+        if not db.execute("delete from %s" % self.stage_name):
+            return None
+        if db.insert_rows(self.stage_name, ['slurpy_row'] +
+                                  [c[1] for c in cols], vals, None) is None:
+            return None
+        found = [-1] * len(rows)
+        for join in self._stage_joins():
+            sql = "select s.slurpy_row, t.%s from %s s join %s t on %s" % (
+                           self.fields[0].name, self.stage_name, self.name, join)
+            for n, _id in db.query(sql):
+                if found[n] == -1:
+                    found[n] = _id if self.idlocal else 0
+        return found
+
+    def _process_batch(self, ids, db, rows, m, checkpoint = None,
+                                                             blobs = None):
+        ''' Check a batch of rows for existing entries, updating those that
+            are found and inserting the rest. '''
+        if not self._blobs(db, blobs, rows, m):
+            return False
+        if self.codec_fields:
+            m.timed('write', self.compress_rows, rows)
+        if not self._write_batch(ids, db, rows, m):
+            return False
+        if checkpoint is not None and self.idlocal:
+            checkpoint.set_progress(self.name, rows[-1][0])
+        return db.row_written(len(rows))
+
+    def _unique_keys(self):
+        ''' The columns of each key rows are matched on, other than
+            id_local, in the order check_unique tries them: the unique
+            indexes, id_global, then any other column that is unique. '''
+        keys = [idx['names'] for k, idx in self.indexes.items()]
+        if self.idglobal != -1:
+            keys.append(['id_global'])
+        for f in self.fields:
+            if f.unique and not f.pkey and not [f.name] in keys:
+                keys.append([f.name])
+        return keys
+
+    def dedupe_batch(self, rows):
+        ''' Find rows that share a unique key with an earlier row of the
+            same batch. Returns a list holding, for each row, -1 or the
+            position of the earlier row it matches. Keys with a NULL value
+            never match, as for a UNIQUE constraint. '''
+        keys = self._unique_keys()
+        seen = [{} for k in keys]
+        rv = []
+        for n in xrange(len(rows)):
+            vals = [tuple(self.get_row_values(cols, rows[n])) for cols in keys]
+            first = -1
+            for s, v in zip(seen, vals):
+                if not None in v and s.has_key(v):
+                    first = s[v]
+                    break
+            # A row matching an earlier one updates it, so the earlier row
+            # now also has this row's keys.
+            for s, v in zip(seen, vals):
+                if not None in v:
+                    s.setdefault(v, n if first == -1 else first)
+            rv.append(first)
+        return rv
+
+    def _update_batch(self, db, pairs, m):
+        ''' pairs is a list of (row, id). Returns the rows whose id has no
+            row on the server, or None on failure. '''
+        if not pairs:
+            return []
+        done = m.timed('write', self.update_many, db, [p[0] for p in pairs],
+                                                      [p[1] for p in pairs])
+        if done is None:
+            return None
+        done = set(done)
+        return [r for r, _id in pairs if not _id in done]
+
+    def _write_batch(self, ids, db, rows, m):
+        pending = []
+        known = []
+        for r in rows:
+            _id = self.known_id(ids, r)
+            if _id == -1:
+                pending.append(r)
+            else:
+                known.append((r, _id))
+        # Rows whose stored id has gone from the server, for instance
+        # because it was recreated, are looked for as if they were new.
+        missed = self._update_batch(db, known, m)
+        if missed is None:
+            return False
+        m.updated += len(known) - len(missed)
+        rows = pending + missed
+        if self.has_unique and rows:
+            found = m.timed('check_unique', self.check_unique_batch, rows, db,
+                              [ids.get_value(self.name, r[0]) for r in rows])
+            if found is None:
+                return False
+            pending = []
+            matched = []
+            for r, ck in zip(rows, found):
+                if ck == -1:
+                    pending.append(r)
                     continue
-            # This point is only reached if the record does not appear to
-            # exist, so we need to insert it.
-            newid = self.insert(todb, r)
-            if self.idlocal:
+                ids.set_value(self.name, r[0], ck)
+                matched.append((r, ck))
+            missed = self._update_batch(db, matched, m)
+            if missed is None:
+                return False
+            m.deduplicated += len(matched) - len(missed)
+            rows = pending + missed
+        if not rows:
+            return True
+        # Rows repeating a key of an earlier row in the batch would break
+        # the insert, so they update the earlier row once it is inserted,
+        # as they would a row at a time.
+        first = self.dedupe_batch(rows) if self.has_unique else \
+                                                         [-1] * len(rows)
+        new = [r for r, f in zip(rows, first) if f == -1]
+        newids = m.timed('write', self.insert_many, db, new)
+        if newids is None:
+            return False
+        m.inserted += len(new)
+        if self.idlocal:
+            for r, newid in zip(new, newids):
                 ids.set_value(self.name, r[0], newid)
-            
+        dups = []
+        for r, f in zip(rows, first):
+            if f != -1:
+                _id = 0
+                if self.idlocal:
+                    _id = ids.get_value(self.name, rows[f][0])
+                    ids.set_value(self.name, r[0], _id)
+                dups.append((r, _id))
+        if self._update_batch(db, dups, m) is None:
+            return False
+        m.deduplicated += len(dups)
         return True
 
+    def _move_data_bulk(self, ids, fromdb, todb, batch_size, prints, m,
+                                           checkpoint = None, blobs = None):
+        ''' Bulk version of move_data. Rows are collected into batches which
+            are checked for uniqueness and inserted together. Tables that
+            link to themselves can't use this, as a row may need the id of
+            one still waiting in the batch. '''
+        batches = self._batches(ids, m.timed_rows(self._checkpoint_rows(
+                                fromdb, checkpoint)), batch_size, prints, m)
+        return self.move_batches(ids, todb, batches, m, checkpoint, blobs,
+                                                                   prints)
+
+    def _batches(self, ids, rows, batch_size, prints, m):
+        ''' Generator over lists of batch_size translated rows. '''
+        batch = []
+        for r in rows:
+            if prints is not None and self.unchanged(ids, prints, r):
+                m.skipped += 1
+                continue
+            batch.append(m.timed('translate', self.update_row_links, r, ids))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def move_batches(self, ids, todb, batches, m, checkpoint = None,
+                                              blobs = None, prints = None):
+        ''' Write batches of translated rows, in a transaction of their own
+            unless one has already been started. A batch of None stops the
+            move, which then fails. The fingerprints staged in prints are
+            recorded after each batch is written. '''
+        started = not todb.in_transaction
+        if started:
+            todb.start_transaction()
+        if self.has_unique and not self.create_stage(todb):
+            if started:
+                todb.rollback()
+            return False
+        ok = True
+        for batch in batches:
+            ok = batch is not None and self._process_batch(ids, todb, batch,
+                                                      m, checkpoint, blobs)
+            if not ok:
+                break
+            if prints is not None:
+                prints.written()
+        if ok and self.has_unique:
+            self.drop_stage(todb)
+        if started:
+            if ok:
+                todb.commit()
+            else:
+                todb.rollback()
+        return ok
+
+    def load_data(self, ids, fromdb, todb, batch_size = 1000,
+                                            metrics = None, blobs = None):
+        ''' Copy data into an empty table, as done by the initial load. As
+            nothing can already exist, rows are inserted without any of the
+            checks move_data makes. Tables that link to themselves are
+            inserted a row at a time, so links to earlier rows can be
+            translated. Returns the number of rows, or -1 on failure. '''
+        m = metrics or TableMetrics(self.name)
+        start = time.time()
+        queries = todb.statements
+        if self.self_referencing:
+            batch_size = 1
+        n = 0
+        batch = []
+        for r in m.timed_rows(self.catalog_rows(fromdb)):
+            batch.append(m.timed('translate', self.update_row_links, r, ids))
+            if len(batch) < batch_size:
+                continue
+            if not self._load_batch(ids, todb, batch, m, blobs):
+                return -1
+            n += len(batch)
+            batch = []
+        if batch:
+            if not self._load_batch(ids, todb, batch, m, blobs):
+                return -1
+            n += len(batch)
+        m.total += time.time() - start
+        m.queries += todb.statements - queries
+        return n
+
+    def _load_batch(self, ids, db, rows, m, blobs = None):
+        if not self._blobs(db, blobs, rows, m):
+            return False
+        if self.codec_fields:
+            m.timed('write', self.compress_rows, rows)
+        newids = m.timed('write', self.insert_many, db, rows)
+        if newids is None:
+            return False
+        m.inserted += len(rows)
+        if self.idlocal:
+            for r, newid in zip(rows, newids):
+                ids.set_value(self.name, r[0], newid)
+        return db.row_written(len(rows))
+
     def get_id_by_field(self, db, fld, value):
         ''' Get id_local from the database table. Return -1 if not available. '''
         sql = "select id_local from %s where %s=?" % (self.name, fld)
@@ -212,9 +722,12 @@ class DatabaseTable(object):
         ck = db.query(sql, [gid])
         return bool(ck)
 
+    def count(self, db):
+        ''' Number of rows in the table in database. '''
+        rv = db.query("select count(*) from %s" % self.name)
+        return rv[0][0] if rv else 0
+
     def stats(self, db):
         ''' Statistics for the table in database. '''
-        rows = self.get_all_rows(db)
-        print self.name, rows
-        return {'rows': len(rows)}
+        return {'rows': self.count(db)}
 
@@ -0,0 +1,226 @@
+''' Hand written parser for the subset of SQL used by Lightroom to create
+    tables and indexes. This is a faster alternative to the pyparsing
+    grammar in slurpy.schema.parser, and returns the same dicts. Failure
+    returns an empty dict.
+
+    Unlike the pyparsing grammar, the column list of a table is split
+    while tokenizing, so commas inside brackets or quoted defaults don't
+    split a column, signed numbers and escaped quotes are understood in
+    defaults, and table constraints are not mistaken for columns.
+'''
+import re
+
+_token_re = re.compile(r'''\s*(?:
+    (?P<quoted>'(?:[^']|'')*') |
+    (?P<number>[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?) |
+    (?P<word>[A-Za-z_][A-Za-z0-9_$]*) |
+    (?P<dquoted>"(?:[^"]|"")*") |
+    (?P<punct>[(),;]) |
+    (?P<other>\S)
+    )''', re.VERBOSE)
+
+COLUMN_TYPES = ['INTEGER', 'TEXT', 'SERIAL', 'UUID', 'VARCHAR']
+TABLE_CONSTRAINTS = ['CONSTRAINT', 'PRIMARY', 'UNIQUE', 'CHECK', 'FOREIGN']
+
+def tokenize(stmt):
+    ''' Split a statement into a list of (kind, value) tuples. Words are
+        returned as written, quoted strings without their quotes. '''
+    tokens = []
+    pos = 0
+    end = len(stmt.rstrip())
+    while pos < end:
+        m = _token_re.match(stmt, pos)
+        if not m:
+            break
+        pos = m.end()
+        kind = m.lastgroup
+        val = m.group(kind)
+        if kind == 'quoted':
+            val = val[1:-1].replace("''", "'")
+        elif kind == 'dquoted':
+            kind, val = 'word', val[1:-1].replace('""', '"')
+        tokens.append((kind, val))
+    return tokens
+
+class _Tokens(object):
+    ''' Simple cursor over a list of tokens. '''
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset = 0):
+        n = self.pos + offset
+        if n < len(self.tokens):
+            return self.tokens[n]
+        return (None, None)
+
+    def next(self):
+        tok = self.peek()
+        self.pos += 1
+        return tok
+
+    def keyword(self, *words):
+        ''' If the next tokens are the words supplied (in any case), consume
+            them and return True. '''
+        for n in xrange(len(words)):
+            kind, val = self.peek(n)
+            if kind != 'word' or val.upper() != words[n]:
+                return False
+        self.pos += len(words)
+        return True
+
+    def word(self):
+        kind, val = self.peek()
+        if kind != 'word':
+            return None
+        self.pos += 1
+        return val
+
+    def punct(self, char):
+        kind, val = self.peek()
+        if kind == 'punct' and val == char:
+            self.pos += 1
+            return True
+        return False
+
+def _split_columns(tokens):
+    ''' Split the tokens between brackets at the top level commas. '''
+    columns = [[]]
+    depth = 0
+    for tok in tokens:
+        if tok[0] == 'punct':
+            if tok[1] == '(':
+                depth += 1
+            elif tok[1] == ')':
+                depth -= 1
+            elif tok[1] == ',' and depth == 0:
+                columns.append([])
+                continue
+        columns[-1].append(tok)
+    return columns
+
+def _parse_column(toks):
+    ''' Parse the tokens for a column definition. Parsing stops at the
+        first token that isn't understood, as the pyparsing grammar does. '''
+    rv = {}
+    name = toks.word()
+    if name is None:
+        return {}
+    rv['identifier'] = name
+    kind, val = toks.peek()
+    if kind == 'word' and val.upper() in COLUMN_TYPES:
+        toks.next()
+        rv['type'] = str(val.upper())
+        if toks.peek() == ('punct', '('):
+            start = toks.pos
+            toks.next()
+            size = []
+            while True:
+                kind, val = toks.next()
+                if kind != 'number' or not val.isdigit():
+                    break
+                size.append(val)
+                if toks.punct(')'):
+                    rv['size'] = size
+                    break
+                if not toks.punct(','):
+                    break
+            if not rv.has_key('size'):
+                toks.pos = start
+    while True:
+        if toks.keyword('PRIMARY', 'KEY'):
+            pkey = ['PRIMARY KEY']
+            kind, val = toks.peek()
+            if kind == 'word' and val.upper() in ['ASC', 'DESC']:
+                toks.next()
+                pkey.append(val.upper())
+            if toks.keyword('AUTOINCREMENT'):
+                pkey.append('AUTOINCREMENT')
+            rv['pkey'] = pkey
+        elif toks.keyword('NOT', 'NULL'):
+            rv['null'] = ['NOT', 'NULL']
+        elif toks.keyword('NULL'):
+            rv['null'] = ['NULL']
+        elif toks.keyword('UNIQUE'):
+            rv['unique'] = 'UNIQUE'
+        elif toks.keyword('DEFAULT'):
+            dflt = ['DEFAULT']
+            kind, val = toks.peek()
+            if kind in ['number', 'quoted']:
+                toks.next()
+                dflt.append(val)
+            rv['default'] = dflt
+        else:
+            break
+    return rv
+
+def parse_column_statement(colstmt):
+    ''' Parse an SQL statement used to create a column. '''
+    return _parse_column(_Tokens(tokenize(colstmt)))
+
+def parse_table_statement(tblstmt):
+    ''' Parse an SQL statement used to create a table. '''
+    toks = _Tokens(tokenize(tblstmt))
+    rv = {}
+    if not toks.keyword('CREATE'):
+        return {}
+    kind, val = toks.peek()
+    if kind == 'word' and val.upper() in ['TEMP', 'TEMPORARY']:
+        toks.next()
+        rv['temp'] = val.upper()
+    if not toks.keyword('TABLE'):
+        return {}
+    if toks.keyword('IF', 'NOT', 'EXISTS'):
+        rv['ifexists'] = 'IF NOT EXISTS'
+    name = toks.word()
+    if name is None:
+        return {}
+    rv['identifier'] = name
+    if not toks.punct('('):
+        return rv
+    # Find the bracket that closes the column list.
+    depth = 1
+    end = toks.pos
+    while end < len(toks.tokens) and depth:
+        if toks.tokens[end] == ('punct', '('):
+            depth += 1
+        elif toks.tokens[end] == ('punct', ')'):
+            depth -= 1
+        end += 1
+    rv['columns'] = []
+    for col in _split_columns(toks.tokens[toks.pos:end - 1]):
+        if col and col[0][0] == 'word' and \
+                                   col[0][1].upper() in TABLE_CONSTRAINTS:
+            continue
+        rv['columns'].append(_parse_column(_Tokens(col)))
+    return rv
+
+def parse_index_statement(idxstmt):
+    ''' Parse an SQL statement used to create an index. '''
+    toks = _Tokens(tokenize(idxstmt))
+    rv = {}
+    if not toks.keyword('CREATE'):
+        return {}
+    if toks.keyword('UNIQUE'):
+        rv['unique'] = 'UNIQUE'
+    if not toks.keyword('INDEX'):
+        return {}
+    rv['name'] = toks.word()
+    if rv['name'] is None or not toks.keyword('ON'):
+        return {}
+    rv['tablename'] = toks.word()
+    if rv['tablename'] is None or not toks.punct('('):
+        return {}
+    columns = []
+    while True:
+        col = toks.word()
+        if col is None:
+            return {}
+        columns.append(col)
+        if toks.punct(')'):
+            break
+        if not toks.punct(','):
+            return {}
+    rv['columns'] = columns
+    rv['identifier'] = columns[-1]
+    return rv
@@ -0,0 +1,292 @@
+''' Snapshots of a catalog written to plain files, for backups that don't
+    need a database server. '''
+
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import hashlib
+import argparse
+
+from slurpy.databases.sqlite import SqliteDatabase
+
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+
+_INT = struct.Struct('>q')
+_FLOAT = struct.Struct('>d')
+_LEN = struct.Struct('>I')
+
+def encode_row(row):
+    ''' Encode a row as a type tag and value for each column. Integers and
+        floats are 8 bytes, text and binary values are length prefixed. '''
+    out = []
+    for v in row:
+        if v is None:
+            out.append('N')
+        elif isinstance(v, bool) or isinstance(v, (int, long)) and \
+                                            -2 ** 63 <= v < 2 ** 63:
+            out.append('I' + _INT.pack(v))
+        elif isinstance(v, float):
+            out.append('F' + _FLOAT.pack(v))
+        elif isinstance(v, buffer):
+            out.append('B' + _LEN.pack(len(v)) + str(v))
+        else:
+            if isinstance(v, unicode):
+                v = v.encode('utf-8')
+            elif not isinstance(v, str):
+                v = str(v)
+            out.append('T' + _LEN.pack(len(v)) + v)
+    return ''.join(out)
+
+def decode_rows(data, columns):
+    ''' Generator over the rows, of columns values each, encoded in data. '''
+    pos = 0
+    end = len(data)
+    while pos < end:
+        row = []
+        for n in xrange(columns):
+            tag = data[pos]
+            pos += 1
+            if tag == 'N':
+                row.append(None)
+            elif tag == 'I':
+                row.append(_INT.unpack_from(data, pos)[0])
+                pos += 8
+            elif tag == 'F':
+                row.append(_FLOAT.unpack_from(data, pos)[0])
+                pos += 8
+            else:
+                size = _LEN.unpack_from(data, pos)[0]
+                pos += 4
+                v = data[pos:pos + size]
+                pos += size
+                row.append(buffer(v) if tag == 'B' else v.decode('utf-8'))
+        yield row
+
+class SnapshotWriter(object):
+    ''' Writes every table of a catalog to a directory. Each table is a
+        file of chunks, chunk_rows rows at a time in id_local order, each
+        compressed and prefixed by its length. The manifest lists the
+        schema, the tables and a digest of every chunk, so two snapshots
+        can be compared chunk by chunk and an unchanged part of a table
+        gives identical bytes. '''
+
+    CHUNK_ROWS = 10000
+
+    def __init__(self, catalog, chunk_rows = None, level = 6):
+        ''' catalog is an open Catalog with its schema read. '''
+        self.catalog = catalog
+        self.chunk_rows = chunk_rows or self.CHUNK_ROWS
+        self.level = level
+
+    def _rows(self, tbl):
+        db = self.catalog._catalog
+        return db.iter_query("select %s from %s order by %s" % (
+                           ','.join([f.name for f in tbl.catalog_fields]),
+                           tbl.name, 'id_local' if tbl.idlocal else 'rowid'))
+
+    def _write_chunk(self, fh, rows, entry):
+        data = zlib.compress(''.join(rows), self.level)
+        fh.write(_LEN.pack(len(data)))
+        fh.write(data)
+        entry['chunks'].append({'rows': len(rows),
+                                'sha1': hashlib.sha1(data).hexdigest()})
+        entry['bytes'] += len(data) + _LEN.size
+
+    def write_table(self, dirname, tbl):
+        ''' Write one table, returning its manifest entry. '''
+        entry = {'name': tbl.name, 'file': tbl.name + '.snap',
+                 'columns': [f.name for f in tbl.catalog_fields],
+                 'rows': 0, 'bytes': 0, 'chunks': []}
+        with open(os.path.join(dirname, entry['file']), 'wb') as fh:
+            rows = []
+            for r in self._rows(tbl):
+                rows.append(encode_row(r))
+                if len(rows) >= self.chunk_rows:
+                    self._write_chunk(fh, rows, entry)
+                    entry['rows'] += len(rows)
+                    rows = []
+            if rows:
+                self._write_chunk(fh, rows, entry)
+                entry['rows'] += len(rows)
+        return entry
+
+    def write(self, dirname, verbose = False):
+        ''' Write the snapshot to dirname, which is created if needed and
+            must not already hold a snapshot. Returns the manifest, or None
+            on failure. '''
+        if os.path.exists(os.path.join(dirname, MANIFEST)):
+            return None
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        start = time.time()
+        manifest = {'format': FORMAT_VERSION,
+                    'catalog': os.path.basename(self.catalog.filename),
+                    'version': self.catalog.version,
+                    'created': time.time(),
+                    'schema': dict([(kind, self.catalog.schema_statements(kind))
+                                    for kind in ['table', 'index', 'trigger']]),
+                    'tables': []}
+        for tbl in self.catalog.tables:
+            _start = time.time()
+            entry = self.write_table(dirname, tbl)
+            manifest['tables'].append(entry)
+            if verbose:
+                print "%-40s %8d rows %10d bytes %8.2fs" % (tbl.name,
+                         entry['rows'], entry['bytes'], time.time() - _start)
+        manifest['seconds'] = time.time() - start
+        # The manifest is written last, so a snapshot that has one is
+        # complete.
+        tmpfn = os.path.join(dirname, MANIFEST + '.tmp')
+        with open(tmpfn, 'w') as fh:
+            json.dump(manifest, fh, indent = 1, sort_keys = True)
+        os.rename(tmpfn, os.path.join(dirname, MANIFEST))
+        return manifest
+
+class SnapshotReader(object):
+    ''' Reads a snapshot written by SnapshotWriter. '''
+
+    BATCH_ROWS = 10000
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        with open(os.path.join(dirname, MANIFEST)) as fh:
+            self.manifest = json.load(fh)
+        if self.manifest.get('format') != FORMAT_VERSION:
+            raise ValueError('Unsupported snapshot format %s' %
+                                               self.manifest.get('format'))
+        self.tables = dict([(t['name'], t) for t in self.manifest['tables']])
+
+    def _chunks(self, entry):
+        with open(os.path.join(self.dirname, entry['file']), 'rb') as fh:
+            for info in entry['chunks']:
+                size = _LEN.unpack(fh.read(_LEN.size))[0]
+                yield info, fh.read(size)
+
+    def iter_rows(self, name):
+        ''' Generator over the rows of a table. '''
+        entry = self.tables[name]
+        for info, data in self._chunks(entry):
+            for r in decode_rows(zlib.decompress(data), len(entry['columns'])):
+                yield r
+
+    def check(self):
+        ''' Returns the names of tables whose files don't match the
+            manifest. '''
+        bad = []
+        for name, entry in sorted(self.tables.items()):
+            try:
+                for info, data in self._chunks(entry):
+                    if hashlib.sha1(data).hexdigest() != info['sha1']:
+                        raise ValueError(name)
+            except (IOError, struct.error, ValueError):
+                bad.append(name)
+        return bad
+
+    def diff(self, other):
+        ''' Compare with another snapshot, returning a dict of table name
+            -> list of chunk numbers that differ. Tables only in one of the
+            snapshots have None. '''
+        rv = {}
+        for name in set(self.tables.keys()) | set(other.tables.keys()):
+            if not name in self.tables or not name in other.tables:
+                rv[name] = None
+                continue
+            mine = [c['sha1'] for c in self.tables[name]['chunks']]
+            theirs = [c['sha1'] for c in other.tables[name]['chunks']]
+            changed = [n for n in xrange(max(len(mine), len(theirs)))
+                       if n >= len(mine) or n >= len(theirs) or
+                                                      mine[n] != theirs[n]]
+            if changed:
+                rv[name] = changed
+        return rv
+
+    def _insert(self, db, entry):
+        cols = entry['columns']
+        batch = []
+        for r in self.iter_rows(entry['name']):
+            batch.append(r)
+            if len(batch) >= self.BATCH_ROWS:
+                if db.insert_rows(entry['name'], cols, batch, None) is None:
+                    return False
+                batch = []
+        if batch and db.insert_rows(entry['name'], cols, batch,
+                                                           None) is None:
+            return False
+        return True
+
+    def restore(self, filename, verbose = False):
+        ''' Write the snapshot out as a catalog file, which must not exist.
+            Returns True or False. '''
+        if os.path.exists(filename):
+            return False
+        db = SqliteDatabase()
+        if not db.connect(dbname = filename):
+            return False
+        ok = self._restore(db, verbose)
+        db.close()
+        if not ok:
+            os.remove(filename)
+        return ok
+
+    def _restore(self, db, verbose):
+        schema = self.manifest['schema']
+        for pragma in ['synchronous=OFF', 'journal_mode=OFF']:
+            db.execute("PRAGMA %s" % pragma)
+        for sql in schema['table']:
+            if not db.execute(sql):
+                return False
+        db.start_transaction()
+        for entry in self.manifest['tables']:
+            start = time.time()
+            if not self._insert(db, entry):
+                db.rollback()
+                return False
+            if verbose:
+                print "%-40s %8d rows %8.2fs" % (entry['name'], entry['rows'],
+                                                     time.time() - start)
+        db.commit()
+        for sql in schema['index'] + schema['trigger']:
+            if not db.execute(sql):
+                return False
+        for pragma in ['synchronous=FULL', 'journal_mode=DELETE']:
+            db.execute("PRAGMA %s" % pragma)
+        return True
+
+def command_line():
+    parser = argparse.ArgumentParser(description = 'Write a Lightroom catalog '
+                                     'to a snapshot, or restore one')
+    sub = parser.add_subparsers(dest = 'command')
+    p = sub.add_parser('export', help = 'Write a catalog to a snapshot')
+    p.add_argument('catalog')
+    p.add_argument('snapshot', help = 'Directory to write the snapshot to')
+    p.add_argument('--chunk-rows', type = int, default = None)
+    p.add_argument('--schema-cache', dest = 'cache_dir',
+                   help = 'Directory used to cache catalog schemas')
+    p = sub.add_parser('restore', help = 'Rebuild a catalog from a snapshot')
+    p.add_argument('snapshot')
+    p.add_argument('catalog', help = 'Catalog file to create')
+    p = sub.add_parser('check', help = 'Check a snapshot is intact')
+    p.add_argument('snapshot')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        from slurpy.catalog import Catalog
+        c = Catalog(args.catalog, readonly = True)
+        if not c.get_schema_from_catalog(args.cache_dir):
+            print "Unable to read the schema of %s" % args.catalog
+            sys.exit(1)
+        ok = SnapshotWriter(c, args.chunk_rows).write(args.snapshot,
+                                                       True) is not None
+        c.close()
+    elif args.command == 'restore':
+        ok = SnapshotReader(args.snapshot).restore(args.catalog, True)
+    else:
+        bad = SnapshotReader(args.snapshot).check()
+        for name in bad:
+            print "%s is damaged" % name
+        ok = not bad
+    sys.exit(0 if ok else 1)
@@ -1,12 +1,33 @@
 #! /usr/bin/env python
 
+from array import array
+from bisect import bisect_left
+
+# Older pythons don't have the 'q' typecode, so use a long instead. That is
+# 64 bits on most platforms, larger values end up in the overflow dict.
+try:
+    ID_TYPECODE = array('q').typecode
+except ValueError:
+    ID_TYPECODE = 'l'
 
 class IdTranslator(object):
     ''' Class that manages translations between table id's '''
 
-    def __init__(self):
-        ''' Create a new IdTranslator object '''
+    # Table used to store translations between runs.
+    STORE_TABLE = 'slurpy_translator'
+    STORE_COLUMNS = ['host', 'catalog', 'tblname', 'id_catalog', 'id_server']
+    STORE_ROWS = 5000
+
+    def __init__(self, compact = False):
+        ''' Create a new IdTranslator object. If compact is True, integer
+            keys and values are stored in arrays rather than a dict. '''
         self._translators = {}
+        self._names = {}
+        self._dirty = None
+        self.compact = compact
+        # Set by reverse: for each table, the translated ids that more than
+        # one original key mapped to, with all of those keys.
+        self.collisions = {}
 
     class _Translator(object):
         ''' Class that manages transaltions. '''
@@ -24,31 +45,257 @@ class IdTranslator(object):
                 return self.keys[str(key)]
             return -1
 
+        def items(self):
+            return self.keys.items()
+
+        def __len__(self):
+            return len(self.keys)
+
+    class _CompactTranslator(object):
+        ''' Translator that keeps integer keys and values in a pair of
+            sorted arrays. Ids normally arrive in ascending order, so new
+            keys are appended. While the keys are contiguous the position
+            of a key is calculated directly rather than searched for. Keys
+            or values that can't be stored as integers are kept in a dict,
+            the same as _Translator. '''
+
+        # Stored in place of None, which an array can't hold.
+        NONE = -2 ** (array(ID_TYPECODE).itemsize * 8 - 1)
+        # Largest key or value the arrays can hold.
+        MAX = -NONE - 1
+
+        def __init__(self):
+            self.ids = array(ID_TYPECODE)
+            self.vals = array(ID_TYPECODE)
+            self.extra = {}
+            self.dense = True
+
+        def _int_key(self, key):
+            ''' Return the key as an int, or None if it would not be the
+                same key once converted by str(). '''
+            if isinstance(key, (int, long)):
+                return key
+            if isinstance(key, basestring) and key.isdigit() and \
+                                                  str(int(key)) == key:
+                return int(key)
+            return None
+
+        def _index(self, key):
+            ''' Return the position of key in ids, or -1. '''
+            n = len(self.ids)
+            if n == 0:
+                return -1
+            if self.dense:
+                pos = key - self.ids[0]
+                if 0 <= pos < n:
+                    return pos
+                return -1
+            pos = bisect_left(self.ids, key)
+            if pos < n and self.ids[pos] == key:
+                return pos
+            return -1
+
+        def _fits(self, n):
+            return isinstance(n, (int, long)) and self.NONE < n <= self.MAX
+
+        def set_value(self, key, val):
+            ''' Set a value for a given key. Overwrites existing values. '''
+            k = self._int_key(key)
+            # Both are checked before either array is changed, so the two
+            # always stay in step.
+            if not self._fits(k) or not (val is None or self._fits(val)):
+                self._remove(k)
+                self.extra[str(key)] = val
+                return
+            if self.extra:
+                self.extra.pop(str(key), None)
+            v = self.NONE if val is None else val
+            n = len(self.ids)
+            if n == 0 or k > self.ids[-1]:
+                self.ids.append(k)
+                self.vals.append(v)
+                if n and k != self.ids[n - 1] + 1:
+                    self.dense = False
+                return
+            pos = self._index(k)
+            if pos != -1:
+                self.vals[pos] = v
+                return
+            pos = bisect_left(self.ids, k)
+            self.ids.insert(pos, k)
+            self.vals.insert(pos, v)
+            self._set_dense()
+
+        def _set_dense(self):
+            self.dense = not self.ids or \
+                         self.ids[-1] - self.ids[0] == len(self.ids) - 1
+
+        def _remove(self, k):
+            ''' Remove key k from the arrays, if it is there. '''
+            if not self._fits(k):
+                return
+            pos = self._index(k)
+            if pos != -1:
+                del self.ids[pos]
+                del self.vals[pos]
+                self._set_dense()
+
+        def get_value(self, key):
+            ''' Get the translated value for a key. Returns -1 if not available. '''
+            if self.extra and self.extra.has_key(str(key)):
+                return self.extra[str(key)]
+            k = self._int_key(key)
+            if k is None:
+                return -1
+            pos = self._index(k)
+            if pos == -1:
+                return -1
+            v = self.vals[pos]
+            return None if v == self.NONE else v
+
+        def items(self):
+            rv = [(str(k), None if v == self.NONE else v)
+                                         for k, v in zip(self.ids, self.vals)]
+            rv.extend(self.extra.items())
+            return rv
+
+        def __len__(self):
+            return len(self.ids) + len(self.extra)
+
     def get_translator(self, name, create = True):
-        name = name.lower()
-        if not self._translators.has_key(name):
+        translator = self._names.get(name)
+        if translator is not None:
+            return translator
+        lname = name.lower()
+        if not self._translators.has_key(lname):
             if not create:
                 return None
-            self._translators[name] = self._Translator()
-        return self._translators[name]
+            if self.compact:
+                self._translators[lname] = self._CompactTranslator()
+            else:
+                self._translators[lname] = self._Translator()
+        translator = self._names[name] = self._translators[lname]
+        return translator
 
     def set_value(self, name, key, val):
-        name = name.lower()
         if key:
-            self.get_translator(name).set_value(key, val)
-    
+            translator = self.get_translator(name)
+            translator.set_value(key, val)
+            if self._dirty is not None:
+                self._dirty.setdefault(translator, set()).add(str(key))
+
     def get_value(self, name, key):
-        name = name.lower()
         if key is None:
             return None
         translator = self.get_translator(name, False)
-        if translator:
+        if translator is not None:
             return translator.get_value(key)
         return -1
 
+    def reverse(self):
+        ''' Return a new IdTranslator mapping the translated ids back to
+            the original keys, as needed to restore a catalog. Entries
+            without a translated id are left out. Rows found to be
+            duplicates during an import share a translated id; only the
+            lowest of their keys is kept, and all are listed in the
+            collisions of the new IdTranslator. '''
+        rv = IdTranslator(compact = self.compact)
+        for name, translator in self._translators.items():
+            pairs = []
+            for k, v in translator.items():
+                if isinstance(v, (int, long)) and v > 0:
+                    if isinstance(k, basestring) and k.isdigit():
+                        k = int(k)
+                    pairs.append((v, k))
+            # Sorted, so the compact translator can append.
+            last = None
+            for v, k in sorted(pairs):
+                if v == last:
+                    keys = rv.collisions.setdefault(name, {})
+                    keys.setdefault(v, [rv.get_value(name, v)]).append(k)
+                    continue
+                rv.set_value(name, v, k)
+                last = v
+        return rv
+
+    def create_store(self, db):
+        ''' Create the table used to store translations, if needed. '''
+        return db.execute("CREATE TABLE IF NOT EXISTS %s (host TEXT NOT NULL, "
+                          "catalog TEXT NOT NULL, tblname TEXT NOT NULL, "
+                          "id_catalog TEXT NOT NULL, id_server BIGINT)" %
+                                                          self.STORE_TABLE)
+
+    def drop_store(self, db):
+        ''' Remove all stored translations. '''
+        return db.execute("DROP TABLE IF EXISTS %s" % self.STORE_TABLE)
+
+    def load(self, db, host, catalog):
+        ''' Load the translations previously saved for the host and catalog
+            from the supplied database. Returns the number loaded. Once
+            loaded, only translations that change are written by save. '''
+        if not self.create_store(db):
+            return 0
+        self._dirty = None
+        rows = db.iter_query("select tblname, id_catalog, id_server from %s "
+                             "where host=? and catalog=?" % self.STORE_TABLE,
+                                                           [host, catalog])
+        n = 0
+        for tblname, key, val in rows:
+            self.set_value(tblname, key, val)
+            n += 1
+        self._dirty = {}
+        return n
+
+    def _save_rows(self, db, rows):
+        for n in xrange(0, len(rows), self.STORE_ROWS):
+            if db.insert_rows(self.STORE_TABLE, self.STORE_COLUMNS,
+                              rows[n:n + self.STORE_ROWS], None) is None:
+                return False
+        return True
+
+    def save(self, db, host, catalog, tables = None):
+        ''' Save the translations for the host and catalog. If they were
+            loaded from a store, only those changed since are written,
+            otherwise all previously saved are replaced. If tables is given
+            only the translations of those tables are saved, as when the
+            rest were rolled back. Returns True or False. '''
+        if not self.create_store(db):
+            return False
+        translators = self._translators.items()
+        if tables is not None:
+            names = set([t.lower() for t in tables])
+            translators = [(n, t) for n, t in translators if n in names]
+        if self._dirty is None:
+            sql = "delete from %s where host=? and catalog=?" % \
+                                                           self.STORE_TABLE
+            if tables is None and not db.execute(sql, [host, catalog]):
+                return False
+            for name, translator in translators:
+                if tables is not None and not db.execute(sql +
+                               " and tblname=?", [host, catalog, name]):
+                    return False
+                if not self._save_rows(db, [[host, catalog, name, k, v]
+                                           for k, v in translator.items()]):
+                    return False
+            self._dirty = {}
+            return True
+        for name, translator in translators:
+            keys = list(self._dirty.get(translator, []))
+            for n in xrange(0, len(keys), self.STORE_ROWS):
+                chunk = keys[n:n + self.STORE_ROWS]
+                sql = "delete from %s where host=? and catalog=? and " \
+                      "tblname=? and id_catalog in (%s)" % (self.STORE_TABLE,
+                                             ','.join(['?' for k in chunk]))
+                if not db.execute(sql, [host, catalog, name] + chunk):
+                    return False
+                if not self._save_rows(db, [[host, catalog, name, k,
+                                  translator.get_value(k)] for k in chunk]):
+                    return False
+        self._dirty = {}
+        return True
+
     def dump(self):
         for k,v in self._translators.items():
             print k
-            for kk,vv in v.keys.items():
+            for kk,vv in v.items():
                 print "    %s -> %s" % (kk, vv)
-                
@@ -0,0 +1,242 @@
+''' Compare the rows of a catalog with those held in a backup. '''
+
+from slurpy.blobs import blob_key
+from slurpy.codec import decompress, CodecStore
+from slurpy.database import DB_UUID
+from slurpy.fingerprint import row_digest
+
+class TableDiff(object):
+    ''' The result of comparing one table. Rows are missing if they are in
+        the catalog but not the backup, extra if the backup has rows the
+        catalog no longer has, and changed if both have them but with
+        different values. Up to limit catalog ids of each are kept as
+        examples. '''
+
+    def __init__(self, name, limit = 100):
+        self.table = name
+        self.limit = limit
+        self.rows = 0
+        self.server_rows = 0
+        self.matched = 0
+        self.missing = 0
+        self.extra = 0
+        self.changed = 0
+        # Tables without id_local are compared as a whole, by a checksum
+        # that doesn't depend on row order. None if it wasn't checked.
+        self.checksum_ok = None
+        self.examples = {'missing': [], 'extra': [], 'changed': []}
+
+    def __repr__(self):
+        return u'%s: %d rows, %d missing, %d extra, %d changed' % (
+                  self.table, self.rows, self.missing, self.extra, self.changed)
+
+    @property
+    def ok(self):
+        return self.missing == 0 and self.extra == 0 and \
+                          self.changed == 0 and self.checksum_ok is not False
+
+    def add(self, kind, key):
+        setattr(self, kind, getattr(self, kind) + 1)
+        if len(self.examples[kind]) < self.limit:
+            self.examples[kind].append(key)
+
+    def as_dict(self):
+        return {'table': self.table, 'rows': self.rows,
+                'server_rows': self.server_rows, 'matched': self.matched,
+                'missing': self.missing, 'extra': self.extra,
+                'changed': self.changed, 'checksum_ok': self.checksum_ok,
+                'examples': self.examples}
+
+class CatalogVerifier(object):
+    ''' Checks that a backup holds the same rows as a catalog, without
+        loading either table into memory. Rows are read from both in
+        id_local order and compared by a digest of their catalog fields,
+        id_local excepted.
+
+        If ids (the IdTranslator of the catalog's imports) is given, the
+        backup is a server shared with other catalogs. Catalog rows are
+        translated, then looked up chunk_size at a time by their server
+        ids, and server rows the translator knows of that the catalog no
+        longer has are counted as extra. Tables without id_local can't be
+        told apart from those of other catalogs, so only their counts are
+        reported. Without ids the backup must use the same ids as the
+        catalog, as a restored catalog does, and both sides are simply
+        merged. '''
+
+    def __init__(self, catalog, server, ids = None, chunk_size = 1000,
+                                                          limit = 100):
+        self.catalog = catalog
+        self._db = catalog._catalog
+        self.server = server
+        self.ids = ids
+        self.chunk_size = chunk_size
+        self.limit = limit
+        self.results = []
+        self.codecs = CodecStore()
+        # The codecs of the fields of the table being compared, as
+        # recorded on the server.
+        self._field_codecs = []
+
+    @property
+    def ok(self):
+        return all([d.ok for d in self.results])
+
+    def _digest(self, flds, row, translate = False, start = 1):
+        ''' Digest of a row from field start, by default leaving out
+            id_local. Links are translated to server ids if translate is
+            True. '''
+        vals = []
+        for n in xrange(start, len(flds)):
+            v = row[n]
+            fld = flds[n]
+            if v is not None:
+                if translate and fld.dependancy:
+                    v = self.ids.get_value(fld.dependancy, v)
+                elif fld.name == 'id_global' or fld.dbtype == DB_UUID:
+                    # Postgres returns UUIDs in lower case.
+                    v = str(v).upper()
+                elif fld.blob:
+                    v = blob_key(v)
+                elif self._field_codecs[n]:
+                    v = decompress(self._field_codecs[n], v)
+            vals.append(v)
+        return row_digest(vals)
+
+    def _checksum(self, db, tbl):
+        ''' A checksum of the whole table that doesn't depend on the order
+            the rows are read in. '''
+        flds = tbl.catalog_fields
+        total = 0
+        for r in tbl.iter_rows(db, True):
+            total = (total + int(self._digest(flds, r, start = 0), 16)) \
+                                                           % (1 << 128)
+        return total
+
+    def verify_table(self, tbl):
+        ''' Compare one table, returning a TableDiff. '''
+        diff = TableDiff(tbl.name, self.limit)
+        self._field_codecs = [self.codecs.codec(tbl, f)
+                                            for f in tbl.catalog_fields]
+        diff.rows = tbl.count(self._db)
+        diff.server_rows = tbl.count(self.server)
+        if not tbl.idlocal:
+            if self.ids is None:
+                diff.checksum_ok = diff.rows == diff.server_rows and \
+                                       self._checksum(self._db, tbl) == \
+                                       self._checksum(self.server, tbl)
+                if diff.checksum_ok:
+                    diff.matched = diff.rows
+            return diff
+        if self.ids is None:
+            self._merge(tbl, diff)
+        else:
+            self._lookup(tbl, diff)
+        return diff
+
+    def _merge(self, tbl, diff):
+        ''' Walk both tables in id_local order together. '''
+        flds = tbl.catalog_fields
+        mine = tbl.iter_rows(self._db, True, after = 0)
+        theirs = tbl.iter_rows(self.server, True, after = 0)
+        a = next(mine, None)
+        b = next(theirs, None)
+        while a is not None or b is not None:
+            if b is None or (a is not None and a[0] < b[0]):
+                diff.add('missing', a[0])
+                a = next(mine, None)
+            elif a is None or b[0] < a[0]:
+                diff.add('extra', b[0])
+                b = next(theirs, None)
+            else:
+                if self._digest(flds, a) == self._digest(flds, b):
+                    diff.matched += 1
+                else:
+                    diff.add('changed', a[0])
+                a = next(mine, None)
+                b = next(theirs, None)
+
+    def _known(self, tbl):
+        ''' The catalog ids the translator has server ids for, in order. '''
+        translator = self.ids.get_translator(tbl.name, False)
+        if translator is None:
+            return []
+        keys = []
+        for k, v in translator.items():
+            if isinstance(v, (int, long)) and v > 0:
+                keys.append(int(k) if isinstance(k, basestring) and
+                                                    k.isdigit() else k)
+        return sorted(keys)
+
+    def _server_rows(self, tbl, flds, sids):
+        sql = "select %s from %s where id_local in (%s)" % (
+                   ','.join([f.name for f in flds]), tbl.name,
+                   ','.join(['?' for s in sids]))
+        return self.server.query(sql, sids)
+
+    def _check_chunk(self, tbl, flds, chunk, diff):
+        ''' chunk is a list of (catalog id, server id, digest). '''
+        found = {}
+        for r in self._server_rows(tbl, flds, [c[1] for c in chunk]):
+            found[r[0]] = self._digest(flds, r)
+        for cid, sid, digest in chunk:
+            if not found.has_key(sid):
+                diff.add('missing', cid)
+            elif found[sid] != digest:
+                diff.add('changed', cid)
+            else:
+                diff.matched += 1
+
+    def _check_extra(self, tbl, keys, diff):
+        ''' keys are catalog ids that have gone. Count those whose server
+            row is still there. '''
+        for n in xrange(0, len(keys), self.chunk_size):
+            chunk = keys[n:n + self.chunk_size]
+            sids = [self.ids.get_value(tbl.name, k) for k in chunk]
+            found = set([r[0] for r in self._server_rows(tbl,
+                                         tbl.catalog_fields[:1], sids)])
+            for k, sid in zip(chunk, sids):
+                if sid in found:
+                    diff.add('extra', k)
+
+    def _lookup(self, tbl, diff):
+        ''' Look up translated catalog rows on the server. '''
+        flds = tbl.catalog_fields
+        known = self._known(tbl)
+        pos = 0
+        gone = []
+        chunk = []
+        for r in tbl.iter_rows(self._db, True, after = 0):
+            while pos < len(known) and known[pos] < r[0]:
+                gone.append(known[pos])
+                pos += 1
+            if pos < len(known) and known[pos] == r[0]:
+                pos += 1
+            sid = self.ids.get_value(tbl.name, r[0])
+            if sid is None or sid <= 0:
+                diff.add('missing', r[0])
+                continue
+            chunk.append((r[0], sid, self._digest(flds, r, True)))
+            if len(chunk) >= self.chunk_size:
+                self._check_chunk(tbl, flds, chunk, diff)
+                chunk = []
+        if chunk:
+            self._check_chunk(tbl, flds, chunk, diff)
+        gone.extend(known[pos:])
+        self._check_extra(tbl, gone, diff)
+
+    def run(self, tables = None):
+        ''' Compare every table of the catalog, or those named. Returns
+            True if all match. '''
+        self.results = []
+        self.codecs.load(self.server)
+        for name in tables or self.catalog.ordered_table_list:
+            tbl = self.catalog.get_table(name)
+            if tbl is not None:
+                self.results.append(self.verify_table(tbl))
+        return self.ok
+
+    def report(self):
+        ''' Print the tables that differ. '''
+        for d in self.results:
+            if not d.ok:
+                print d
@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+from slurpy.benchmark import CatalogGenerator, ImportBenchmark
+from slurpy.catalog import Catalog
+from slurpy.databases.sqlite import SqliteDatabase
+from slurpy.translator import IdTranslator
+from import_test import _make_catalog
+from restore_test import _tables
+
+testDir = os.path.dirname(__file__)
+
+class TestGenerator(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.template = os.path.join(testDir, 'files', 'test.lrcat')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_001_generate(self):
+        fn = os.path.join(self.dir, 'bench.lrcat')
+        gen = CatalogGenerator(self.template, 2, 5, 30, 2)
+        self.assertEqual(gen.generate(fn), True)
+        self.assertEqual(gen.generate(fn), False)
+        self.assertEqual(gen.rows, {'AgLibraryRootFolder': 2,
+                                    'AgLibraryFolder': 5,
+                                    'AgLibraryFile': 30,
+                                    'Adobe_images': 30,
+                                    'Adobe_imageDevelopSettings': 60})
+        c = Catalog(fn)
+        self.assertEqual(c.version, '0300025')
+        self.assertEqual(c.entity_counter, 127.0)
+        db = c._catalog
+        self.assertEqual(db.query("select count(*) from AgLibraryFile f join "
+                   "AgLibraryFolder d on d.id_local=f.folder"), [(30,)])
+        self.assertEqual(db.query("select count(*) from Adobe_images i join "
+                   "AgLibraryFile f on f.id_local=i.rootFile"), [(30,)])
+        c.close()
+
+    def test_002_seed(self):
+        rows = []
+        for n in [1, 2]:
+            fn = os.path.join(self.dir, 'bench%d.lrcat' % n)
+            self.assertEqual(CatalogGenerator(self.template, files = 10,
+                                          seed = 5).generate(fn), True)
+            c = Catalog(fn)
+            rows.append(c._catalog.query("select * from Adobe_images"))
+            c.close()
+        self.assertEqual(rows[0], rows[1])
+
+class TestImportBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dir, 'catalog.lrcat')
+        c = _make_catalog(self.fn)
+        # Parsing needs the Lightroom schema module, so the schema is
+        # given to the benchmark through its cache.
+        with open(c._schema_cache_file(self.dir), 'w') as fh:
+            json.dump([t.as_schema_dict() for t in _tables()], fh)
+        self.translator_key = c.translator_key
+        c.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_001_run(self):
+        for bulk in [False, True]:
+            db = SqliteDatabase()
+            db.connect(dbname = ':memory:')
+            store = SqliteDatabase()
+            store.connect(dbname = ':memory:')
+            bench = ImportBenchmark(self.fn, db, bulk, self.dir, store)
+            self.assertEqual(bench.run(), True)
+            self.assertEqual([p['phase'] for p in bench.phases],
+                             ['open', 'parse', 'create_database',
+                              'import_all', 'reimport'])
+            self.assertEqual(bench.results(files = 5)['files'], 5)
+            self.assertEqual(db.query("select count(*) from "
+                                      "AgLibraryFolder"), [(3,)])
+            # Both imports used the store.
+            self.assertEqual(IdTranslator().load(store,
+                                                 *self.translator_key), 5)
+            self.assertEqual(IdTranslator().load(db, *self.translator_key), 0)
+            db.close()
+            store.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from slurpy.blobs import BlobStore, blob_digest, blob_key
+from slurpy.catalog import Catalog
+from slurpy.schema.field import DatabaseField, DB_INTEGER
+from slurpy.schema.table import DatabaseTable
+from slurpy.databases.sqlite import SqliteDatabase
+from restore_test import TEMPLATE_SQL
+
+SETTINGS = [(1, 'A-1', 's = { Exposure2012 = 0.5, }'),
+            (2, 'A-2', 's = { Exposure2012 = 0.5, }'),
+            (3, 'A-3', 's = { Exposure2012 = -1.0, }'),
+            (4, 'A-4', None)]
+
+DEVELOP_SQL = "CREATE TABLE Adobe_imageDevelopSettings (id_local INTEGER " \
+              "PRIMARY KEY, id_global UNIQUE NOT NULL, text)"
+
+def _table():
+    tbl = DatabaseTable('Adobe_imageDevelopSettings')
+    tbl.add_field(DatabaseField('id_local', DB_INTEGER, primary_key = True))
+    tbl.add_field(DatabaseField('id_global', unique = True))
+    tbl.add_field(DatabaseField('text'))
+    return tbl
+
+class TestBlobs(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fn = os.path.join(self.dir, 'catalog.lrcat')
+        src = SqliteDatabase()
+        src.connect(dbname = fn)
+        for sql in TEMPLATE_SQL + [DEVELOP_SQL]:
+            src.execute(sql)
+        src.insert_rows('Adobe_imageDevelopSettings',
+                        ['id_local', 'id_global', 'text'], SETTINGS, None)
+        src.close()
+        self.catalog = Catalog(fn)
+        self.catalog.tables = [_table()]
+        self.catalog._mark_blob_fields()
+        self.catalog._get_ordered_table_list()
+        self.server = SqliteDatabase()
+        self.server.connect(dbname = ':memory:')
+
+    def tearDown(self):
+        self.catalog.close()
+        self.server.close()
+        shutil.rmtree(self.dir)
+
+    def test_001_store(self):
+        blobs = BlobStore()
+        self.assertEqual(blobs.create_store(self.server), True)
+        digests = blobs.put_many(self.server, ['a', 'b', 'a', None])
+        self.assertEqual(digests, [blob_digest('a'), blob_digest('b'),
+                                   blob_digest('a'), None])
+        self.assertEqual((blobs.stored, blobs.reused), (2, 1))
+        # A new store finds what is already on the server.
+        blobs = BlobStore()
+        blobs.put_many(self.server, [u'b', 'c'])
+        self.assertEqual((blobs.stored, blobs.reused), (1, 1))
+        self.assertEqual(blobs.expand(self.server, [digests[1], 'plain',
+                                           None]), ['b', 'plain', None])
+        self.assertEqual(blob_key(digests[0]), digests[0])
+        self.assertEqual(blob_key('a'), digests[0])
+
+    def test_002_import(self):
+        self.assertEqual(self.catalog.has_blobs, True)
+        self.assertEqual(self.catalog.create_database(self.server), True)
+        for bulk in [False, True]:
+            self.assertEqual(self.catalog.import_all(self.server, bulk,
+                                                 store = self.server), True)
+            self.assertEqual(self.server.query("select count(*) from "
+                                               "slurpy_blob"), [(2,)])
+        self.assertEqual(self.server.query("select text from "
+                         "Adobe_imageDevelopSettings order by id_global"),
+                         [(blob_digest(SETTINGS[0][2]),),
+                          (blob_digest(SETTINGS[0][2]),),
+                          (blob_digest(SETTINGS[2][2]),), (None,)])
+        self.assertEqual(self.catalog.compare_tables(self.server,
+                                                     self.server), True)
+
+        fn = os.path.join(self.dir, 'restored.lrcat')
+        self.assertEqual(self.catalog.restore(self.server, fn, self.server),
+                                                                       True)
+        db = SqliteDatabase()
+        db.connect(dbname = fn)
+        self.assertEqual(db.query("select * from Adobe_imageDevelopSettings "
+                                  "order by id_local"), SETTINGS)
+        db.close()
+
+    def test_003_rollback(self):
+        ''' Blobs written in a transaction that is rolled back are
+            written again. '''
+        blobs = BlobStore()
+        self.assertEqual(blobs.create_store(self.server), True)
+        self.server.start_transaction()
+        blobs.put_many(self.server, ['a', 'b'])
+        blobs.put_many(self.server, ['a'])
+        self.assertEqual((blobs.stored, blobs.reused), (2, 1))
+        self.server.rollback()
+        self.server.start_transaction()
+        blobs.put_many(self.server, ['a'])
+        self.server.commit()
+        self.assertEqual(self.server.query("select count(*) from "
+                                           "slurpy_blob"), [(1,)])
+        self.assertEqual(blobs.stored, 3)
+        # Once committed they are found again, and then known.
+        self.server.start_transaction()
+        blobs.put_many(self.server, ['a'])
+        blobs.put_many(self.server, ['a'])
+        self.server.commit()
+        self.assertEqual((blobs.stored, blobs.reused), (3, 3))
+
+if __name__ == '__main__':
+    unittest.main()
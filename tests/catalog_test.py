@@ -1,8 +1,13 @@
 import os
 import sys
+import json
+import shutil
+import tempfile
 import unittest
 
 from slurpy.catalog import Catalog
+from slurpy.schema.field import DatabaseField
+from slurpy.schema.table import DatabaseTable
 from slurpy.databases.postgres import PgDatabase
 
 testDir = os.path.dirname(__file__)
@@ -39,5 +44,47 @@ class TestCatalog(unittest.TestCase):
         self.assertEqual(c.create_database(db, True), True)
         self.assertEqual(c.import_all(db), True)
         self.assertEqual(c.import_all(db), True)
-        
 
+    def test_004_schema_cache(self):
+        ''' A cached schema is loaded without importing the parsers. '''
+        root = DatabaseTable('AgLibraryRootFolder')
+        root.add_field(DatabaseField('id_local', primary_key = True))
+        root.add_field(DatabaseField('absolutePath', unique = True))
+        folder = DatabaseTable('AgLibraryFolder')
+        folder.add_field(DatabaseField('id_local', primary_key = True))
+        folder.add_field(DatabaseField('rootFolder'))
+        folder.get_field('rootFolder').dependancy = 'AgLibraryRootFolder'
+        cache_dir = tempfile.mkdtemp()
+        modules = dict([(m, sys.modules.pop(m)) for m in ['pyparsing',
+                               'slurpy.schema.parser'] if m in sys.modules])
+        try:
+            c = Catalog(os.path.join(testDir, 'files', 'test.lrcat'))
+            with open(c._schema_cache_file(cache_dir), 'w') as fh:
+                json.dump([folder.as_schema_dict(), root.as_schema_dict()], fh)
+            self.assertEqual(c.get_schema_from_catalog(cache_dir), True)
+            self.assertEqual(c.ordered_table_list,
+                             ['AgLibraryRootFolder', 'AgLibraryFolder'])
+            # Root folders are shared, so they are matched for a host.
+            root.add_host_key(c.hostname)
+            self.assertEqual(c.get_table('AgLibraryRootFolder').as_schema_dict(),
+                             root.as_schema_dict())
+            self.assert_('pyparsing' not in sys.modules)
+            self.assert_('slurpy.schema.parser' not in sys.modules)
+        finally:
+            sys.modules.update(modules)
+            shutil.rmtree(cache_dir)
+
+    def test_005_schema_dict(self):
+        t = DatabaseTable('AgLibraryFolder')
+        t.add_field(DatabaseField('id_local', primary_key = True))
+        t.add_field(DatabaseField('id_global', unique = True, null = False))
+        t.add_field(DatabaseField('rootFolder'))
+        t.get_field('rootFolder').add_foreignkey(
+                          'AgLibraryRootFolder(id_local)', 'ON DELETE CASCADE')
+        t.add_index({'name': 'idx', 'columns': ['id_global', 'rootFolder']})
+        t2 = DatabaseTable()
+        self.assertEqual(t2.from_schema_dict(t.as_schema_dict()), True)
+        self.assertEqual(t2.as_schema_dict(), t.as_schema_dict())
+        self.assertEqual(t2.idlocal, True)
+        self.assertEqual(t2.idglobal, 1)
+        self.assertEqual(t2.fk_list(), t.fk_list())
@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from slurpy.catalog import Catalog
+from slurpy.checkpoint import Checkpoint
+from slurpy.translator import IdTranslator
+from slurpy.databases.sqlite import SqliteDatabase
+from restore_test import TEMPLATE_SQL, ROOTS, FOLDERS, _tables
+
+class FailingDatabase(SqliteDatabase):
+    ''' Fails, as if the connection had been lost, once fail_after rows
+        have been inserted. '''
+    fail_after = None
+
+    def insert_row(self, tblname, cols, vals, theid = 'id_local'):
+        if self.fail_after is not None:
+            if self.fail_after == 0:
+                raise RuntimeError('connection lost')
+            self.fail_after -= 1
+        return SqliteDatabase.insert_row(self, tblname, cols, vals, theid)
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fn = os.path.join(self.dir, 'catalog.lrcat')
+        src = SqliteDatabase()
+        src.connect(dbname = fn)
+        for sql in TEMPLATE_SQL:
+            src.execute(sql)
+        src.insert_rows('AgLibraryRootFolder',
+                ['id_local', 'id_global', 'absolutePath'], ROOTS, None)
+        src.insert_rows('AgLibraryFolder',
+                ['id_local', 'id_global', 'pathFromRoot', 'rootFolder'],
+                                                            FOLDERS, None)
+        src.close()
+        self.catalog = Catalog(fn)
+        self.catalog.tables = _tables()
+        self.catalog._get_ordered_table_list()
+        self.db = FailingDatabase()
+        self.db.connect(dbname = ':memory:', commit_policy = 'rows',
+                                                        commit_rows = 1)
+        self.catalog.create_database(self.db)
+
+    def tearDown(self):
+        self.catalog.close()
+        self.db.close()
+        shutil.rmtree(self.dir)
+
+    def test_001_store(self):
+        cp = Checkpoint()
+        cp.set_progress('AgLibraryFolder', 20)
+        cp.set_done('AgLibraryRootFolder')
+        self.assertEqual(cp.save(self.db, 'host', 'cat'), True)
+        cp = Checkpoint()
+        self.assertEqual(cp.load(self.db, 'host', 'cat'), 2)
+        self.assertEqual(cp.is_done('AgLibraryRootFolder'), True)
+        self.assertEqual(cp.is_done('AgLibraryFolder'), False)
+        self.assertEqual(cp.last_id('AgLibraryFolder'), 20)
+        self.assertEqual(cp.clear(self.db, 'host', 'cat'), True)
+        self.assertEqual(cp.load(self.db, 'host', 'cat'), 0)
+
+    def test_002_resume(self):
+        self.db.fail_after = 3
+        self.assertRaises(RuntimeError, self.catalog.run_import, self.db,
+                          store = self.db, checkpoint = True)
+        self.db.rollback()
+        self.assertEqual(self.db.query("select count(*) from "
+                                       "AgLibraryFolder"), [(1,)])
+
+        self.db.fail_after = None
+        metrics = self.catalog.run_import(self.db, store = self.db,
+                                          checkpoint = True)
+        self.assertEqual(metrics.ok, True)
+        self.assertEqual([(t.table, t.rows_read) for t in metrics.tables],
+                         [('AgLibraryFolder', 2)])
+        self.assertEqual(self.db.query("select pathFromRoot from "
+                         "AgLibraryFolder order by pathFromRoot"),
+                         [('2010/',), ('2011/',), ('misc/',)])
+        self.assertEqual(self.db.query("select count(*) from "
+                         "slurpy_checkpoint"), [(0,)])
+
+        # Nothing left to resume, so everything is read again.
+        metrics = self.catalog.run_import(self.db, store = self.db,
+                                          checkpoint = True)
+        self.assertEqual(metrics.totals().rows_read, 5)
+        self.assertEqual(metrics.totals().updated, 5)
+
+    def test_003_commit_saves(self):
+        ''' Translations are saved with every commit of the policy, even
+            without a checkpoint. '''
+        for policy, saved in [('table', 2), ('rows', 3)]:
+            self.tearDown()
+            self.setUp()
+            self.db.set_commit_policy(policy, 1)
+            self.db.fail_after = 3
+            self.assertRaises(RuntimeError, self.catalog.run_import, self.db,
+                              store = self.db)
+            self.db.rollback()
+            ids = IdTranslator()
+            self.assertEqual(ids.load(self.db, *self.catalog.translator_key),
+                             saved)
+            self.assertEqual(self.db.query("select count(*) from "
+                             "AgLibraryRootFolder"), [(2,)])
+
+            self.db.fail_after = None
+            metrics = self.catalog.run_import(self.db, store = self.db)
+            self.assertEqual(metrics.ok, True)
+            self.assertEqual(metrics.totals().updated, saved)
+            self.assertEqual(self.db.query("select count(*) from "
+                             "AgLibraryFolder"), [(3,)])
+
+if __name__ == '__main__':
+    unittest.main()
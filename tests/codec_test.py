@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from slurpy import codec
+from slurpy.catalog import Catalog
+from slurpy.schema.field import DatabaseField, DB_INTEGER
+from slurpy.schema.table import DatabaseTable
+from slurpy.databases.sqlite import SqliteDatabase
+from slurpy.databases.postgres import _copy_value
+from restore_test import TEMPLATE_SQL
+
+IPTC_SQL = "CREATE TABLE AgLibraryIPTC (id_local INTEGER PRIMARY KEY, " \
+           "caption, copyright, image INTEGER NOT NULL DEFAULT 0)"
+IPTC = [(1, u'A long caption ' * 20, u'\xa9 Someone', 7),
+        (2, None, u'\xa9 Someone', 8)]
+
+def _table():
+    tbl = DatabaseTable('AgLibraryIPTC')
+    tbl.add_field(DatabaseField('id_local', DB_INTEGER, primary_key = True))
+    tbl.add_field(DatabaseField('caption'))
+    tbl.add_field(DatabaseField('copyright'))
+    tbl.add_field(DatabaseField('image', DB_INTEGER))
+    return tbl
+
+class TestCodec(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fn = os.path.join(self.dir, 'catalog.lrcat')
+        src = SqliteDatabase()
+        src.connect(dbname = fn)
+        for sql in TEMPLATE_SQL + [IPTC_SQL]:
+            src.execute(sql)
+        src.insert_rows('AgLibraryIPTC', ['id_local', 'caption',
+                        'copyright', 'image'], IPTC, None)
+        src.close()
+        self.catalog = Catalog(fn)
+        self.catalog.tables = [_table()]
+        self.catalog._get_ordered_table_list()
+        self.server = SqliteDatabase()
+        self.server.connect(dbname = ':memory:')
+
+    def tearDown(self):
+        self.catalog.close()
+        self.server.close()
+        shutil.rmtree(self.dir)
+
+    def test_001_compress(self):
+        for name in codec.CODECS.keys():
+            data = codec.compress(name, u'caf\xe9 ' * 100)
+            self.assertTrue(isinstance(data, buffer))
+            self.assertTrue(len(data) < 100)
+            self.assertEqual(codec.decompress(name, data), u'caf\xe9 ' * 100)
+            self.assertEqual(codec.compress(name, None), None)
+            self.assertEqual(codec.decompress(name, u'plain'), u'plain')
+        self.assertRaises(ValueError, codec.check_codec, 'nope')
+        self.assertEqual(_copy_value(buffer('a\\b')), '\\\\x615c62')
+
+    def test_002_pool(self):
+        values = [u'value %d ' % n * 10 for n in xrange(200)]
+        serial = [codec.compress('zlib', v) for v in values]
+        pooled = codec.compress_many('zlib', values)
+        self.assertEqual([str(v) for v in pooled], [str(v) for v in serial])
+        self.assertEqual(codec.decompress_many('zlib', pooled), values)
+        codec.set_workers(0)
+        try:
+            self.assertEqual(codec.decompress_many('zlib', pooled), values)
+        finally:
+            codec.set_workers(None)
+
+    def test_003_import(self):
+        self.assertEqual(self.catalog.compress_fields(), 2)
+        self.assertEqual(self.catalog.create_database(self.server), True)
+        for bulk in [False, True]:
+            self.assertEqual(self.catalog.import_all(self.server, bulk,
+                                                 store = self.server), True)
+        rows = self.server.query("select caption, copyright from "
+                                 "AgLibraryIPTC order by image")
+        self.assertTrue(isinstance(rows[0][0], buffer))
+        self.assertEqual(rows[1][0], None)
+        self.assertEqual(codec.decompress('zlib', rows[0][1]), IPTC[0][2])
+        self.assertEqual(self.catalog.compare_tables(self.server,
+                                                     self.server), True)
+
+        fn = os.path.join(self.dir, 'restored.lrcat')
+        self.assertEqual(self.catalog.restore(self.server, fn, self.server),
+                                                                       True)
+        db = SqliteDatabase()
+        db.connect(dbname = fn)
+        self.assertEqual(db.query("select * from AgLibraryIPTC order by "
+                                  "id_local"), IPTC)
+        db.close()
+
+    def _catalog(self):
+        ''' Another Catalog for the same file, without compress_fields. '''
+        c = Catalog(self.catalog.filename)
+        c.tables = [_table()]
+        c._get_ordered_table_list()
+        return c
+
+    def test_004_recorded(self):
+        ''' The codecs the columns were created with are read back from
+            the server, and imports using others are refused. '''
+        self.catalog.compress_fields()
+        self.assertEqual(self.catalog.create_database(self.server), True)
+        self.assertEqual(self.catalog.import_all(self.server,
+                                             store = self.server), True)
+        plain = self._catalog()
+        try:
+            self.assertEqual(plain.compare_tables(self.server, self.server),
+                                                                       True)
+            fn = os.path.join(self.dir, 'restored.lrcat')
+            self.assertEqual(plain.restore(self.server, fn, self.server),
+                                                                       True)
+            db = SqliteDatabase()
+            db.connect(dbname = fn)
+            self.assertEqual(db.query("select * from AgLibraryIPTC order by "
+                                      "id_local"), IPTC)
+            db.close()
+            # Writing text to the compressed columns is refused.
+            self.assertEqual(plain.create_database(self.server), False)
+            self.assertEqual(plain.import_all(self.server), False)
+            if codec.CODECS.has_key('lzma'):
+                plain.compress_fields('lzma')
+                self.assertEqual(plain.import_all(self.server), False)
+            # As is compressing values for columns created for text.
+            server = SqliteDatabase()
+            server.connect(dbname = ':memory:')
+            self.assertEqual(self._catalog().create_database(server), True)
+            self.assertEqual(self.catalog.import_all(server), False)
+            self.assertEqual(server.query("select count(*) from "
+                                          "AgLibraryIPTC"), [(0,)])
+            server.close()
+        finally:
+            plain.close()
+
+    def test_005_server_types(self):
+        ''' Columns are recorded by their type on the server, where it is
+            known, once all the tables have been created. '''
+        class _Server(SqliteDatabase):
+            calls = []
+            def get_table_columns(self, tblname):
+                self.calls.append(tblname)
+                return {'columns': [{'name': 'caption', 'data_type': 'text'},
+                                    {'name': 'copyright',
+                                     'data_type': 'bytea'}]}
+        server = _Server()
+        server.connect(dbname = ':memory:')
+        try:
+            self.catalog.compress_fields(fields = {'AgLibraryIPTC':
+                                                                 ['caption']})
+            # The columns already exist, with other settings.
+            self.assertEqual(self.catalog.create_database(server), False)
+            self.assertEqual(server.calls, ['AgLibraryIPTC'])
+            codecs = codec.CodecStore()
+            self.assertEqual(codecs.load(server), 1)
+            tbl = self.catalog.get_table('AgLibraryIPTC')
+            self.assertEqual(codecs.mismatches(tbl), ['caption', 'copyright'])
+            self.assertEqual(codecs.codec(tbl, tbl.get_field('copyright')),
+                                                                      'zlib')
+        finally:
+            server.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import sys
+import unittest
+
+from slurpy.fingerprint import Fingerprints, row_digest
+from slurpy.databases.sqlite import SqliteDatabase
+
+class TestFingerprints(unittest.TestCase):
+    def test_001_digest(self):
+        self.assertEqual(row_digest([1, 'abc', None]),
+                         row_digest([1, u'abc', None]))
+        self.assertNotEqual(row_digest([1, 'abc', None]),
+                            row_digest([1, 'abc', '']))
+        self.assertNotEqual(row_digest(['ab', 'c']), row_digest(['a', 'bc']))
+
+    def test_002_store(self):
+        db = SqliteDatabase()
+        self.assertEqual(db.connect(dbname = ':memory:'), True)
+        fp = Fingerprints()
+        fp.set_value('Adobe_images', 1, 'aaa')
+        fp.set_value('Adobe_images', 2, 'bbb')
+        self.assertEqual(fp.get_value('adobe_images', '1'), 'aaa')
+        self.assertEqual(fp.save(db, 'host', 'cat'), True)
+
+        fp = Fingerprints()
+        self.assertEqual(fp.load(db, 'host', 'cat'), 2)
+        self.assertEqual(fp.get_value('Adobe_images', 2), 'bbb')
+        fp.set_value('Adobe_images', 2, 'ccc')
+        self.assertEqual(fp.save(db, 'host', 'cat'), True)
+
+        fp = Fingerprints()
+        self.assertEqual(fp.load(db, 'host', 'cat'), 2)
+        self.assertEqual(fp.get_value('Adobe_images', 1), 'aaa')
+        self.assertEqual(fp.get_value('Adobe_images', 2), 'ccc')
+        self.assertEqual(fp.get_value('Adobe_images', 3), None)
+        self.assertEqual(db.close(), True)
+
+    def test_003_staging(self):
+        db = SqliteDatabase()
+        self.assertEqual(db.connect(dbname = ':memory:'), True)
+        fp = Fingerprints()
+        self.assertEqual([fp.next_key('t', 'aaa') for n in range(3)],
+                         ['aaa', 'aaa:1', 'aaa:2'])
+        for k in [1, 2, 3]:
+            fp.seen('t', k)
+            fp.stage('t', k, 'd%d' % k)
+        self.assertEqual(fp.get_value('t', 1), None)
+        fp.written()
+        self.assertEqual(fp.get_value('t', 1), 'd1')
+        self.assertEqual(fp.save(db, 'host', 'cat'), True)
+
+        # Row 2 has gone. Nothing is pruned until the table is finished.
+        fp = Fingerprints()
+        self.assertEqual(fp.load(db, 'host', 'cat'), 3)
+        fp.seen('t', 1)
+        fp.seen('t', 3)
+        self.assertEqual(fp.save(db, 'host', 'cat'), True)
+        self.assertEqual(Fingerprints().load(db, 'host', 'cat'), 3)
+        fp.finish_table('T')
+        self.assertEqual(fp.save(db, 'host', 'cat'), True)
+        self.assertEqual(fp.get_value('t', 2), None)
+        fp = Fingerprints()
+        self.assertEqual(fp.load(db, 'host', 'cat'), 2)
+        self.assertEqual(fp.get_value('t', 3), 'd3')
+        db.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from slurpy.catalog import Catalog
+from slurpy.translator import IdTranslator
+from slurpy.databases.sqlite import SqliteDatabase
+from slurpy.databases.pool import DatabasePool
+from restore_test import TEMPLATE_SQL, ROOTS, FOLDERS, _tables
+
+def _make_catalog(filename, roots = ROOTS, folders = FOLDERS,
+                                                  hostname = None):
+    src = SqliteDatabase()
+    src.connect(dbname = filename)
+    for sql in TEMPLATE_SQL:
+        src.execute(sql)
+    src.insert_rows('AgLibraryRootFolder',
+            ['id_local', 'id_global', 'absolutePath'], roots, None)
+    src.insert_rows('AgLibraryFolder',
+            ['id_local', 'id_global', 'pathFromRoot', 'rootFolder'],
+                                                          folders, None)
+    src.close()
+    c = Catalog(filename)
+    if hostname:
+        c.hostname = hostname
+    c.tables = _tables()
+    c._mark_shared_tables()
+    c._get_ordered_table_list()
+    return c
+
+class TestImport(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.catalog = _make_catalog(os.path.join(self.dir, 'catalog.lrcat'))
+        self.store = SqliteDatabase()
+        self.store.connect(dbname = ':memory:')
+        self.servers = []
+
+    def tearDown(self):
+        self.catalog.close()
+        self.store.close()
+        for db in self.servers:
+            db.close()
+        shutil.rmtree(self.dir)
+
+    def _server(self):
+        db = SqliteDatabase()
+        db.connect(dbname = ':memory:')
+        self.servers.append(db)
+        return db
+
+    def _folders(self, db):
+        return db.query("select f.pathFromRoot, r.absolutePath from "
+                        "AgLibraryFolder f join AgLibraryRootFolder r on "
+                        "f.rootFolder=r.id_local order by f.pathFromRoot")
+
+    def test_001_recreated_server(self):
+        expected = [('2010/', '/photos/'), ('2011/', '/photos/'),
+                    ('misc/', '/other/')]
+        for bulk in [False, True]:
+            db = self._server()
+            self.assertEqual(self.catalog.create_database(db, True,
+                                               store = self.store), True)
+            self.assertEqual(self.catalog.import_all(db, bulk,
+                                               store = self.store), True)
+            self.assertEqual(self._folders(db), expected)
+            ids = IdTranslator()
+            self.assertEqual(ids.load(self.store,
+                                      *self.catalog.translator_key), 5)
+
+            # The server is recreated but the store is kept, so every
+            # stored id refers to a row that has gone.
+            db = self._server()
+            self.assertEqual(self.catalog.create_database(db), True)
+            metrics = self.catalog.run_import(db, bulk, store = self.store)
+            self.assertEqual(metrics.ok, True)
+            self.assertEqual([(t.updated, t.inserted)
+                              for t in metrics.tables], [(0, 2), (0, 3)])
+            self.assertEqual(self._folders(db), expected)
+
+            # Dropping the tables also drops the state in the store.
+            self.assertEqual(self.catalog.create_database(db, True,
+                                               store = self.store), True)
+            ids = IdTranslator()
+            self.assertEqual(ids.load(self.store,
+                                      *self.catalog.translator_key), 0)
+
+    def test_002_parallel_failure(self):
+        fn = os.path.join(self.dir, 'server.db')
+        db = SqliteDatabase()
+        db.connect(dbname = fn)
+        self.servers.append(db)
+        self.assertEqual(self.catalog.create_database(db, True), True)
+        fail = lambda *args, **kwargs: False
+        self.catalog.get_table('AgLibraryFolder').move_data = fail
+        # The workers open their connections, as SQLite's can't be shared
+        # between threads, and they are left for the garbage collector.
+        pool = DatabasePool(SqliteDatabase, 2, dbname = fn)
+        self.assertEqual(self.catalog.import_parallel(pool,
+                                            store = self.store), False)
+        # The root folders were committed, so their ids are kept.
+        ids = IdTranslator()
+        self.assertEqual(ids.load(self.store, *self.catalog.translator_key),
+                         2)
+        self.assertEqual(ids.get_value('AgLibraryFolder', 1), -1)
+        self.assertEqual(db.query("select count(*) from AgLibraryRootFolder"),
+                         [(2,)])
+
+    def test_003_shared_roots(self):
+        ''' Catalogs with the same root folder share its row, unless they
+            are on different hosts. '''
+        others = [_make_catalog(os.path.join(self.dir, 'second.lrcat'),
+                                [(5, 'cccc-1', '/photos/')],
+                                [(6, 'cccc-2', '2012/', 5)]),
+                  _make_catalog(os.path.join(self.dir, 'third.lrcat'),
+                                [(5, 'dddd-1', '/photos/')],
+                                [(6, 'dddd-2', '2012/', 5)], 'elsewhere')]
+        try:
+            for bulk in [False, True]:
+                db = self._server()
+                self.assertEqual(self.catalog.create_database(db), True)
+                for c in [self.catalog] + others:
+                    self.assertEqual(c.import_all(db, bulk, store = db), True)
+                self.assertEqual(db.query("select absolutePath, slurpy_host "
+                                 "from AgLibraryRootFolder order by id_local"),
+                                 [('/photos/', self.catalog.hostname),
+                                  ('/other/', self.catalog.hostname),
+                                  ('/photos/', 'elsewhere')])
+                self.assertEqual(sorted(db.query("select r.slurpy_host from "
+                                 "AgLibraryFolder f join AgLibraryRootFolder r "
+                                 "on f.rootFolder=r.id_local where "
+                                 "f.pathFromRoot='2012/'")),
+                                 sorted([(self.catalog.hostname,),
+                                         ('elsewhere',)]))
+                self.assertEqual(db.query("select count(*) from "
+                                          "AgLibraryFolder"), [(5,)])
+                # A second import of each finds the same rows.
+                for c in [self.catalog] + others:
+                    self.assertEqual(c.import_all(db, bulk, store = db), True)
+                self.assertEqual(db.query("select count(*) from "
+                                          "AgLibraryRootFolder"), [(3,)])
+        finally:
+            for c in others:
+                c.close()
+
+if __name__ == '__main__':
+    unittest.main()
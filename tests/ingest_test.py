@@ -0,0 +1,34 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from slurpy.ingest import find_catalogs, CatalogIngest
+
+class TestIngest(unittest.TestCase):
+    def test_001_find(self):
+        top = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(top, 'a', 'b'))
+            names = [os.path.join(top, 'one.lrcat'),
+                     os.path.join(top, 'a', 'b', 'Two.LRCAT'),
+                     os.path.join(top, 'a', 'notes.txt')]
+            for fn in names:
+                open(fn, 'w').close()
+            self.assertEqual(find_catalogs([top]), sorted(names[:2]))
+            self.assertEqual(find_catalogs([names[2], top, names[0]]),
+                                               sorted(names))
+            self.assertEqual(find_catalogs([os.path.join(top, 'nothing')]), [])
+        finally:
+            shutil.rmtree(top)
+
+    def test_002_options(self):
+        ingest = CatalogIngest([], {'dbname': 'slurpy'})
+        self.assertEqual(ingest.db_kwargs['commit_policy'], 'table')
+        ingest = CatalogIngest([], {'commit_policy': 'rows'})
+        self.assertEqual(ingest.db_kwargs['commit_policy'], 'rows')
+        self.assertEqual(ingest.run(), True)
+
+if __name__ == '__main__':
+    unittest.main()
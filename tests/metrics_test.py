@@ -0,0 +1,80 @@
+import os
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+
+from slurpy.catalog import Catalog
+from slurpy.metrics import TableMetrics, ImportMetrics
+from slurpy.databases.sqlite import SqliteDatabase
+from restore_test import TEMPLATE_SQL, ROOTS, FOLDERS, _tables
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fn = os.path.join(self.dir, 'catalog.lrcat')
+        src = SqliteDatabase()
+        src.connect(dbname = fn)
+        for sql in TEMPLATE_SQL:
+            src.execute(sql)
+        src.insert_rows('AgLibraryRootFolder',
+                ['id_local', 'id_global', 'absolutePath'], ROOTS, None)
+        src.insert_rows('AgLibraryFolder',
+                ['id_local', 'id_global', 'pathFromRoot', 'rootFolder'],
+                                                            FOLDERS, None)
+        src.close()
+        self.catalog = Catalog(fn)
+        self.catalog.tables = _tables()
+        self.catalog._get_ordered_table_list()
+        self.db = SqliteDatabase()
+        self.db.connect(dbname = ':memory:')
+        self.catalog.create_database(self.db)
+
+    def tearDown(self):
+        self.catalog.close()
+        self.db.close()
+        shutil.rmtree(self.dir)
+
+    def test_001_timed_rows(self):
+        tm = TableMetrics('t')
+        self.assertEqual(list(tm.timed_rows(iter([1, 2, 3]))), [1, 2, 3])
+        self.assertEqual(tm.rows_read, 3)
+        self.assertEqual(tm.timed('write', max, 4, 5), 5)
+        self.assertTrue(tm.write >= 0)
+
+    def test_002_import(self):
+        for bulk in [False, True]:
+            metrics = self.catalog.run_import(self.db, bulk)
+            self.assertEqual(metrics.ok, True)
+            self.assertEqual([t.table for t in metrics.tables],
+                             ['AgLibraryRootFolder', 'AgLibraryFolder'])
+            totals = metrics.totals()
+            self.assertEqual(totals.rows_read, 5)
+            self.assertTrue(totals.queries > 0)
+            if not bulk:
+                self.assertEqual(totals.inserted, 5)
+            else:
+                # No translations were stored, so rows are found by their
+                # unique keys.
+                self.assertEqual(totals.inserted, 0)
+                self.assertEqual(totals.deduplicated, 5)
+
+    def test_003_reports(self):
+        metrics = self.catalog.run_import(self.db)
+        fn = os.path.join(self.dir, 'metrics.json')
+        metrics.write_json(fn)
+        with open(fn) as fh:
+            data = json.load(fh)
+        self.assertEqual(data['ok'], True)
+        self.assertEqual(data['totals']['inserted'], 5)
+        fn = os.path.join(self.dir, 'metrics.csv')
+        metrics.write_csv(fn)
+        with open(fn) as fh:
+            rows = list(csv.reader(fh))
+        self.assertEqual(rows[0], TableMetrics.FIELDS)
+        self.assertEqual([r[0] for r in rows[1:]],
+                         ['AgLibraryRootFolder', 'AgLibraryFolder', 'total'])
+
+if __name__ == '__main__':
+    unittest.main()
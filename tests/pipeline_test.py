@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from slurpy.catalog import Catalog
+from slurpy.pipeline import ImportPipeline
+from slurpy.translator import IdTranslator
+from slurpy.databases.sqlite import SqliteDatabase
+from restore_test import TEMPLATE_SQL, ROOTS, FOLDERS, _tables
+
+class FailingDatabase(SqliteDatabase):
+    fail = False
+
+    def insert_rows(self, tblname, cols, rows, theid = 'id_local'):
+        if self.fail:
+            return None
+        return SqliteDatabase.insert_rows(self, tblname, cols, rows, theid)
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fn = os.path.join(self.dir, 'catalog.lrcat')
+        src = SqliteDatabase()
+        src.connect(dbname = fn)
+        for sql in TEMPLATE_SQL:
+            src.execute(sql)
+        src.insert_rows('AgLibraryRootFolder',
+                ['id_local', 'id_global', 'absolutePath'], ROOTS, None)
+        src.insert_rows('AgLibraryFolder',
+                ['id_local', 'id_global', 'pathFromRoot', 'rootFolder'],
+                       FOLDERS + [(n, 'cccc-%d' % n, '%d/' % n, 11)
+                                  for n in xrange(100, 150)], None)
+        src.close()
+        self.catalog = Catalog(fn, readonly = True)
+        self.catalog.tables = _tables()
+        self.catalog._get_ordered_table_list()
+        self.db = FailingDatabase()
+        self.db.connect(dbname = ':memory:')
+        self.catalog.create_database(self.db)
+
+    def tearDown(self):
+        self.catalog.close()
+        self.db.close()
+        shutil.rmtree(self.dir)
+
+    def _folders(self, db):
+        return db.query("select pathFromRoot, rootFolder from AgLibraryFolder "
+                        "order by pathFromRoot")
+
+    def test_001_import(self):
+        metrics = self.catalog.run_import(self.db, store = self.db,
+                                          differential = True, pipeline = True)
+        self.assertEqual(metrics.ok, True)
+        self.assertEqual([(t.table, t.rows_read, t.inserted)
+                          for t in metrics.tables],
+                         [('AgLibraryRootFolder', 2, 2),
+                          ('AgLibraryFolder', 53, 53)])
+        other = SqliteDatabase()
+        other.connect(dbname = ':memory:')
+        self.catalog.create_database(other)
+        self.assertEqual(self.catalog.import_all(other, True), True)
+        self.assertEqual(self._folders(self.db), self._folders(other))
+        other.close()
+
+        # Nothing has changed, so a differential import skips every row.
+        metrics = self.catalog.run_import(self.db, store = self.db,
+                                          differential = True, pipeline = True)
+        self.assertEqual(metrics.ok, True)
+        self.assertEqual([t.skipped for t in metrics.tables], [2, 53])
+        self.assertEqual(sum([t.inserted + t.updated
+                              for t in metrics.tables]), 0)
+
+    def test_002_backpressure(self):
+        ''' With a small queue the reader waits for the writer. '''
+        tbl = self.catalog.get_table('AgLibraryFolder')
+        ids = IdTranslator()
+        for r in ROOTS:
+            ids.set_value('AgLibraryRootFolder', r[0], r[0])
+        pipe = ImportPipeline(self.catalog.open_source, batch_size = 5,
+                                                              depth = 1)
+        self.assertEqual(pipe.move_data(tbl, ids, self.db), True)
+        self.assertEqual(len(self._folders(self.db)), 53)
+        self.assertEqual(ids.get_value('AgLibraryFolder', 149) > 0, True)
+        self.assertEqual(pipe.waits['read'] > 0, True)
+        self.assertEqual(threading.active_count(), 1)
+
+    def test_003_failures(self):
+        tbl = self.catalog.get_table('AgLibraryFolder')
+        pipe = ImportPipeline(lambda: None)
+        self.assertEqual(pipe.move_data(tbl, IdTranslator(), self.db), False)
+        self.assertEqual(self._folders(self.db), [])
+
+        self.db.fail = True
+        pipe = ImportPipeline(self.catalog.open_source, batch_size = 5,
+                                                              depth = 1)
+        self.assertEqual(pipe.move_data(tbl, IdTranslator(), self.db), False)
+        self.assertEqual(self._folders(self.db), [])
+        self.assertEqual(threading.active_count(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
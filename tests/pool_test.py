@@ -0,0 +1,40 @@
+import sys
+import unittest
+
+from slurpy.databases.pool import DatabasePool
+from slurpy.databases.sqlite import SqliteDatabase
+
+class TestPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = DatabasePool(SqliteDatabase, 2, dbname = ':memory:')
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_001_get(self):
+        self.assertEqual(len(self.pool), 2)
+        a = self.pool.get()
+        b = self.pool.get()
+        self.assertEqual(a.connected, True)
+        self.assertNotEqual(a, b)
+        self.assertEqual(self.pool.get(0.01), None)
+        self.pool.put(a)
+        self.assertEqual(self.pool.get(), a)
+
+    def test_002_connection(self):
+        with self.pool.connection() as db:
+            db.start_transaction()
+            self.assertEqual(db.in_transaction, True)
+        # Uncommitted work is rolled back when a connection is returned.
+        self.assertEqual(db.in_transaction, False)
+        with self.pool.connection() as db2:
+            self.assertEqual(db2, db)
+        self.assertEqual(self.pool.close(), True)
+        self.assertEqual(db.connected, False)
+
+    def test_003_failed(self):
+        pool = DatabasePool(SqliteDatabase, 1, dbname = '/no/such/dir/x.db')
+        self.assertEqual(pool.get(), None)
+
+if __name__ == '__main__':
+    unittest.main()
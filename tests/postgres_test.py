@@ -1,10 +1,16 @@
 import os
 import sys
+import json
+import shutil
+import tempfile
 import unittest
 
 from slurpy.database import table_from_string
-from slurpy.databases.postgres import PgDatabase
+from slurpy.databases.postgres import PgDatabase, _copy_value, \
+                                     _numbered_params
 from slurpy.catalog import Catalog
+from slurpy.schema.field import DatabaseField
+from slurpy.schema.table import DatabaseTable
 
 testDir = os.path.dirname(__file__)
 
@@ -66,4 +72,155 @@ class TestPg(unittest.TestCase):
         self.assertEqual(db.connect(**kwargs), True)
 
         self.assertEqual(c.create_database(db, True), True)
-        
+
+    def test_006_copy_values(self):
+        tests = [ [None, '\\N'], [12, '12'], ['abc', 'abc'],
+                  ['a\tb\nc', 'a\\tb\\nc'], ['c:\\temp', 'c:\\\\temp'],
+                  [u'caf\xe9', 'caf\xc3\xa9'] ]
+        for t in tests:
+            self.assertEqual(_copy_value(t[0]), t[1])
+
+    def test_007_schema_cache(self):
+        db = PgDatabase()
+        db._schema = {'agfolder': {
+                          'columns': [['id_local', 'integer', None],
+                                      ['id_global', 'uuid', None],
+                                      ['root', 'integer', None],
+                                      ['parent', 'integer', None]],
+                          'fkeys': [['root', 'agroot', 'id_local'],
+                                    ['parent', 'agfolder', 'id_local']],
+                          'unique': ['id_global']}}
+        info = db.get_table_columns('AgFolder')
+        self.assertEqual(info['column_list'],
+                         ['id_local', 'id_global', 'root', 'parent'])
+        self.assertEqual(info['relations'][0]['foreign_table'], 'agroot')
+        self.assertEqual(info['relations'][0]['n'], 2)
+        self.assertEqual(info['self_relations'][0]['n'], 3)
+        self.assertEqual(info['unique'], [{'column': 'id_global', 'n': 1}])
+        self.assertEqual(db.get_table_columns('blah')['columns'], [])
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(tmpdir, 'schema.json')
+            self.assertEqual(db.save_schema_cache(fn, '0300025'), True)
+            db.invalidate_schema_cache()
+            self.assertEqual(db.load_schema_cache(fn, '0300026'), False)
+            self.assertEqual(db.load_schema_cache(fn, '0300025'), True)
+            self.assertEqual(db.get_table_columns('agfolder'), info)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_008_deferred(self):
+        t = DatabaseTable('AgLibraryFolder')
+        t.add_field(DatabaseField('id_local', primary_key = True))
+        t.add_field(DatabaseField('id_global', unique = True, null = False))
+        t.add_field(DatabaseField('rootFolder'))
+        t.get_field('rootFolder').add_foreignkey(
+                          'AgLibraryRootFolder(id_local)', 'ON DELETE CASCADE')
+        t.add_index({'name': 'idx', 'columns': ['id_global', 'rootFolder']})
+        db = PgDatabase()
+        stmts = []
+        db._execute = lambda sql, args = []: stmts.append(sql) or True
+        self.assertEqual(db._create(t, deferred = True), True)
+        self.assertEqual('UNIQUE' in stmts[0], False)
+        self.assertEqual('REFERENCES' in stmts[0], False)
+        self.assertEqual('PRIMARY KEY' in stmts[0], True)
+        stmts[:] = []
+        self.assertEqual(db._add_constraints(t, False), True)
+        self.assertEqual(db._add_constraints(t, True), True)
+        self.assertEqual(stmts, [
+            'ALTER TABLE AgLibraryFolder ADD UNIQUE (id_global)',
+            'ALTER TABLE AgLibraryFolder ADD UNIQUE (id_global, rootFolder)',
+            'ALTER TABLE AgLibraryFolder ADD FOREIGN KEY (rootFolder) '
+            'REFERENCES AgLibraryRootFolder (id_local) ON DELETE CASCADE'])
+
+    def test_009_prepared(self):
+        self.assertEqual(_numbered_params('select a from b where c=? and d=?'),
+                         ('select a from b where c=$1 and d=$2', 2))
+        self.assertEqual(_numbered_params('insert into b (a) values (%s)'),
+                         ('insert into b (a) values ($1)', 1))
+
+        class _Cursor(object):
+            def __init__(self):
+                self.stmts = []
+            def execute(self, sql, args = None):
+                self.stmts.append(sql)
+        db = PgDatabase()
+        cur = _Cursor()
+        sql = 'select a from b where c=?'
+        self.assertEqual(db._prepared_name(cur, sql, []), None)
+        self.assertEqual(db._prepared_name(cur, sql, [1]), 'slurpy_stmt_0')
+        self.assertEqual(db._prepared_name(cur, sql, [2]), 'slurpy_stmt_0')
+        self.assertEqual(cur.stmts, ['SAVEPOINT slurpy_prepare',
+                      'PREPARE slurpy_stmt_0 AS select a from b where c=$1',
+                      'RELEASE SAVEPOINT slurpy_prepare'])
+        self.assertEqual(db._prepared_name(cur, "select '?' from b where c=?",
+                                                                  [1]), None)
+        db = PgDatabase(prepare = 'false')
+        self.assertEqual(db._prepared_name(cur, sql, [1]), None)
+
+    def test_010_iter_query_error(self):
+        import psycopg2
+        class _Cursor(object):
+            closed = False
+            def execute(self, sql, args = None):
+                raise psycopg2.ProgrammingError('no such table')
+            def close(self):
+                self.closed = True
+        class _Db(object):
+            rollbacks = 0
+            def cursor(self, name = None, withhold = False):
+                return _Cursor()
+            def rollback(self):
+                self.rollbacks += 1
+        db = PgDatabase()
+        db._db = _Db()
+        db.connected = True
+        # An open transaction is left for the caller to roll back.
+        db.in_transaction = True
+        self.assertRaises(psycopg2.ProgrammingError, list,
+                          db.iter_query('select a from b'))
+        self.assertEqual((db._db.rollbacks, db.in_transaction), (0, True))
+        db.in_transaction = False
+        self.assertRaises(psycopg2.ProgrammingError, list,
+                          db.iter_query('select a from b'))
+        self.assertEqual(db._db.rollbacks, 1)
+
+    def test_011_shared_folders(self):
+        ''' Catalogs of a host sharing a root folder and a folder path can
+            be ingested at the same time. '''
+        from slurpy.ingest import CatalogIngest
+        from import_test import _make_catalog
+        from restore_test import _tables
+        kwargs = {'dbname': 'slurpy', 'user': 'slurpy', 'password': 'slurpy' }
+        top = tempfile.mkdtemp()
+        try:
+            tables = _tables()
+            # As in Lightroom, a folder is unique within its root folder.
+            tables[1].add_index({'name': 'idx',
+                                 'columns': ['rootFolder', 'pathFromRoot']})
+            names = []
+            for n in xrange(4):
+                fn = os.path.join(top, 'catalog%d.lrcat' % n)
+                c = _make_catalog(fn, [(1, 'root-%d' % n, '/photos/')],
+                                      [(2, 'folder-%d' % n, '2012/', 1)])
+                with open(c._schema_cache_file(top), 'w') as fh:
+                    json.dump([t.as_schema_dict() for t in tables], fh)
+                c.close()
+                names.append(fn)
+            c = Catalog(names[0])
+            self.assertEqual(c.get_schema_from_catalog(top), True)
+            db = PgDatabase()
+            self.assertEqual(db.connect(**kwargs), True)
+            self.assertEqual(c.create_database(db, True), True)
+            c.close()
+
+            ingest = CatalogIngest(names, kwargs, jobs = 4, cache_dir = top)
+            self.assertEqual(ingest.run(False), True)
+            self.assertEqual(db.query("select count(*) from "
+                                      "AgLibraryRootFolder"), [(1,)])
+            self.assertEqual(db.query("select count(*) from "
+                                      "AgLibraryFolder"), [(1,)])
+            db.close()
+        finally:
+            shutil.rmtree(top)
@@ -0,0 +1,74 @@
+import unittest
+
+from slurpy.profiler import normalize_sql, QueryProfiler
+from slurpy.databases.sqlite import SqliteDatabase
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.profiler = QueryProfiler(keep = 2)
+        self.db = SqliteDatabase()
+        self.db.connect(dbname = ':memory:', tracer = self.profiler)
+        self.db.execute("create table t (id integer primary key, name text)")
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_001_normalize(self):
+        self.assertEqual(normalize_sql("select *  from t\n where id=12 "
+                         "and name='it''s'"),
+                         "select * from t where id=? and name=?")
+        self.assertEqual(normalize_sql("select id from t2 where id in "
+                         "(%s, %s, %s)"), "select id from t2 where id in (...)")
+        self.assertEqual(normalize_sql("EXECUTE slurpy_stmt_3 ($1, $2)"),
+                         "EXECUTE slurpy_stmt_3 (...)")
+
+    def test_002_trace(self):
+        for n in xrange(3):
+            self.db.insert_row('t', ['name'], ['row %d' % n])
+        self.db.insert_rows('t', ['name'], [['a'], ['b']], None)
+        self.assertEqual(len(self.db.query("select * from t where id > ?",
+                                                                  [0])), 5)
+        self.assertEqual(len(list(self.db.iter_query("select * from t where "
+                                                    "id > ?", [2]))), 3)
+        st = self.profiler.stats["INSERT INTO t (name) VALUES (?)"]
+        self.assertEqual((st.calls, st.args, st.rows), (4, 5, 5))
+        st = self.profiler.stats["select * from t where id > ?"]
+        self.assertEqual((st.calls, st.rows), (2, 8))
+        self.assertEqual(list(self.profiler.calls), [
+            ("select * from t where id > ?", 1, 5, self.profiler.calls[0][3]),
+            ("select * from t where id > ?", 1, 3, self.profiler.calls[1][3])])
+        self.assertEqual(self.db.statements, 7)
+
+    def test_003_top(self):
+        self.db.query("select * from t")
+        self.db.query("select * from t")
+        top = self.profiler.top(1, 'calls')
+        self.assertEqual([(st.sql, st.calls) for st in top],
+                         [("select * from t", 2)])
+        self.db.set_tracer(None)
+        self.db.query("select * from t")
+        self.assertEqual(self.profiler.stats["select * from t"].calls, 2)
+        self.profiler.reset()
+        self.assertEqual(self.profiler.stats, {})
+
+    def test_004_batches(self):
+        ''' Batches are traced with all of their arguments, and queries
+            when they stop being read. '''
+        self.db.execute("create table u (id_local integer primary key, "
+                        "name text)")
+        self.db.insert_rows('u', ['id_local', 'name'], [[1, 'a'], [2, 'b'],
+                                                        [3, 'c']], None)
+        st = self.profiler.stats["INSERT INTO u (id_local,name) VALUES (...)"]
+        self.assertEqual((st.calls, st.args, st.rows), (1, 6, 3))
+        self.assertEqual(self.db.update_rows('u', ['name'], [['x'], ['y']],
+                                             [1, 2]), [1, 2])
+        st = self.profiler.stats["UPDATE u SET name=? WHERE id_local=?"]
+        self.assertEqual((st.calls, st.args, st.rows), (1, 4, 2))
+        rows = self.db.iter_query("select * from u")
+        rows.next()
+        rows.close()
+        st = self.profiler.stats["select * from u"]
+        self.assertEqual((st.calls, st.rows), (1, 1))
+
+if __name__ == '__main__':
+    unittest.main()
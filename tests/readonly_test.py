@@ -0,0 +1,75 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from slurpy.catalog import Catalog
+from slurpy.databases.sqlite import SqliteDatabase
+
+from restore_test import TEMPLATE_SQL
+
+class TestReadOnly(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dir, 'template.lrcat')
+        db = SqliteDatabase()
+        db.connect(dbname = self.fn)
+        for sql in TEMPLATE_SQL:
+            db.execute(sql)
+        db.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_001_readonly(self):
+        db = SqliteDatabase()
+        self.assertEqual(db.connect(dbname = self.fn, readonly = True,
+                                    mmap_size = 1 << 20, cache_kb = 1000), True)
+        self.assertEqual(db.readonly, True)
+        self.assertEqual(db.query("PRAGMA query_only"), [(1,)])
+        self.assertEqual(db.query("PRAGMA cache_size"), [(-1000,)])
+        self.assertEqual(len(db.query("select * from Adobe_variablesTable")), 2)
+        self.assertEqual(db.execute("delete from Adobe_variablesTable"), False)
+        db.close()
+        # A missing file isn't created.
+        missing = os.path.join(self.dir, 'missing.lrcat')
+        self.assertEqual(db.connect(dbname = missing, readonly = True), False)
+        self.assertEqual(os.path.exists(missing), False)
+
+    def test_002_snapshot(self):
+        db = SqliteDatabase()
+        db.connect(dbname = self.fn, readonly = True)
+        copy = os.path.join(self.dir, 'copy.lrcat')
+        self.assertEqual(db.snapshot(copy), True)
+        self.assertEqual(db.snapshot(copy), False)
+        other = SqliteDatabase()
+        other.connect(dbname = copy, readonly = True, immutable = True)
+        sql = "select * from Adobe_variablesTable order by id_local"
+        self.assertEqual(other.query(sql), db.query(sql))
+        other.close()
+        # The copy made while holding a read lock, used by older SQLite.
+        locked = os.path.join(self.dir, 'locked.lrcat')
+        db._copy_locked(locked)
+        other.connect(dbname = locked)
+        self.assertEqual(other.query(sql), db.query(sql))
+        other.close()
+        db.close()
+
+    def test_003_catalog(self):
+        c = Catalog(self.fn, snapshot = True)
+        self.assertEqual(c.is_connected, True)
+        self.assertEqual(c.filename, self.fn)
+        self.assertEqual(c.version, '0300025')
+        copy = c._snapshot_dir
+        self.assertEqual(os.path.isdir(copy), True)
+        src = c.open_source()
+        self.assertEqual(src.readonly, True)
+        self.assertEqual(src.query("select count(*) from AgLibraryFolder"),
+                                                                      [(0,)])
+        src.close()
+        c.close()
+        self.assertEqual(os.path.exists(copy), False)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from slurpy.catalog import Catalog
+from slurpy.schema.field import DatabaseField, DB_INTEGER
+from slurpy.schema.table import DatabaseTable
+from slurpy.databases.sqlite import SqliteDatabase
+from slurpy.translator import IdTranslator
+
+TEMPLATE_SQL = [
+    "CREATE TABLE Adobe_variablesTable (id_local INTEGER PRIMARY KEY, "
+    "id_global UNIQUE NOT NULL, name, type, value NOT NULL DEFAULT '')",
+    "CREATE TABLE AgLibraryRootFolder (id_local INTEGER PRIMARY KEY, "
+    "id_global UNIQUE NOT NULL, absolutePath UNIQUE NOT NULL DEFAULT '')",
+    "CREATE TABLE AgLibraryFolder (id_local INTEGER PRIMARY KEY, "
+    "id_global UNIQUE NOT NULL, pathFromRoot NOT NULL DEFAULT '', "
+    "rootFolder INTEGER NOT NULL DEFAULT 0)",
+    "CREATE INDEX index_AgLibraryFolder_rootFolder ON AgLibraryFolder"
+    "( rootFolder )",
+    "INSERT INTO Adobe_variablesTable VALUES (1, 'A', "
+    "'Adobe_entityIDCounter', NULL, 3.0)",
+    "INSERT INTO Adobe_variablesTable VALUES (2, 'B', "
+    "'Adobe_DBVersion', NULL, '0300025')",
+]
+
+ROOTS = [(10, 'aaaa-1', '/photos/'), (11, 'bbbb-1', '/other/')]
+FOLDERS = [(20, 'aaaa-2', '2010/', 10), (21, 'aaaa-3', '2011/', 10),
+           (22, 'bbbb-2', 'misc/', 11)]
+
+def _tables():
+    root = DatabaseTable('AgLibraryRootFolder')
+    root.add_field(DatabaseField('id_local', DB_INTEGER, primary_key = True))
+    root.add_field(DatabaseField('id_global', unique = True))
+    root.add_field(DatabaseField('absolutePath', unique = True))
+    folder = DatabaseTable('AgLibraryFolder')
+    folder.add_field(DatabaseField('id_local', DB_INTEGER, primary_key = True))
+    folder.add_field(DatabaseField('id_global', unique = True))
+    folder.add_field(DatabaseField('pathFromRoot'))
+    folder.add_field(DatabaseField('rootFolder', DB_INTEGER))
+    folder.get_field('rootFolder').dependancy = 'AgLibraryRootFolder'
+    return [root, folder]
+
+class TestRestore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        template = SqliteDatabase()
+        template.connect(dbname = os.path.join(self.dir, 'template.lrcat'))
+        for sql in TEMPLATE_SQL:
+            template.execute(sql)
+        template.close()
+        self.catalog = Catalog(os.path.join(self.dir, 'template.lrcat'))
+        self.catalog.tables = _tables()
+        self.catalog._get_ordered_table_list()
+
+        # A "server" holding rows from two catalogs.
+        self.server = SqliteDatabase()
+        self.server.connect(dbname = ':memory:')
+        for sql in TEMPLATE_SQL[1:3]:
+            self.server.execute(sql)
+        self.server.insert_rows('AgLibraryRootFolder',
+                ['id_local', 'id_global', 'absolutePath'], ROOTS, None)
+        self.server.insert_rows('AgLibraryFolder',
+                ['id_local', 'id_global', 'pathFromRoot', 'rootFolder'],
+                                                            FOLDERS, None)
+
+    def tearDown(self):
+        self.catalog.close()
+        self.server.close()
+        shutil.rmtree(self.dir)
+
+    def _open(self, filename):
+        db = SqliteDatabase()
+        db.connect(dbname = filename)
+        return db
+
+    def test_001_all(self):
+        fn = os.path.join(self.dir, 'all.lrcat')
+        self.assertEqual(self.catalog.restore(self.server, fn), True)
+        db = self._open(fn)
+        self.assertEqual(db.query("select * from AgLibraryFolder order by "
+                      "id_local"), [(20, 'AAAA-2', '2010/', 10),
+                       (21, 'AAAA-3', '2011/', 10), (22, 'BBBB-2', 'misc/', 11)])
+        self.assertEqual(db.query("select value from Adobe_variablesTable "
+                         "where name='Adobe_entityIDCounter'"), [(22.0,)])
+        self.assertEqual(db.query("select name from sqlite_master where "
+                                   "type='index' and sql is not null"),
+                               [('index_AgLibraryFolder_rootFolder',)])
+        db.close()
+        # Never overwrites an existing file.
+        self.assertEqual(self.catalog.restore(self.server, fn), False)
+
+    def test_002_translated(self):
+        ids = IdTranslator()
+        ids.set_value('AgLibraryRootFolder', 1, 10)
+        ids.set_value('AgLibraryFolder', 1, 20)
+        ids.set_value('AgLibraryFolder', 2, 21)
+        store = SqliteDatabase()
+        store.connect(dbname = ':memory:')
+        self.assertEqual(ids.save(store, 'host', 'cat'), True)
+
+        fn = os.path.join(self.dir, 'cat.lrcat')
+        self.assertEqual(self.catalog.restore(self.server, fn, store,
+                                                 ('host', 'cat')), True)
+        db = self._open(fn)
+        self.assertEqual(db.query("select * from AgLibraryRootFolder"),
+                                                 [(1, 'AAAA-1', '/photos/')])
+        self.assertEqual(db.query("select * from AgLibraryFolder order by "
+                      "id_local"), [(1, 'AAAA-2', '2010/', 1),
+                                    (2, 'AAAA-3', '2011/', 1)])
+        self.assertEqual(db.query("select value from Adobe_variablesTable "
+                         "where name='Adobe_entityIDCounter'"), [(3.0,)])
+        db.close()
+
+    def test_003_internal_tables(self):
+        ''' Tables made by SQLite itself are not copied into the schema. '''
+        template = self._open(self.catalog.filename)
+        template.execute("CREATE TABLE counter (id_local INTEGER PRIMARY "
+                         "KEY AUTOINCREMENT, name)")
+        template.execute("INSERT INTO counter (name) VALUES ('a')")
+        template.execute("ANALYZE")
+        template.close()
+        self.assertEqual([sql for sql in self.catalog.schema_statements()
+                                                    if 'sqlite_' in sql], [])
+        fn = os.path.join(self.dir, 'all.lrcat')
+        self.assertEqual(self.catalog.restore(self.server, fn), True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import sys
+import unittest
+
+from slurpy.schema.field import DatabaseField
+from slurpy.schema.table import DatabaseTable
+from slurpy.scheduler import TableScheduler
+from slurpy.translator import IdTranslator
+
+class _Catalog(object):
+    ''' Just enough of a Catalog for the scheduler. '''
+    LOCKED_TABLES = ['Root']
+    has_blobs = False
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.ordered_table_list = [t.name for t in tables]
+
+    def open_source(self):
+        return _Source()
+
+    def get_table(self, name):
+        for t in self.tables:
+            if t.name == name:
+                return t
+        return None
+
+class _Source(object):
+    def close(self):
+        pass
+
+class _Db(object):
+    ''' Records what each worker does in a list shared between them. '''
+    def __init__(self, log):
+        self.log = log
+
+    def start_transaction(self):
+        pass
+
+    def lock_table(self, name):
+        self.log.append(('lock', name))
+        return True
+
+    def commit(self):
+        self.log.append(('commit', self.name))
+
+    def rollback(self):
+        self.log.append(('rollback', self.name))
+
+def _mover(tbl, fail):
+    def move_data(ids, src, db, bulk, blobs = None):
+        db.name = tbl.name
+        db.log.append(('move', tbl.name))
+        return tbl.name not in fail
+    return move_data
+
+def _table(name, links):
+    tbl = DatabaseTable(name)
+    tbl.add_field(DatabaseField('id_local'))
+    for l in links:
+        fld = DatabaseField(l.lower())
+        fld.dependancy = l
+        tbl.add_field(fld)
+    return tbl
+
+class TestScheduler(unittest.TestCase):
+    def test_001_graph(self):
+        c = _Catalog([_table('Root', []), _table('Folder', ['root']),
+                      _table('File', ['Folder', 'File']),
+                      _table('Image', ['File', 'Unknown'])])
+        sched = TableScheduler(c, IdTranslator())
+        self.assertEqual(sched.deps['Root'], set())
+        self.assertEqual(sched.deps['Folder'], set(['Root']))
+        self.assertEqual(sched.deps['File'], set(['Folder']))
+        self.assertEqual(sched.deps['Image'], set(['File']))
+
+    def _run(self, c, fail = []):
+        log = []
+        for t in c.tables:
+            t.move_data = _mover(t, fail)
+        sched = TableScheduler(c, IdTranslator(), 2)
+        ok = sched.run([_Db(log), _Db(log)], verbose = False)
+        return ok, sched, log
+
+    def test_002_run(self):
+        c = _Catalog([_table('Root', []), _table('Folder', ['Root']),
+                      _table('Other', []), _table('File', ['Folder', 'Other'])])
+        ok, sched, log = self._run(c)
+        self.assertEqual(ok, True)
+        self.assertEqual(sched.results, dict([(n, True) for n in
+                                              c.ordered_table_list]))
+        # Each table is moved once the tables it links to are committed.
+        for name, deps in sched.deps.items():
+            for d in deps:
+                self.assert_(log.index(('commit', d)) <
+                             log.index(('move', name)))
+        self.assert_(log.index(('lock', 'Root')) <
+                     log.index(('move', 'Root')))
+        self.assertEqual([e for e in log if e[0] == 'lock'], [('lock', 'Root')])
+
+    def test_003_failure(self):
+        c = _Catalog([_table('Root', []), _table('Folder', ['Root']),
+                      _table('File', ['Folder'])])
+        ok, sched, log = self._run(c, ['Folder'])
+        self.assertEqual(ok, False)
+        self.assertEqual(sched.results, {'Root': True, 'Folder': False})
+        self.assert_(('rollback', 'Folder') in log)
+        self.assert_(('move', 'File') not in log)
+
+    def test_004_cycle(self):
+        c = _Catalog([_table('Root', []), _table('A', ['B']),
+                      _table('B', ['A'])])
+        ok, sched, log = self._run(c)
+        self.assertEqual(ok, True)
+        self.assertEqual(sorted(sched.results), ['A', 'B', 'Root'])
+        # The cycle is broken by taking the tables in the serial order.
+        self.assert_(log.index(('commit', 'A')) < log.index(('move', 'B')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from slurpy.catalog import Catalog
+from slurpy.snapshot import SnapshotWriter, SnapshotReader, encode_row, \
+                            decode_rows
+from slurpy.databases.sqlite import SqliteDatabase
+from restore_test import TEMPLATE_SQL, ROOTS, FOLDERS, _tables
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dir, 'catalog.lrcat')
+        src = SqliteDatabase()
+        src.connect(dbname = self.fn)
+        for sql in TEMPLATE_SQL:
+            src.execute(sql)
+        src.insert_rows('AgLibraryRootFolder',
+                ['id_local', 'id_global', 'absolutePath'], ROOTS, None)
+        src.insert_rows('AgLibraryFolder',
+                ['id_local', 'id_global', 'pathFromRoot', 'rootFolder'],
+                                                            FOLDERS, None)
+        src.close()
+        self.catalog = self._open()
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.dir)
+
+    def _open(self):
+        c = Catalog(self.fn)
+        c.tables = _tables()
+        c._get_ordered_table_list()
+        return c
+
+    def _write(self, name):
+        dirname = os.path.join(self.dir, name)
+        SnapshotWriter(self.catalog, chunk_rows = 2).write(dirname)
+        return dirname
+
+    def test_001_encode(self):
+        row = [None, 1, -2 ** 40, 1.5, u'caf\xe9', buffer('\x00\x01')]
+        rows = list(decode_rows(encode_row(row) * 2, len(row)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0][:5], row[:5])
+        self.assertEqual(str(rows[0][5]), '\x00\x01')
+
+    def test_002_write(self):
+        dirname = self._write('snap')
+        reader = SnapshotReader(dirname)
+        entry = reader.tables['AgLibraryFolder']
+        self.assertEqual((entry['rows'], len(entry['chunks'])), (3, 2))
+        self.assertEqual([tuple(r) for r in reader.iter_rows(
+                                          'AgLibraryFolder')], FOLDERS)
+        self.assertEqual(reader.check(), [])
+        # Never written over.
+        self.assertEqual(SnapshotWriter(self.catalog).write(dirname), None)
+
+        with open(os.path.join(dirname, entry['file']), 'r+b') as fh:
+            fh.seek(10)
+            fh.write('XX')
+        self.assertEqual(reader.check(), ['AgLibraryFolder'])
+
+    def test_003_diff(self):
+        first = SnapshotReader(self._write('first'))
+        self.catalog._catalog.execute("update AgLibraryFolder set "
+                                      "pathFromRoot='x/' where id_local=22")
+        second = SnapshotReader(self._write('second'))
+        self.assertEqual(first.diff(second), {'AgLibraryFolder': [1]})
+
+    def test_004_restore(self):
+        reader = SnapshotReader(self._write('snap'))
+        fn = os.path.join(self.dir, 'restored.lrcat')
+        self.assertEqual(reader.restore(fn), True)
+        self.assertEqual(reader.restore(fn), False)
+        db = SqliteDatabase()
+        db.connect(dbname = fn)
+        self.assertEqual(db.query("select * from AgLibraryFolder order by "
+                                  "id_local"), FOLDERS)
+        self.assertEqual(db.query("select name from sqlite_master where "
+                                  "type='index' and sql is not null"),
+                                 [('index_AgLibraryFolder_rootFolder',)])
+        db.close()
+
+if __name__ == '__main__':
+    unittest.main()
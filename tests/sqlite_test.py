@@ -3,6 +3,8 @@ import sys
 import unittest
 
 from slurpy.databases.sqlite import SqliteDatabase
+from slurpy.schema.field import DatabaseField, DB_INTEGER
+from slurpy.schema.table import DatabaseTable
 
 testDir = os.path.dirname(__file__)
 
@@ -24,3 +26,73 @@ class TestDB(unittest.TestCase):
         self.assertNotEqual(self.db, None)
         self.assertEqual(self.db.connect(dbname = ':memory:'), True)
                 
+
+    def test_003_iter_query(self):
+        self.assertEqual(self.db.connect(dbname = ':memory:'), True)
+        self.assertEqual(self.db.execute("create table t (a integer)"), True)
+        self.assertEqual(self.db.insert_rows('t', ['a'],
+                                       [[n] for n in range(25)], None), [])
+        rows = self.db.iter_query("select a from t where a >= ? order by a",
+                                                              [5], size = 4)
+        self.assertEqual([r[0] for r in rows], range(5, 25))
+        self.assertEqual(list(self.db.iter_query("select a from t where a < 0")), [])
+        self.assertRaises(ValueError, self.db.iter_query, "select a from t where a=?")
+
+    def test_004_commit_policy(self):
+        fn = os.path.join(testDir, 'tests.db')
+        if os.path.exists(fn):
+            os.unlink(fn)
+        self.assertRaises(ValueError, self.db.set_commit_policy, 'never')
+        self.assertEqual(self.db.connect(dbname = fn, commit_policy = 'rows',
+                                         commit_rows = '3'), True)
+        self.assertEqual(self.db.commit_rows, 3)
+        other = SqliteDatabase()
+        self.assertEqual(other.connect(dbname = fn), True)
+        self.db.execute("create table t (a integer)")
+        count = lambda: other.query("select count(*) from t")[0][0]
+
+        self.db.start_transaction()
+        for n in range(5):
+            self.db.insert_row('t', ['a'], [n])
+            self.db.row_written()
+        self.assertEqual(count(), 3)
+        self.db.table_finished()
+        self.assertEqual(count(), 5)
+
+        self.db.set_commit_policy('table')
+        self.db.insert_row('t', ['a'], [5])
+        self.db.row_written(10)
+        self.assertEqual(count(), 5)
+        self.db.table_finished()
+        self.assertEqual(count(), 6)
+
+        self.db.set_commit_policy('import')
+        self.db.insert_row('t', ['a'], [6])
+        self.db.table_finished()
+        self.assertEqual(count(), 6)
+        self.db.commit()
+        self.assertEqual(count(), 7)
+        other.close()
+        self.db.close()
+        os.unlink(fn)
+
+    def test_005_create(self):
+        t = DatabaseTable('folder')
+        t.add_field(DatabaseField('id_local', DB_INTEGER, primary_key = True))
+        t.add_field(DatabaseField('id_global', unique = True, null = False))
+        t.add_field(DatabaseField('path'))
+        t.add_field(DatabaseField('root', DB_INTEGER))
+        t.add_index({'name': 'idx', 'columns': ['path', 'root']})
+        self.assertEqual(self.db.connect(dbname = ':memory:'), True)
+        for deferred in [False, True]:
+            self.assertEqual(self.db.create(t, True, deferred), True)
+            self.assertEqual(t.insert(self.db, [None, 'a', 'p', 1]), 1)
+            self.assertEqual(t.insert(self.db, [None, 'a', 'p', 1]) is None,
+                                                             not deferred)
+            if deferred:
+                self.assertEqual(self.db.add_constraints(t), False)
+                self.db.execute("delete from folder where id_local=2")
+                self.assertEqual(self.db.add_constraints(t), True)
+                self.assertEqual(self.db.add_constraints(t, True), True)
+                self.assertEqual(t.insert(self.db, [None, 'a', 'q', 1]), None)
+        self.assertEqual(t.insert(self.db, [None, None, 'q', 1]), None)
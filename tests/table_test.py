@@ -0,0 +1,133 @@
+import os
+import sys
+import unittest
+
+from slurpy.databases.sqlite import SqliteDatabase
+from slurpy.metrics import TableMetrics
+from slurpy.fingerprint import Fingerprints
+from slurpy.profiler import QueryProfiler
+from slurpy.schema.field import DatabaseField, DB_INTEGER
+from slurpy.schema.table import DatabaseTable
+from slurpy.translator import IdTranslator
+
+COLUMNS = ['id_local', 'id_global', 'pathFromRoot', 'rootFolder']
+
+def _folder():
+    t = DatabaseTable('folder')
+    t.add_field(DatabaseField('id_local', DB_INTEGER, primary_key = True))
+    t.add_field(DatabaseField('id_global', unique = True))
+    t.add_field(DatabaseField('pathFromRoot'))
+    t.add_field(DatabaseField('rootFolder', DB_INTEGER))
+    t.add_index({'name': 'idx', 'columns': ['pathFromRoot', 'rootFolder']})
+    return t
+
+class TestTable(unittest.TestCase):
+    def setUp(self):
+        self.tbl = _folder()
+        self.src = SqliteDatabase()
+        self.src.connect(dbname = ':memory:')
+        # A catalog has no unique constraint on the path.
+        self.src.execute("create table folder (id_local integer primary "
+                         "key, id_global, pathFromRoot, rootFolder)")
+        self.db = SqliteDatabase()
+        self.db.connect(dbname = ':memory:')
+        self.db.create(self.tbl)
+
+    def tearDown(self):
+        self.src.close()
+        self.db.close()
+
+    def _rows(self):
+        return self.db.query("select * from folder order by id_local")
+
+    def test_001_batch_duplicates(self):
+        self.src.insert_rows('folder', COLUMNS, [
+            (1, 'A', 'a/', 1), (2, 'B', 'b/', 1),
+            # Same path as 1, so it updates the row inserted for 1.
+            (3, 'C', 'a/', 1),
+            # Already on the server, found using the staging table.
+            (4, 'D', 'x/', 1),
+            # Same id_global, in the same batch.
+            (5, 'E', 'e/', 1), (6, 'E', 'f/', 1)], None)
+        self.db.insert_row('folder', COLUMNS, [50, 'D', 'd/', 1])
+        ids = IdTranslator()
+        m = TableMetrics('folder')
+        self.assertEqual(self.tbl.move_data(ids, self.src, self.db, True,
+                                            batch_size = 10, metrics = m), True)
+        self.assertEqual((m.inserted, m.deduplicated, m.updated), (3, 3, 0))
+        self.assertEqual(self._rows(), [(50, 'D', 'x/', 1), (51, 'C', 'a/', 1),
+                                        (52, 'B', 'b/', 1), (53, 'E', 'f/', 1)])
+        self.assertEqual([ids.get_value('folder', n) for n in xrange(1, 7)],
+                         [51, 52, 51, 50, 53, 53])
+        # A second import finds them all by id, and updates them together.
+        m = TableMetrics('folder')
+        profiler = QueryProfiler()
+        self.db.set_tracer(profiler)
+        self.assertEqual(self.tbl.move_data(ids, self.src, self.db, True,
+                                            batch_size = 10, metrics = m), True)
+        self.assertEqual((m.inserted, m.updated), (0, 6))
+        self.assertEqual([st.calls for st in profiler.stats.values()
+                          if st.sql.startswith('UPDATE')], [1])
+        self.assertEqual(len(self._rows()), 4)
+
+    def test_002_fingerprints(self):
+        ''' Identical rows of a table without id_local are kept apart. '''
+        t = DatabaseTable('keyword')
+        t.add_field(DatabaseField('image', DB_INTEGER))
+        t.add_field(DatabaseField('tag', DB_INTEGER))
+        for db in [self.src, self.db]:
+            db.create(t)
+        self.src.insert_rows('keyword', ['image', 'tag'],
+                             [(1, 2), (1, 2), (1, 3)], None)
+        for bulk in [False, True]:
+            self.db.execute("delete from keyword")
+            prints = Fingerprints()
+            m = TableMetrics('keyword')
+            self.assertEqual(t.move_data(IdTranslator(), self.src, self.db,
+                                bulk, prints = prints, metrics = m), True)
+            self.assertEqual((m.inserted, m.skipped), (3, 0))
+            prints.finish_table('keyword')
+            prints.save(self.db, 'host', 'cat')
+
+            prints = Fingerprints()
+            prints.load(self.db, 'host', 'cat')
+            m = TableMetrics('keyword')
+            self.assertEqual(t.move_data(IdTranslator(), self.src, self.db,
+                                bulk, prints = prints, metrics = m), True)
+            self.assertEqual((m.inserted, m.skipped), (0, 3))
+            self.assertEqual(self.db.query("select count(*) from keyword"),
+                                                                     [(3,)])
+
+    def test_003_dedupe_batch(self):
+        rows = [[1, 'A', 'a/', 1], [2, 'B', 'a/', 2], [3, 'B', 'c/', 1],
+                [4, None, 'c/', 1], [5, None, 'd/', None], [6, None, 'd/', None]]
+        self.assertEqual(self.tbl.dedupe_batch(rows), [-1, -1, 1, 1, -1, -1])
+
+    def test_004_unique_column(self):
+        ''' Columns declared UNIQUE are matched on, alone or for a host. '''
+        t = DatabaseTable('root')
+        t.add_field(DatabaseField('id_local', DB_INTEGER, primary_key = True))
+        t.add_field(DatabaseField('id_global', unique = True))
+        t.add_field(DatabaseField('absolutePath', unique = True))
+        self.assertEqual(t._unique_keys(), [['id_global'], ['absolutePath']])
+        self.db.create(t)
+        self.db.insert_row('root', ['id_local', 'id_global', 'absolutePath'],
+                           [7, 'A', '/p/'])
+        rows = [[1, 'B', '/p/'], [2, 'C', '/q/']]
+        self.assertEqual(t.check_unique(rows[0], self.db, -1), 7)
+        self.assertEqual(t.create_stage(self.db), True)
+        self.assertEqual(t.check_unique_batch(rows, self.db, [-1, -1]),
+                         [7, -1])
+
+        t.add_host_key('host')
+        self.assertEqual(t._unique_keys(), [['absolutePath', 'slurpy_host'],
+                                            ['id_global']])
+        self.db.execute("drop table root")
+        self.db.create(t)
+        self.db.insert_row('root', ['id_local', 'id_global', 'absolutePath',
+                           'slurpy_host'], [7, 'A', '/p/', 'other'])
+        self.assertEqual(t.check_unique(rows[0] + ['host'], self.db, -1), -1)
+        self.assertEqual(t.check_unique(rows[0] + ['other'], self.db, -1), 7)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import sys
+import unittest
+
+from slurpy.schema.tokenizer import *
+from files.parser_tests import *
+
+class TestTokenizer(unittest.TestCase):
+    def test_001_columns(self):
+        tests = [
+            [ 'abc123', { 'identifier': 'abc123' }],
+            [ 'abc123 integer', { 'identifier': 'abc123',
+                                  'type': 'INTEGER'}],
+            [ 'abc123 varchar (20)', { 'identifier': 'abc123',
+                                       'type': 'VARCHAR',
+                                       'size': ['20']}],
+            [ 'abc123 varchar (20, 40)', { 'identifier': 'abc123',
+                                       'type': 'VARCHAR',
+                                       'size': ['20','40']}],
+            [ 'abc123 integer primary key',
+                                     { 'identifier': 'abc123',
+                                       'type': 'INTEGER',
+                                       'pkey': ['PRIMARY KEY']}],
+            [ 'abc123 integer primary key asc autoincrement',
+                                     { 'identifier': 'abc123',
+                                       'type': 'INTEGER',
+                                       'pkey': ['PRIMARY KEY','ASC','AUTOINCREMENT']}],
+            [ 'abc123 integer primary key not null',
+                                     { 'identifier': 'abc123',
+                                       'type': 'INTEGER',
+                                       'pkey': ['PRIMARY KEY'],
+                                       'null': ['NOT', 'NULL']}],
+            [ 'abc123 integer not null default -1',
+                                     { 'identifier': 'abc123',
+                                       'type': 'INTEGER',
+                                       'null': ['NOT', 'NULL'],
+                                       'default': ['DEFAULT', '-1']}],
+            [ "abc123 text default 'it''s'",
+                                     { 'identifier': 'abc123',
+                                       'type': 'TEXT',
+                                       'default': ['DEFAULT', "it's"]}],
+        ]
+        for t in tests:
+            _ck = parse_column_statement(t[0])
+            self.assertNotEqual(_ck, {})
+            for k,v in t[1].items():
+                self.assertEqual(_ck.has_key(k), True)
+                self.assertEqual(_ck[k], v)
+
+    def test_002_tables(self):
+        tests = [
+            [ "create table simple (id integer autoincrement)", 1],
+            [ "CREATE TEMP TABLE simple (id integer)", 1],
+            [ "CREATE TEMPORARY TABLE if not exists simple (id integer, blah text)", 2],
+            [ "CREATE TABLE simple (id integer, name varchar(20, 40), "
+              "blah text default 'a, b', UNIQUE (id, name))", 3],
+        ]
+        for t in tests:
+            _ck = parse_table_statement(t[0])
+            self.assertNotEqual(_ck, {})
+            self.assertEqual(_ck['identifier'], 'simple')
+            self.assertEqual(len(_ck['columns']), t[1])
+        _ck = parse_table_statement(tests[3][0])
+        self.assertEqual(_ck['columns'][1]['size'], ['20', '40'])
+        self.assertEqual(_ck['columns'][2]['default'], ['DEFAULT', 'a, b'])
+        self.assertEqual(parse_table_statement("select * from simple"), {})
+
+    def test_003_indexes(self):
+        for t in index_tests:
+            _ck = parse_index_statement(t[0])
+            self.assertEqual(_ck['name'], t[1])
+            self.assertEqual(len(_ck['columns']), t[2])
+            self.assertEqual(_ck.has_key('unique'), t[3])
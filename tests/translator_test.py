@@ -2,6 +2,7 @@ import sys
 import unittest
 
 from slurpy.translator import IdTranslator
+from slurpy.databases.sqlite import SqliteDatabase
 
 class TestLookup(unittest.TestCase):
 
@@ -32,7 +33,94 @@ class TestLookup(unittest.TestCase):
      
     def test_002_none(self):
         self.assertEqual(self.translator.get_value('abc', None), None)
-        
+
+    def test_003_store(self):
+        db = SqliteDatabase()
+        self.assertEqual(db.connect(dbname = ':memory:'), True)
+        vals = [ ['abc', 1, 10], ['abc', 2, 0], ['Cba', 2, 20] ]
+        for v in vals:
+            self.translator.set_value(v[0], v[1], v[2])
+        self.assertEqual(self.translator.save(db, 'host', 'cat1'), True)
+        self.assertEqual(self.translator.save(db, 'host', 'cat2'), True)
+        self.assertEqual(self.translator.save(db, 'host', 'cat1'), True)
+
+        ids = IdTranslator(compact = self.translator.compact)
+        self.assertEqual(ids.load(db, 'host', 'cat1'), len(vals))
+        for v in vals:
+            self.assertEqual(ids.get_value(v[0], v[1]), v[2])
+        self.assertEqual(IdTranslator().load(db, 'host', 'cat3'), 0)
+
+        # Only changed translations are written once loaded.
+        ids.set_value('abc', 2, 30)
+        ids.set_value('abc', 3, 40)
+        self.assertEqual(ids.save(db, 'host', 'cat1'), True)
+        ids = IdTranslator()
+        self.assertEqual(ids.load(db, 'host', 'cat1'), len(vals) + 1)
+        self.assertEqual(ids.get_value('abc', 1), 10)
+        self.assertEqual(ids.get_value('abc', 2), 30)
+        self.assertEqual(ids.get_value('abc', 3), 40)
+        self.assertEqual(db.close(), True)
+
+    def test_004_reverse(self):
+        vals = [ ['abc', 3, 30], ['abc', 1, 10], ['abc', 2, 0], ['Cba', 2, 20] ]
+        for v in vals:
+            self.translator.set_value(v[0], v[1], v[2])
+        rev = self.translator.reverse()
+        self.assertEqual(rev.get_value('abc', 30), 3)
+        self.assertEqual(rev.get_value('abc', 10), 1)
+        self.assertEqual(rev.get_value('abc', 0), -1)
+        self.assertEqual(rev.get_value('cba', 20), 2)
+        self.assertEqual(rev.get_value('abc', 3), -1)
+        self.assertEqual(rev.collisions, {})
+
+    def test_008_reverse_collisions(self):
+        for k, v in [(1, 10), (3, 10), (2, 10), (4, 11)]:
+            self.translator.set_value('abc', k, v)
+        rev = self.translator.reverse()
+        self.assertEqual(rev.get_value('abc', 10), 1)
+        self.assertEqual(rev.get_value('abc', 11), 4)
+        self.assertEqual(rev.collisions, {'abc': {10: [1, 2, 3]}})
+
+class TestCompactLookup(TestLookup):
+
+    def setUp(self):
+        self.translator = IdTranslator(compact = True)
+
+    def test_005_ordering(self):
+        keys = [5, 6, 7, 9, 1, 3, 2, 8]
+        for k in keys:
+            self.translator.set_value('abc', k, k * 10)
+        for k in keys:
+            self.assertEqual(self.translator.get_value('abc', k), k * 10)
+            self.assertEqual(self.translator.get_value('ABC', str(k)), k * 10)
+        self.assertEqual(self.translator.get_value('abc', 4), -1)
+        self.assertEqual(self.translator.get_value('abc', 10), -1)
+        self.translator.set_value('abc', 6, 0)
+        self.assertEqual(self.translator.get_value('abc', 6), 0)
+
+    def test_006_other_keys(self):
+        self.translator.set_value('abc', 'xyz', 1)
+        self.translator.set_value('abc', '007', 2)
+        self.translator.set_value('abc', 7, None)
+        self.assertEqual(self.translator.get_value('abc', 'xyz'), 1)
+        self.assertEqual(self.translator.get_value('abc', '007'), 2)
+        self.assertEqual(self.translator.get_value('abc', 7), None)
+        self.assertEqual(self.translator.get_value('abc', '7'), None)
+
+    def test_007_overflow(self):
+        big = 2 ** 70
+        self.translator.set_value('abc', 1, 10)
+        self.translator.set_value('abc', 2, big)
+        self.translator.set_value('abc', 3, 30)
+        self.translator.set_value('abc', big, 40)
+        self.translator.set_value('abc', 1, -big)
+        self.assertEqual([self.translator.get_value('abc', k)
+                          for k in [1, 2, 3, big]], [-big, big, 30, 40])
+        t = self.translator.get_translator('abc')
+        self.assertEqual(len(t.ids), len(t.vals))
+        self.assertEqual(sorted(t.items()), sorted([('1', -big), ('2', big),
+                                                    ('3', 30), (str(big), 40)]))
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from slurpy.catalog import Catalog
+from slurpy.databases.sqlite import SqliteDatabase
+from restore_test import TEMPLATE_SQL, ROOTS, FOLDERS, _tables
+
+class TestVerify(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fn = os.path.join(self.dir, 'catalog.lrcat')
+        src = SqliteDatabase()
+        src.connect(dbname = fn)
+        for sql in TEMPLATE_SQL:
+            src.execute(sql)
+        self._fill(src)
+        src.close()
+        self.catalog = Catalog(fn)
+        self.catalog.tables = _tables()
+        self.catalog._get_ordered_table_list()
+        self.server = SqliteDatabase()
+        self.server.connect(dbname = ':memory:')
+        self.catalog.create_database(self.server)
+
+    def tearDown(self):
+        self.catalog.close()
+        self.server.close()
+        shutil.rmtree(self.dir)
+
+    def _fill(self, db):
+        db.insert_rows('AgLibraryRootFolder',
+                ['id_local', 'id_global', 'absolutePath'], ROOTS, None)
+        db.insert_rows('AgLibraryFolder',
+                ['id_local', 'id_global', 'pathFromRoot', 'rootFolder'],
+                                                            FOLDERS, None)
+
+    def _diff(self, verifier, name):
+        return [d for d in verifier.results if d.table == name][0]
+
+    def test_001_same_ids(self):
+        self._fill(self.server)
+        self.assertEqual(self.catalog.compare_tables(self.server), True)
+        self.server.execute("update AgLibraryFolder set pathFromRoot='x/' "
+                            "where id_local=21")
+        self.server.execute("delete from AgLibraryFolder where id_local=22")
+        self.server.execute("insert into AgLibraryFolder values (30, "
+                            "'cccc-1', 'new/', 10)")
+        verifier = self.catalog.verify(self.server)
+        self.assertEqual(verifier.ok, False)
+        diff = self._diff(verifier, 'AgLibraryFolder')
+        self.assertEqual((diff.rows, diff.server_rows, diff.matched),
+                                                                   (3, 3, 1))
+        self.assertEqual(diff.examples, {'missing': [22], 'extra': [30],
+                                         'changed': [21]})
+        self.assertEqual(self._diff(verifier, 'AgLibraryRootFolder').ok,
+                                                                      True)
+
+    def test_002_translated(self):
+        self.assertEqual(self.catalog.import_all(self.server,
+                                                 store = self.server), True)
+        self.assertEqual(self.catalog.compare_tables(self.server,
+                                                     self.server), True)
+        self.catalog._catalog.execute("delete from AgLibraryFolder where "
+                                      "id_local=22")
+        self.server.execute("update AgLibraryFolder set pathFromRoot='x/' "
+                            "where pathFromRoot='2010/'")
+        verifier = self.catalog.verify(self.server, self.server)
+        diff = self._diff(verifier, 'AgLibraryFolder')
+        self.assertEqual((diff.rows, diff.matched, diff.missing),
+                                                               (2, 1, 0))
+        self.assertEqual(diff.examples['changed'], [20])
+        self.assertEqual(diff.examples['extra'], [22])
+
+if __name__ == '__main__':
+    unittest.main()